@@ -0,0 +1,81 @@
+"""Microbenchmark del parser de comandos frente a la versión anterior.
+
+Uso (desde la raíz del repo, con las variables de entorno de la app):
+
+    python -m benchmarks.bench_commands
+"""
+from __future__ import annotations
+
+import timeit
+
+from src.teams_gw.commands import CommandParser
+from src.teams_gw.settings import settings
+
+MESSAGES = [
+    "dt: facturas pendientes de pago (cliente,fecha,monto,total)",
+    "dt[odoo]: top 10 clientes por ventas",
+    "dt[odoo]!: ventas de hoy",
+    "consulta órdenes de compra abiertas",
+    "n2sql: inventario por almacén",
+    "hola, ¿qué puedes hacer?",
+    "faq",
+]
+
+
+def legacy_parse(text: str):
+    """Réplica de ``_matches_trigger`` + ``_extract_query_and_dataset`` previos."""
+    t = text.strip()
+    low = t.lower()
+    bases = [p.lower().rstrip(":").strip() for p in settings.triggers]
+    matched = any(low.startswith(p.lower()) for p in settings.triggers)
+    if not matched:
+        colon = low.find(":")
+        if colon != -1:
+            matched = low[:colon].split("[", 1)[0].rstrip("!") in bases
+    if not matched:
+        return None
+    colon = t.find(":")
+    if colon != -1:
+        header = t[:colon].strip()
+        query = t[colon + 1:].strip()
+        fresh = header.endswith("!")
+        header = header.rstrip("!").rstrip()
+        if header.split("[", 1)[0].lower() in bases:
+            ds = None
+            lb, rb = header.find("["), header.find("]")
+            if lb != -1 and rb != -1 and rb > lb + 1:
+                ds = header[lb + 1:rb].strip()
+            return query, ds, fresh
+    for prefix in settings.triggers:
+        if low.startswith(prefix.lower()):
+            return t[len(prefix):].strip(), None, False
+    return t, None, False
+
+
+def main(number: int = 20000) -> None:
+    parser = CommandParser(settings.triggers)
+    for text in MESSAGES:
+        new = parser.parse(text)
+        old = legacy_parse(text)
+        assert (new is None) == (old is None), text
+        if new is not None:
+            assert (new.query, new.dataset, new.fresh) == old, text
+
+    def run_legacy() -> None:
+        for text in MESSAGES:
+            legacy_parse(text)
+
+    def run_compiled() -> None:
+        for text in MESSAGES:
+            parser.parse(text)
+
+    legacy = min(timeit.repeat(run_legacy, number=number, repeat=5))
+    compiled = min(timeit.repeat(run_compiled, number=number, repeat=5))
+    per_msg = number * len(MESSAGES)
+    print(f"legacy:   {legacy / per_msg * 1e6:.2f} µs/mensaje")
+    print(f"compiled: {compiled / per_msg * 1e6:.2f} µs/mensaje")
+    print(f"speedup:  {legacy / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
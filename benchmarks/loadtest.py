@@ -0,0 +1,270 @@
+"""Prueba de carga de punta a punta del gateway.
+
+Levanta un N2SQL falso y un Bot Connector falso en este proceso. El gateway
+corre en un subproceso uvicorn con ``AUTH_DISABLED=true`` y apunta a esos
+stubs. Luego envía a ``/api/messages`` una mezcla de triggers, clics de FAQ
+y "Ver más" con la concurrencia pedida. Al final reporta throughput,
+p50/p95/p99 por tipo de petición y el crecimiento de memoria (RSS) del
+gateway.
+
+Uso (desde la raíz del repo):
+
+    python -m benchmarks.loadtest --duration 30 --concurrency 20
+    python -m benchmarks.loadtest --mix trigger=5,faq=3,more=2 --n2sql-latency-ms 800 \\
+        --env ASYNC_REPLIES=true --json loadtest.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .stubs import StubServer, connector_stub, free_port, n2sql_stub
+
+QUERIES = [
+    ("odoo", "facturas pendientes de pago (cliente,fecha,monto,total)"),
+    ("odoo", "top 10 clientes por ventas del mes"),
+    ("crm", "oportunidades abiertas por etapa"),
+    (None, "inventario por almacén"),
+]
+FAQ_QUERIES = [
+    "facturas pendientes de pago (cliente,fecha,monto,total)",
+    "ventas del día por vendedor",
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"trigger", "faq", "more"}
+    if unknown:
+        raise SystemExit(f"Tipos desconocidos en --mix: {sorted(unknown)}")
+    return mix
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class VirtualUser:
+    """Un usuario en su propia conversación; "Ver más" solo tras una consulta."""
+
+    def __init__(self, index: int, service_url: str) -> None:
+        self.user_id = f"29:loadtest-user-{index}"
+        self.conversation_id = f"a:loadtest-conv-{index}"
+        self.service_url = service_url
+        self.last_query: Optional[str] = None
+
+    def activity(self, kind: str) -> Dict[str, Any]:
+        body: Dict[str, Any] = {
+            "type": "message",
+            "id": uuid.uuid4().hex,
+            "channelId": "msteams",
+            "serviceUrl": self.service_url,
+            "conversation": {"id": self.conversation_id},
+            "from": {"id": self.user_id, "name": "Load Test"},
+            "recipient": {"id": "28:loadtest-bot", "name": "teams_gw"},
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        if kind == "trigger":
+            dataset, query = random.choice(QUERIES)
+            header = f"dt[{dataset}]" if dataset else "dt"
+            body["text"] = f"{header}: {query}"
+            self.last_query = query
+        elif kind == "faq":
+            query = random.choice(FAQ_QUERIES)
+            body["value"] = {"action": "n2sql_faq", "query": query}
+            self.last_query = query
+        else:
+            body["text"] = "ver_mas_filas"
+            body["value"] = {"action": "n2sql_more", "query": self.last_query}
+        return body
+
+
+async def drive(
+    gateway_url: str,
+    service_url: str,
+    duration_s: float,
+    concurrency: int,
+    mix: Dict[str, float],
+) -> Dict[str, Any]:
+    kinds, weights = zip(*mix.items())
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    deadline = time.monotonic() + duration_s
+
+    async def user_loop(user: VirtualUser, client: httpx.AsyncClient) -> None:
+        while time.monotonic() < deadline:
+            kind = random.choices(kinds, weights)[0]
+            if kind == "more" and user.last_query is None:
+                kind = "trigger"
+            started = time.perf_counter()
+            try:
+                resp = await client.post("/api/messages", json=user.activity(kind))
+                ok = resp.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies[kind].append(time.perf_counter() - started)
+            if not ok:
+                errors[kind] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=gateway_url, timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        users = [VirtualUser(i, service_url) for i in range(concurrency)]
+        await asyncio.gather(*(user_loop(u, client) for u in users))
+        elapsed = time.perf_counter() - started
+    return {"elapsed_s": elapsed, "latencies": latencies, "errors": errors}
+
+
+async def sample_memory(pid: int, interval_s: float, samples: List[Dict[str, float]], stop: asyncio.Event) -> None:
+    started = time.monotonic()
+    while not stop.is_set():
+        kb = rss_kb(pid)
+        if kb is not None:
+            samples.append({"t_s": round(time.monotonic() - started, 1), "rss_mb": round(kb / 1024, 1)})
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval_s)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def wait_ready(url: str, proc: subprocess.Popen, timeout_s: float = 30) -> None:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise SystemExit(f"El gateway terminó al arrancar (código {proc.returncode})")
+            try:
+                if (await client.get(f"{url}/__ready")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit("El gateway no respondió /__ready a tiempo")
+
+
+def report(result: Dict[str, Any], memory: List[Dict[str, float]], n2sql: Any, connector: Any) -> Dict[str, Any]:
+    total = sum(len(v) for v in result["latencies"].values())
+    summary: Dict[str, Any] = {
+        "requests": total,
+        "elapsed_s": round(result["elapsed_s"], 2),
+        "throughput_rps": round(total / result["elapsed_s"], 1) if result["elapsed_s"] else 0,
+        "endpoints": {},
+        "n2sql_requests": n2sql.state.requests,
+        "n2sql_requests_with_traceparent": n2sql.state.traced,
+        "connector_replies": sum(connector.state.replies.values()),
+        "memory": memory,
+    }
+    for kind, samples in sorted(result["latencies"].items()):
+        summary["endpoints"][kind] = {
+            "count": len(samples),
+            "errors": result["errors"].get(kind, 0),
+            "p50_ms": round(percentile(samples, 50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 99) * 1000, 1),
+        }
+    if memory:
+        summary["rss_growth_mb"] = round(memory[-1]["rss_mb"] - memory[0]["rss_mb"], 1)
+
+    print(f"\nPeticiones: {total} en {summary['elapsed_s']}s → {summary['throughput_rps']} req/s")
+    print(f"{'tipo':<10}{'n':>8}{'errores':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, row in summary["endpoints"].items():
+        print(f"{kind:<10}{row['count']:>8}{row['errors']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print(f"N2SQL: {summary['n2sql_requests']} consultas · Conector: {summary['connector_replies']} respuestas")
+    if memory:
+        trail = " → ".join(f"{m['rss_mb']}MB@{m['t_s']}s" for m in memory[:: max(len(memory) // 8, 1)])
+        print(f"RSS del gateway: {trail} (crecimiento {summary['rss_growth_mb']} MB)")
+    return summary
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    n2sql_app = n2sql_stub(args.n2sql_latency_ms, args.n2sql_jitter_ms, args.rows, args.columns)
+    connector_app = connector_stub()
+    async with StubServer(n2sql_app) as n2sql, StubServer(connector_app) as connector:
+        port = free_port()
+        gateway_url = f"http://127.0.0.1:{port}"
+        env = dict(
+            os.environ,
+            MICROSOFT_APP_ID="loadtest-bot",
+            MICROSOFT_APP_PASSWORD="loadtest",
+            N2SQL_URL=n2sql.url,
+            AUTH_DISABLED="true",
+            LOG_LEVEL=args.log_level,
+        )
+        for item in args.env:
+            key, _, value = item.partition("=")
+            env[key] = value
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.teams_gw.app:app", "--port", str(port), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            await wait_ready(gateway_url, proc)
+            memory: List[Dict[str, float]] = []
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(sample_memory(proc.pid, args.memory_interval_s, memory, stop))
+            result = await drive(gateway_url, connector.url, args.duration, args.concurrency, parse_mix(args.mix))
+            # Da tiempo a que terminen las respuestas proactivas (ASYNC_REPLIES).
+            await asyncio.sleep(args.settle_s)
+            stop.set()
+            await sampler
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        return report(result, memory, n2sql_app, connector_app)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20, help="segundos de carga")
+    parser.add_argument("--concurrency", type=int, default=10, help="usuarios virtuales simultáneos")
+    parser.add_argument("--mix", default="trigger=6,faq=2,more=2", help="pesos por tipo de petición")
+    parser.add_argument("--n2sql-latency-ms", type=float, default=200)
+    parser.add_argument("--n2sql-jitter-ms", type=float, default=50)
+    parser.add_argument("--rows", type=int, default=200, help="filas por resultado del N2SQL falso")
+    parser.add_argument("--columns", type=int, default=6)
+    parser.add_argument("--memory-interval-s", type=float, default=1.0)
+    parser.add_argument("--settle-s", type=float, default=1.0)
+    parser.add_argument("--log-level", default="WARNING", help="LOG_LEVEL del gateway")
+    parser.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR", help="variables extra del gateway")
+    parser.add_argument("--json", help="guarda el resumen en este archivo")
+    return parser
+
+
+if __name__ == "__main__":
+    cli_args = build_parser().parse_args()
+    summary = asyncio.run(main(cli_args))
+    if cli_args.json:
+        with open(cli_args.json, "w", encoding="utf-8") as out:
+            json.dump(summary, out, indent=2, ensure_ascii=False)
@@ -0,0 +1,233 @@
+"""Microbenchmarks de las rutas calientes del formatter y del bot.
+
+Cubre ``format_n2sql_payload`` con las tres formas de payload (columns+rows,
+rows de dicts y records en ``data``) a 20, 1k y 100k filas, el parser de
+triggers, la tarjeta FAQ y la decodificación de actividades capturadas
+(``benchmarks/payloads``): ``json`` + ``Activity().deserialize`` frente a la
+ruta rápida de ``inbound.InboundActivity``.
+
+Uso (desde la raíz del repo, con las variables de entorno de la app):
+
+    python -m benchmarks.microbench                    # tabla + comparación con el baseline
+    python -m benchmarks.microbench --save-baseline    # regenera benchmarks/baseline.json
+    python -m benchmarks.microbench -k format.dict     # solo los casos que contengan el texto
+
+El baseline depende de la máquina: regenéralo en la misma máquina (o runner
+de CI) donde se ejecuta el modo de regresión
+(``RUN_BENCHMARKS=1 pytest benchmarks``).
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from botbuilder.schema import Activity
+
+from src.teams_gw.commands import command_parser
+from src.teams_gw.faq import DEFAULT_CATALOG_PATH, FaqCatalog, build_faq_card, load_catalog
+from src.teams_gw.formatters import format_n2sql_payload
+from src.teams_gw.inbound import InboundActivity
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+PAYLOADS_DIR = Path(__file__).with_name("payloads")
+SIZES = {"20": 20, "1k": 1_000, "100k": 100_000}
+MESSAGES = [
+    "dt: facturas pendientes de pago (cliente,fecha,monto,total)",
+    "dt[odoo]: top 10 clientes por ventas",
+    "dt[odoo]!: ventas de hoy",
+    "consulta órdenes de compra abiertas",
+    "hola, ¿qué puedes hacer?",
+]
+
+
+class Case(NamedTuple):
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+
+
+def _columns_rows(n: int) -> Dict[str, Any]:
+    return {
+        "columns": ["cliente", "fecha", "monto", "total"],
+        "rows": [[f"Cliente {i}", "2024-01-01", i * 1.5, i * 3] for i in range(n)],
+        "sql": "SELECT cliente, fecha, monto, total FROM facturas",
+    }
+
+
+def _dict_rows(n: int) -> Dict[str, Any]:
+    return {
+        "columns": ["cliente", "fecha", "monto", "total"],
+        "rows": [
+            {"cliente": f"Cliente {i}", "fecha": "2024-01-01", "monto": i * 1.5, "total": i * 3}
+            for i in range(n)
+        ],
+    }
+
+
+def _data_records(n: int) -> Dict[str, Any]:
+    return {"data": [{"cliente": f"Cliente {i}", "monto": i * 1.5, "total": i * 3} for i in range(n)]}
+
+
+def _format_case(builder: Callable[[int], Dict[str, Any]], n: int) -> Callable[[], Callable[[], Any]]:
+    def setup() -> Callable[[], Any]:
+        payload = builder(n)
+        return lambda: format_n2sql_payload(payload)
+
+    return setup
+
+
+def _commands_setup() -> Callable[[], Any]:
+    def run() -> None:
+        for text in MESSAGES:
+            command_parser.parse(text)
+
+    return run
+
+
+def _faq_build_setup() -> Callable[[], Any]:
+    groups = load_catalog(DEFAULT_CATALOG_PATH)
+    return lambda: build_faq_card(groups)
+
+
+def _faq_attachment_setup() -> Callable[[], Any]:
+    catalog = FaqCatalog(DEFAULT_CATALOG_PATH)
+    catalog.reload()
+    return catalog.attachment
+
+
+def _deserialize_setup(path: Path) -> Callable[[], Callable[[], Any]]:
+    def setup() -> Callable[[], Any]:
+        raw = path.read_bytes()
+        return lambda: Activity().deserialize(json.loads(raw))
+
+    return setup
+
+
+def _inbound_setup(path: Path) -> Callable[[], Callable[[], Any]]:
+    """Ruta rápida de ``/api/messages``: solo los campos que lee el gateway."""
+
+    def setup() -> Callable[[], Any]:
+        raw = path.read_bytes()
+        return lambda: InboundActivity.parse(raw)
+
+    return setup
+
+
+def _inbound_full_setup(path: Path) -> Callable[[], Callable[[], Any]]:
+    """Ruta rápida más el ``Activity`` completo que pide el adapter."""
+
+    def setup() -> Callable[[], Any]:
+        raw = path.read_bytes()
+        return lambda: InboundActivity.parse(raw).activity
+
+    return setup
+
+
+def cases() -> List[Case]:
+    found: List[Case] = []
+    for shape, builder in (("columns_rows", _columns_rows), ("dict_rows", _dict_rows), ("data_records", _data_records)):
+        for label, n in SIZES.items():
+            found.append(Case(f"format.{shape}.{label}", _format_case(builder, n)))
+    found.append(Case("commands.parse", _commands_setup))
+    found.append(Case("faq.build_card", _faq_build_setup))
+    found.append(Case("faq.attachment", _faq_attachment_setup))
+    for path in sorted(PAYLOADS_DIR.glob("*.json")):
+        found.append(Case(f"activity.deserialize.{path.stem}", _deserialize_setup(path)))
+        found.append(Case(f"activity.inbound.{path.stem}", _inbound_setup(path)))
+        found.append(Case(f"activity.inbound_full.{path.stem}", _inbound_full_setup(path)))
+    return found
+
+
+def measure(case: Case, repeat: int = 7, min_time_s: float = 0.05) -> float:
+    """Segundos por llamada: el mínimo de ``repeat`` rondas de al menos ``min_time_s``.
+
+    El ruido del host (otros procesos, frecuencia de CPU) solo suma tiempo,
+    así que el mínimo es la cota que menos varía entre corridas. Como
+    ``timeit``, desactiva el GC durante la medición para que el tamaño del
+    heap del proceso (p. ej. pytest) no cambie el resultado.
+    """
+    fn = case.setup()
+    fn()  # calentamiento
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        number = _calibrate(fn, min_time_s)
+        return min(_round(fn, number) for _ in range(repeat))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _round(fn: Callable[[], Any], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - started) / number
+
+
+def _calibrate(fn: Callable[[], Any], min_time_s: float) -> int:
+    """Llamadas por ronda para que cada ronda dure al menos ``min_time_s``."""
+    number = 1
+    while _round(fn, number) * number < min_time_s:
+        number *= 2
+    return number
+
+
+BASELINE_PASSES = 3
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> Dict[str, float]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8")).get("cases", {})
+
+
+def save_baseline(results: Dict[str, float], path: Path = BASELINE_PATH) -> None:
+    data = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "platform": platform.platform()},
+        "cases": {name: round(seconds, 9) for name, seconds in sorted(results.items())},
+    }
+    path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+
+def _fmt(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} µs"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filter", default="", help="solo casos cuyo nombre contenga este texto")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline()
+    results: Dict[str, float] = {}
+    print(f"{'caso':<48}{'tiempo':>12}{'baseline':>12}{'cambio':>9}")
+    for case in cases():
+        if args.filter not in case.name:
+            continue
+        if args.save_baseline:
+            # El host alterna fases rápidas y lentas: el baseline es la mediana
+            # de varias pasadas, no un mínimo con suerte que haría fallar al gate.
+            seconds = statistics.median(measure(case, repeat=args.repeat) for _ in range(BASELINE_PASSES))
+        else:
+            seconds = measure(case, repeat=args.repeat)
+        results[case.name] = seconds
+        base = baseline.get(case.name)
+        change = f"{(seconds / base - 1) * 100:+.0f}%" if base else "-"
+        print(f"{case.name:<48}{_fmt(seconds):>12}{_fmt(base) if base else '-':>12}{change:>9}")
+    if args.save_baseline:
+        save_baseline({**baseline, **results})
+        print(f"Baseline guardado en {BASELINE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
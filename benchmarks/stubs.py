@@ -0,0 +1,96 @@
+"""Sustitutos locales de N2SQL y del Bot Connector para las pruebas de carga."""
+from __future__ import annotations
+
+import asyncio
+import random
+import socket
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def n2sql_stub(latency_ms: float = 200.0, jitter_ms: float = 50.0, rows: int = 200, columns: int = 6) -> FastAPI:
+    """N2SQL falso: ``POST /v1/query`` con latencia y tamaño de resultado configurables.
+
+    Respeta ``params.limit/offset`` (modo ``N2SQL_PAGINATION``) y devuelve ``rowcount``.
+    """
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.traced = 0
+    headers = [f"col_{i}" for i in range(columns)]
+    table = [[f"r{r}c{c}" if c else r for c in range(columns)] for r in range(rows)]
+
+    @app.post("/v1/query")
+    async def query(request: Request) -> Dict[str, Any]:
+        body = await request.json()
+        app.state.requests += 1
+        if request.headers.get("traceparent"):
+            app.state.traced += 1
+        await asyncio.sleep(max(latency_ms + random.uniform(-jitter_ms, jitter_ms), 0) / 1000)
+        params = body.get("params") or {}
+        offset = int(params.get("offset") or 0)
+        limit = params.get("limit")
+        selected = table[offset:] if limit is None else table[offset: offset + int(limit)]
+        return {
+            "columns": headers,
+            "rows": selected,
+            "rowcount": rows,
+            "sql": f"SELECT * FROM stub -- {body.get('intent', '')[:40]}",
+        }
+
+    return app
+
+
+def connector_stub() -> FastAPI:
+    """Bot Connector falso: acepta las respuestas que el bot envía al ``serviceUrl``."""
+    app = FastAPI()
+    app.state.replies = Counter()
+
+    async def _accept(conversation_id: str, request: Request) -> Dict[str, str]:
+        await request.body()
+        app.state.replies[conversation_id] += 1
+        return {"id": f"reply-{sum(app.state.replies.values())}"}
+
+    @app.post("/v3/conversations/{conversation_id}/activities")
+    async def send_to_conversation(conversation_id: str, request: Request):
+        return await _accept(conversation_id, request)
+
+    @app.post("/v3/conversations/{conversation_id}/activities/{activity_id}")
+    async def reply_to_activity(conversation_id: str, activity_id: str, request: Request):
+        return await _accept(conversation_id, request)
+
+    return app
+
+
+class StubServer:
+    """Arranca una app ASGI con uvicorn dentro del loop actual."""
+
+    def __init__(self, app: FastAPI, port: Optional[int] = None) -> None:
+        self.app = app
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="off")
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "StubServer":
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self._server.should_exit = True
+        if self._task is not None:
+            await self._task
@@ -0,0 +1,47 @@
+"""Modo regresión de ``benchmarks.microbench`` (opt-in: ``RUN_BENCHMARKS=1``).
+
+Falla si un caso es más lento que el baseline en más de
+``BENCH_MAX_REGRESSION_PCT`` por ciento (40 por defecto). Un caso que
+supera el umbral se vuelve a medir hasta ``BENCH_ATTEMPTS`` veces y cuenta
+el mejor resultado: el ruido del host es transitorio, una regresión no.
+
+Solo se hacen fallar los casos de al menos ``BENCH_MIN_GATED_US``
+microsegundos (100 por defecto: formatter a 1k/100k filas y decodificación
+completa de actividades). Los más rápidos varían más que el umbral entre
+corridas en el mismo host; se informan como skip con su cambio (``-rs``).
+"""
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from benchmarks.microbench import cases, load_baseline, measure
+
+pytestmark = pytest.mark.skipif(
+    os.getenv("RUN_BENCHMARKS", "").lower() not in ("1", "true", "yes"),
+    reason="microbenchmarks desactivados; usa RUN_BENCHMARKS=1",
+)
+
+MAX_REGRESSION_PCT = float(os.getenv("BENCH_MAX_REGRESSION_PCT", "40"))
+MIN_GATED_S = float(os.getenv("BENCH_MIN_GATED_US", "100")) / 1e6
+ATTEMPTS = int(os.getenv("BENCH_ATTEMPTS", "5"))
+BASELINE = load_baseline()
+
+
+@pytest.mark.parametrize("case", cases(), ids=lambda case: case.name)
+def test_no_regression(case):
+    base = BASELINE.get(case.name)
+    if not base:
+        pytest.skip(f"sin baseline para {case.name}")
+    gated = base >= MIN_GATED_S
+    seconds = measure(case)
+    for _ in range(ATTEMPTS - 1 if gated else 0):
+        if (seconds / base - 1) * 100 <= MAX_REGRESSION_PCT:
+            break
+        seconds = min(seconds, measure(case))
+    change_pct = (seconds / base - 1) * 100
+    report = f"{case.name}: {seconds * 1e6:.1f}µs vs baseline {base * 1e6:.1f}µs ({change_pct:+.0f}%"
+    if not gated:
+        pytest.skip(f"{report}; menos de {MIN_GATED_S * 1e6:g}µs, solo informativo)")
+    assert change_pct <= MAX_REGRESSION_PCT, f"{report}, máximo +{MAX_REGRESSION_PCT:g}%)"
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.admission")
+
+
+class AdmissionRejected(Exception):
+    """No hubo cupo para llamar a N2SQL dentro de la espera máxima."""
+
+
+class _Waiter:
+    __slots__ = ("user", "conversation", "future")
+
+    def __init__(self, user: str, conversation: str, future: "asyncio.Future[None]") -> None:
+        self.user = user
+        self.conversation = conversation
+        self.future = future
+
+
+class SharedSlot:
+    """Un solo cupo para llamadas hermanas (las de un fan-out ``dt[a,b,c]:``).
+
+    Se toma cuando la primera entra a N2SQL y se libera cuando sale la última:
+    el fan-out cuenta como una consulta del usuario y sus datasets no esperan
+    cupos que ocupa el propio fan-out. Se usa como ``admit`` de ``client.ask``.
+    """
+
+    def __init__(self, controller: "AdmissionController", user: str, conversation: str) -> None:
+        self._controller = controller
+        self._user = user
+        self._conversation = conversation
+        self._holders = 0
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def __call__(self) -> AsyncIterator[None]:
+        async with self._lock:
+            if self._holders == 0:
+                await self._controller._acquire(self._user, self._conversation)
+            self._holders += 1
+        try:
+            yield
+        finally:
+            self._holders -= 1
+            if self._holders == 0:
+                self._controller._release(self._user, self._conversation)
+
+
+class AdmissionController:
+    """Limita las llamadas concurrentes a N2SQL (global, por usuario y por conversación).
+
+    Las peticiones que no tienen cupo esperan en una cola por usuario; al
+    liberarse un cupo se atiende a los usuarios por turnos (round-robin), de
+    modo que un canal muy activo no acapara el servicio. Si la espera supera
+    ``max_wait_s`` se lanza ``AdmissionRejected``. Un límite en 0 lo desactiva.
+    """
+
+    def __init__(self, max_concurrent: int, per_user: int, per_conversation: int, max_wait_s: float) -> None:
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.per_conversation = per_conversation
+        self.max_wait_s = max_wait_s
+        self._active = 0
+        self._by_user: Counter = Counter()
+        self._by_conversation: Counter = Counter()
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        return cls(
+            max_concurrent=settings.N2SQL_MAX_CONCURRENT,
+            per_user=settings.N2SQL_MAX_CONCURRENT_PER_USER,
+            per_conversation=settings.N2SQL_MAX_CONCURRENT_PER_CONVERSATION,
+            max_wait_s=settings.N2SQL_ADMISSION_MAX_WAIT_S,
+        )
+
+    def _fits(self, user: str, conversation: str) -> bool:
+        return (
+            (not self.max_concurrent or self._active < self.max_concurrent)
+            and (not self.per_user or self._by_user[user] < self.per_user)
+            and (not self.per_conversation or self._by_conversation[conversation] < self.per_conversation)
+        )
+
+    def _grant(self, user: str, conversation: str) -> None:
+        self._active += 1
+        self._by_user[user] += 1
+        self._by_conversation[conversation] += 1
+        self.admitted += 1
+
+    def _release(self, user: str, conversation: str) -> None:
+        self._active -= 1
+        self._by_user[user] -= 1
+        if self._by_user[user] <= 0:
+            del self._by_user[user]
+        self._by_conversation[conversation] -= 1
+        if self._by_conversation[conversation] <= 0:
+            del self._by_conversation[conversation]
+        self._pump()
+
+    def _pump(self) -> None:
+        """Da cupo a los que esperan, un turno por usuario en cada vuelta."""
+        progress = True
+        while progress and self._queues:
+            progress = False
+            for user in list(self._queues):
+                queue = self._queues[user]
+                served = next((w for w in queue if self._fits(w.user, w.conversation)), None)
+                if served is not None:
+                    queue.remove(served)
+                    self._grant(served.user, served.conversation)
+                    served.future.set_result(None)
+                    progress = True
+                if not queue:
+                    del self._queues[user]
+                elif served is not None:
+                    # El usuario atendido pasa al final de la ronda.
+                    self._queues.move_to_end(user)
+                if self.max_concurrent and self._active >= self.max_concurrent:
+                    return
+
+    async def _acquire(self, user: str, conversation: str) -> None:
+        if self._fits(user, conversation):
+            self._grant(user, conversation)
+            return
+        waiter = _Waiter(user, conversation, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user, deque()).append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait_s or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Se concedió justo al vencer: devolvemos el cupo.
+                self._release(user, conversation)
+            else:
+                waiter.future.cancel()
+                queue = self._queues.get(user)
+                if queue is not None:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[user]
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            log.warning(
+                "N2SQL ocupado: user=%s conversation=%s esperó %.1fs (activos=%s)",
+                user, conversation, time.monotonic() - started, self._active,
+            )
+            raise AdmissionRejected() from None
+
+    @asynccontextmanager
+    async def slot(self, user: str, conversation: str) -> AsyncIterator[None]:
+        await self._acquire(user, conversation)
+        try:
+            yield
+        finally:
+            self._release(user, conversation)
+
+    def shared_slot(self, user: str, conversation: str) -> SharedSlot:
+        return SharedSlot(self, user, conversation)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "waiting": sum(len(q) for q in self._queues.values()),
+            "max_concurrent": self.max_concurrent,
+            "per_user": self.per_user,
+            "per_conversation": self.per_conversation,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+admission = AdmissionController.from_settings()
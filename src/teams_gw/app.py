@@ -1,36 +1,73 @@
 from __future__ import annotations
 
-import inspect
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import logging
 import os
-import time
+from contextlib import asynccontextmanager
 from typing import Any
-from urllib.parse import urlparse
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
 
 from botbuilder.core import (
     BotFrameworkAdapter,
     BotFrameworkAdapterSettings,
     ConversationState,
-    MemoryStorage,
+    Middleware,
     TurnContext,
 )
 from botbuilder.schema import Activity
 from botframework.connector import models as connector_models  # <-- para capturar el error
-from botframework.connector.auth import MicrosoftAppCredentials
+from botframework.connector.auth import AuthenticationConstants, ClaimsIdentity, MicrosoftAppCredentials
 from botframework.connector.auth import microsoft_app_credentials as mac
-from msal import ConfidentialClientApplication
 
-from .bot import TeamsGatewayBot
+from .auth import token_cache
+from .background import background
+from .bot import TeamsGatewayBot, more_card_content
+from .deadlines import turn_deadline
+from .dedup import activity_dedup, activity_key
+from .faq import faq_catalog
+from .logging_config import configure_logging, shutdown_logging
+from .metrics import ERRORS, STAGE_SECONDS
+from .tracing import tracer
 from .health import router as health_router
+from .inbound import FastJSONResponse, InboundActivity, deserialize_activity
+from .n2sql_client import client as n2sql_client
 from .settings import settings
+from .storage import build_storage
+from .trust import service_url_trust
+from .warmup import warmup
 
-logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+configure_logging()
 log = logging.getLogger("teams_gw.app")
 
-app = FastAPI(title="teams_gw")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await n2sql_client.start()
+    token_cache.start()
+    faq_catalog.start()
+    background.start()
+    warmup.start()
+    try:
+        yield
+    finally:
+        await warmup.stop()
+        # Primero se terminan las respuestas pendientes: aún necesitan token y pool HTTP.
+        await background.drain(settings.ASYNC_DRAIN_TIMEOUT_S)
+        await faq_catalog.stop()
+        await token_cache.stop()
+        await n2sql_client.aclose()
+        close_storage = getattr(conversation_storage, "close", None)
+        if close_storage is not None:
+            await close_storage()
+        # Al final, para que los logs del drenaje y del cierre lleguen a stderr.
+        shutdown_logging()
+
+
+app = FastAPI(title="teams_gw", lifespan=lifespan, default_response_class=FastJSONResponse)
 app.include_router(health_router)
 
 for env_key, env_value in {
@@ -58,33 +95,29 @@ def _msal_authority(creds: MicrosoftAppCredentials) -> str:
     return f"https://login.microsoftonline.com/{tenant}"
 
 
-def _patched_get_access_token(self: MicrosoftAppCredentials) -> str:
-    cached = getattr(self, "_patched_token", None)
-    expires_at = getattr(self, "_patched_token_expires_at", 0)
-    if cached and expires_at - time.time() > 300:
-        return cached
-
-    scope = getattr(self, "oauth_scope", None) or os.getenv("MicrosoftAppOAuthScope") or "https://api.botframework.com/.default"
+def _oauth_scope(creds: MicrosoftAppCredentials) -> str:
+    scope = getattr(creds, "oauth_scope", None) or os.getenv("MicrosoftAppOAuthScope") or "https://api.botframework.com/.default"
     scope = scope.strip()
     if not scope.endswith("/.default"):
         scope = f"{scope.rstrip('/')}/.default"
-    app = getattr(self, "_patched_msal_app", None)
-    if not app:
-        app = ConfidentialClientApplication(
-            client_id=getattr(self, "microsoft_app_id", None) or settings.MICROSOFT_APP_ID,
-            client_credential=getattr(self, "microsoft_app_password", None) or settings.MICROSOFT_APP_PASSWORD,
-            authority=_msal_authority(self),
-        )
-        self._patched_msal_app = app
-
-    result = app.acquire_token_for_client(scopes=[scope])
-    token = result.get("access_token")
-    if not token:
-        raise RuntimeError(f"Could not acquire access token via MSAL: {result}")
-    ttl = int(result.get("expires_in", 3600))
-    self._patched_token = token
-    self._patched_token_expires_at = time.time() + ttl
-    return token
+    return scope
+
+
+def _token_args(creds: MicrosoftAppCredentials) -> tuple[str, str, str, str]:
+    return (
+        getattr(creds, "microsoft_app_id", None) or settings.MICROSOFT_APP_ID,
+        getattr(creds, "microsoft_app_password", None) or settings.MICROSOFT_APP_PASSWORD,
+        _msal_authority(creds),
+        _oauth_scope(creds),
+    )
+
+
+def _patched_get_access_token(self: MicrosoftAppCredentials, force_refresh: bool = False) -> str:
+    if settings.AUTH_DISABLED:
+        return "auth-disabled"
+    # La caché es compartida por (app_id, authority, scope): instancias nuevas
+    # (p.ej. /__bf-token) reutilizan el mismo token y la misma app MSAL.
+    return token_cache.get_token(*_token_args(self), force_refresh=force_refresh)
 
 
 mac.MicrosoftAppCredentials.get_access_token = _patched_get_access_token
@@ -94,85 +127,156 @@ adapter_settings = BotFrameworkAdapterSettings(
     settings.MICROSOFT_APP_ID,
     settings.MICROSOFT_APP_PASSWORD,
 )
-adapter = BotFrameworkAdapter(adapter_settings)
+
+
+class InstrumentedBotFrameworkAdapter(BotFrameworkAdapter):
+    async def _authenticate_request(self, request: Activity, auth_header: str):
+        with STAGE_SECONDS.time("auth"), tracer.span("auth"):
+            if settings.AUTH_DISABLED:
+                # Solo para pruebas de carga contra un conector falso (benchmarks/loadtest.py).
+                return ClaimsIdentity(
+                    {
+                        AuthenticationConstants.AUDIENCE_CLAIM: settings.MICROSOFT_APP_ID,
+                        AuthenticationConstants.APP_ID_CLAIM: settings.MICROSOFT_APP_ID,
+                    },
+                    True,
+                )
+            return await super()._authenticate_request(request, auth_header)
+
+    async def create_connector_client(self, service_url: str, identity: ClaimsIdentity = None, audience: str = None):
+        client = await super().create_connector_client(service_url, identity, audience)
+        creds = client.config.credentials
+        if not settings.AUTH_DISABLED and isinstance(creds, MicrosoftAppCredentials) and creds.microsoft_app_id:
+            # msrest firma cada envío con get_access_token (síncrono, en el loop):
+            # aquí se espera el token sin bloquear y allí ya lo encuentra en caché.
+            await token_cache.get_token_async(*_token_args(creds))
+        return client
+
+
+class SendTimingMiddleware(Middleware):
+    """Mide cada envío saliente al conector (también en turnos proactivos)."""
+
+    async def on_turn(self, context: TurnContext, logic):
+        async def timed_send(_ctx, _activities, next_send):
+            with STAGE_SECONDS.time("send"), tracer.span("send", activities=len(_activities)):
+                return await next_send()
+
+        context.on_send_activities(timed_send)
+        await logic()
+
+
+adapter = InstrumentedBotFrameworkAdapter(adapter_settings)
+if settings.AUTH_DISABLED:
+    log.warning("AUTH_DISABLED=true: no se valida la autenticación entrante ni se piden tokens. Solo para pruebas.")
+adapter.use(SendTimingMiddleware())
 ADAPTER_KIND = "BotFrameworkAdapter"
 
 
-conversation_state = ConversationState(MemoryStorage())
+conversation_storage = build_storage()
+conversation_state = ConversationState(conversation_storage)
 bot = TeamsGatewayBot(conversation_state)
 
 @app.post("/api/messages")
 async def messages(request: Request):
-    body = await request.json()
-    activity = Activity().deserialize(body)
+    # El presupuesto del turno corre desde que llega el POST; N2SQL recibe lo que quede.
+    with turn_deadline(settings.TURN_DEADLINE_S):
+        return await _messages(request)
+
+
+async def _messages(request: Request):
+    with STAGE_SECONDS.time("parse"):
+        try:
+            inbound = InboundActivity.parse(await request.body())
+        except ValueError:
+            ERRORS.inc("bad_request")
+            return FastJSONResponse(status_code=400, content={"ok": False, "error": "invalid_activity"})
+    # La traza se deriva de activity.id: el log, los spans y N2SQL comparten el mismo id.
+    with tracer.trace("messages", inbound.id) as root:
+        response = await _handle_message(request, inbound)
+        if root is not None:
+            log.info(
+                "Actividad procesada",
+                extra={
+                    "duration_ms": round(root.duration_ms, 3),
+                    "timings": {k: round(v, 3) for k, v in root.timings.items()},
+                },
+            )
+    return response
+
+
+async def _handle_message(request: Request, inbound: InboundActivity):
     auth_header = request.headers.get("Authorization", "")
+    root = tracer.current()
+    if root is not None:
+        root.set(activity_type=inbound.type, conversation_id=inbound.conversation_id)
 
-    rid = (activity.recipient and activity.recipient.id) or ""
+    rid = inbound.recipient_id or ""
     rid_norm = rid.split(":", 1)[-1] if rid else ""
     log.info(
         "Incoming activity: {'type': %s, 'channel_id': %s, 'service_url': %s, "
         "'conversation_id': %s, 'from_id': %s, 'recipient_id': %s, "
-        "'recipient_id_normalized': %s, 'env_app_id': %s}",
-        activity.type,
-        activity.channel_id,
-        activity.service_url,
-        (activity.conversation and activity.conversation.id),
-        (activity.from_property and activity.from_property.id),
+        "'recipient_id_normalized': %s, 'env_app_id': %s, 'trace_id': %s}",
+        inbound.type,
+        inbound.channel_id,
+        inbound.service_url,
+        inbound.conversation_id,
+        inbound.from_id,
         rid,
         rid_norm,
         settings.MICROSOFT_APP_ID,
+        tracer.current_trace_id(),
     )
 
-    # Confiamos explíticamente serviceUrl y host base (bien para Teams)
-    svc = getattr(activity, "service_url", None)
+    # Confiamos explíticamente serviceUrl y host base (bien para Teams), una vez por URL
+    svc = inbound.service_url
     if svc:
         try:
-            p = urlparse(svc)
-            # host raíz
-            host_root = f"{p.scheme}://{p.netloc}/"
-            # base regional (primer segmento del path, p.ej. "amer/")
-            path_parts = [seg for seg in p.path.split("/") if seg]
-            region_base = f"{p.scheme}://{p.netloc}/{path_parts[0]}/" if path_parts else host_root
-
-            # Confiar: URL completa, host raíz y base regional (ambos con/sin "/")
-            variants = {svc, host_root, region_base}
-            variants |= {u.rstrip("/") for u in variants if u.endswith("/")}
-
-            for u in variants:
-                if u:
-                    MicrosoftAppCredentials.trust_service_url(u)
-
-            log.info("Trusted service URLs: %s", sorted(variants))
+            service_url_trust.ensure_trusted(svc)
         except Exception as e:
             log.warning("Could not trust serviceUrl variants: %s (%s)", svc, e)
-   
 
     async def aux_logic(turn_context: TurnContext):
         await bot.on_turn(turn_context)
 
-    try:
-        await adapter.process_activity(activity, auth_header, aux_logic)
-        return {"ok": True}
-    except connector_models.ErrorResponseException as e:
-        status, reason, body_text = await _extract_error_details(e)
-        inner_details = _format_inner_error(e)
-        log.error(
-            "Connector reply failed: status=%s reason=%s url=%s convo=%s activityId=%s body=%s raw=%r inner=%r inner_details=%s",
-            status, reason, activity.service_url,
-            (activity.conversation and activity.conversation.id),
-            getattr(activity, "id", None),
-            body_text, e, getattr(e, "inner_exception", None), inner_details,
-        )
-        return JSONResponse(status_code=502, content={"ok": False, "error": "connector_unauthorized"})
-    except Exception as e:
-        if isinstance(e, KeyError) and e.args == ("access_token",):
-            await _log_auth_context()
-        log.exception("Unexpected error replying to Teams: %s", e)
-        return JSONResponse(status_code=500, content={"ok": False, "error": "unexpected"})
+    async def handle():
+        # El Activity completo (msrest) solo se arma si la actividad no es un reintento.
+        with STAGE_SECONDS.time("deserialize"), tracer.span("deserialize"):
+            activity = inbound.activity
+        try:
+            await adapter.process_activity(activity, auth_header, aux_logic)
+            return {"ok": True}
+        except connector_models.ErrorResponseException as e:
+            status, reason, body_text = await _extract_error_details(e)
+            inner_details = _format_inner_error(e)
+            log.error(
+                "Connector reply failed: status=%s reason=%s url=%s convo=%s activityId=%s body=%s raw=%r inner=%r inner_details=%s",
+                status, reason, activity.service_url,
+                (activity.conversation and activity.conversation.id),
+                getattr(activity, "id", None),
+                body_text, e, getattr(e, "inner_exception", None), inner_details,
+            )
+            ERRORS.inc("connector")
+            return FastJSONResponse(status_code=502, content={"ok": False, "error": "connector_unauthorized"})
+        except Exception as e:
+            if isinstance(e, KeyError) and e.args == ("access_token",):
+                await _log_auth_context()
+            ERRORS.inc("unexpected")
+            log.exception("Unexpected error replying to Teams: %s", e)
+            return FastJSONResponse(status_code=500, content={"ok": False, "error": "unexpected"})
+
+    # Los reintentos de Bot Framework (mismo activity.id) no repiten la consulta:
+    # esperan a la original o reciben su misma respuesta.
+    key = activity_key(inbound)
+    response = await activity_dedup.run(key, handle)
+    if isinstance(response, FastJSONResponse):
+        # Si la original falló, el próximo reintento sí debe procesarse.
+        activity_dedup.forget(key)
+    return response
 
 
 async def _extract_error_details(error: connector_models.ErrorResponseException) -> tuple[Any, Any, str]:
     """Try to pull status/headers/body information from BotFramework error responses."""
+    import inspect
 
     def _maybe_decode(value: Any) -> str:
         if value is None:
@@ -239,18 +343,19 @@ def _format_inner_error(error: connector_models.ErrorResponseException) -> dict[
 async def root():
     return {"service": app.title, "adapter": ADAPTER_KIND, "ready": True}
 
+@app.get("/__state")
+async def state_stats():
+    return conversation_storage.stats()
+
 @app.get("/__bf-token")
 async def bf_token():
-    from botframework.connector.auth import MicrosoftAppCredentials
     creds = MicrosoftAppCredentials(
         settings.MICROSOFT_APP_ID,
         settings.MICROSOFT_APP_PASSWORD,
         settings.MICROSOFT_APP_TENANT_ID,
         settings.MICROSOFT_APP_OAUTH_SCOPE,
     )
-    tok = creds.get_access_token()
-    if inspect.isawaitable(tok):
-        tok = await tok
+    tok = await token_cache.get_token_async(*_token_args(creds))
     # Solo inspección: header.payload (sin verificación)
     import base64, json
     def _b64url_decode(seg):
@@ -286,9 +391,7 @@ async def _log_auth_context() -> None:
         settings.MICROSOFT_APP_OAUTH_SCOPE,
     )
     try:
-        tok = creds.get_access_token()
-        if inspect.isawaitable(tok):
-            tok = await tok
+        tok = await token_cache.get_token_async(*_token_args(creds))
     except Exception as auth_exc:
         log.error("Access-token fetch raised: %r", auth_exc)
         return
@@ -297,3 +400,31 @@ async def _log_auth_context() -> None:
         log.error("Access-token sample (first 32 chars): %s…", tok[:32])
     else:
         log.error("Access-token payload (non-string): %r", tok)
+
+
+async def _warm_bf_token() -> None:
+    if settings.AUTH_DISABLED:
+        return
+    # Mismas credenciales que arma el adapter: el token queda en la misma entrada de la caché.
+    creds = MicrosoftAppCredentials(
+        settings.MICROSOFT_APP_ID,
+        settings.MICROSOFT_APP_PASSWORD,
+        adapter_settings.channel_auth_tenant,
+        oauth_scope=AuthenticationConstants.TO_CHANNEL_FROM_BOT_OAUTH_SCOPE,
+    )
+    await token_cache.get_token_async(*_token_args(creds))
+
+
+def _warm_cards() -> None:
+    faq_catalog.attachment()
+    more_card_content(None)
+    # La primera deserialización de msrest compila expresiones y cachés internas.
+    deserialize_activity({"type": "message", "id": "warmup", "conversation": {"id": "warmup"}})
+
+
+warmup.step("bf_token", _warm_bf_token)
+warmup.step("n2sql", n2sql_client.warm)
+warmup.step("cards", _warm_cards)
+
+warmup.import_ms = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+log.info("Aplicación importada en %.0fms", warmup.import_ms)
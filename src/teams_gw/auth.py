@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from msal import ConfidentialClientApplication
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.auth")
+
+TokenKey = Tuple[str, str, str]  # (app_id, authority, scope)
+
+
+class _TokenEntry:
+    __slots__ = ("password", "app", "token", "expires_at", "refreshing")
+
+    def __init__(self, password: str) -> None:
+        self.password = password
+        self.app: Optional[ConfidentialClientApplication] = None
+        self.token: Optional[str] = None
+        self.expires_at = 0.0
+        self.refreshing: Optional[Future] = None
+
+
+class BotTokenCache:
+    """Caché de tokens de Bot Framework compartida por (app_id, authority, scope).
+
+    MSAL es síncrono y hace HTTP: las renovaciones corren en un hilo aparte y
+    se comparten entre todos los llamadores. Un token se considera válido
+    mientras le queden más de ``margin_s`` segundos; al entrar en la ventana de
+    ``refresh_ahead_s`` previa se renueva en segundo plano sin bloquear a nadie.
+    """
+
+    def __init__(self, margin_s: float = 300, refresh_ahead_s: float = 600) -> None:
+        self.margin_s = margin_s
+        self.refresh_ahead_s = refresh_ahead_s
+        self._entries: Dict[TokenKey, _TokenEntry] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bf-token")
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _entry(self, key: TokenKey, password: str) -> _TokenEntry:
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.setdefault(key, _TokenEntry(password))
+        return entry
+
+    def _acquire(self, key: TokenKey, entry: _TokenEntry, force: bool) -> str:
+        app_id, authority, scope = key
+        if entry.app is None:
+            entry.app = ConfidentialClientApplication(
+                client_id=app_id,
+                client_credential=entry.password,
+                authority=authority,
+            )
+        elif force:
+            # MSAL devolvería el token cacheado hasta 5 min antes de expirar.
+            entry.app.remove_tokens_for_client()
+        started = time.perf_counter()
+        result = entry.app.acquire_token_for_client(scopes=[scope])
+        token = result.get("access_token")
+        if not token:
+            raise RuntimeError(f"Could not acquire access token via MSAL: {result}")
+        entry.token = token
+        entry.expires_at = time.time() + int(result.get("expires_in", 3600))
+        log.info(
+            "Bot Framework token renovado → app_id=%s scope=%s ttl=%ss en %.0fms",
+            app_id,
+            scope,
+            int(result.get("expires_in", 3600)),
+            (time.perf_counter() - started) * 1000,
+        )
+        return token
+
+    def _refresh(self, key: TokenKey, entry: _TokenEntry, force: bool = False) -> Future:
+        """Lanza (o reutiliza) la renovación en curso para ``key``."""
+        with self._lock:
+            if entry.refreshing is not None and not entry.refreshing.done():
+                return entry.refreshing
+            future = self._executor.submit(self._acquire, key, entry, force)
+            entry.refreshing = future
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        exc = future.exception()
+        if exc is not None:
+            log.warning("Renovación de token de Bot Framework falló: %s", exc)
+
+    def _valid(self, entry: _TokenEntry) -> bool:
+        return bool(entry.token) and entry.expires_at - time.time() > self.margin_s
+
+    def _needs_refresh_ahead(self, entry: _TokenEntry) -> bool:
+        return entry.expires_at - time.time() <= self.margin_s + self.refresh_ahead_s
+
+    def get_token(
+        self,
+        app_id: str,
+        password: str,
+        authority: str,
+        scope: str,
+        force_refresh: bool = False,
+    ) -> str:
+        """Versión síncrona para ``MicrosoftAppCredentials.get_access_token``.
+
+        Corre en el hilo del event loop: mientras haya un token sin expirar lo
+        devuelve y renueva en segundo plano, aun con ``force_refresh``. El
+        adapter pide el token con ``get_token_async`` antes de crear el
+        conector, así que solo se bloquea si alguien usa las credenciales sin
+        pasar por él y no hay ningún token (arranque en frío).
+        """
+        key = (app_id, authority, scope)
+        entry = self._entry(key, password)
+        if not force_refresh and self._valid(entry):
+            if self._needs_refresh_ahead(entry):
+                self._refresh(key, entry, force=True)
+            return entry.token  # type: ignore[return-value]
+        if entry.token and entry.expires_at > time.time():
+            self._refresh(key, entry, force=True)
+            return entry.token
+        log.warning("Token de Bot Framework pedido en frío desde código síncrono; se espera a AAD.")
+        return self._refresh(key, entry, force=force_refresh).result()
+
+    async def get_token_async(self, app_id: str, password: str, authority: str, scope: str) -> str:
+        key = (app_id, authority, scope)
+        entry = self._entry(key, password)
+        if self._valid(entry):
+            if self._needs_refresh_ahead(entry):
+                self._refresh(key, entry, force=True)
+            return entry.token  # type: ignore[return-value]
+        token = await asyncio.wrap_future(self._refresh(key, entry))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return token
+
+    def _next_due(self) -> float:
+        due = [
+            e.expires_at - self.margin_s - self.refresh_ahead_s
+            for e in self._entries.values()
+            if e.token
+        ]
+        return min(due) if due else time.time() + 60
+
+    async def _refresher(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            delay = max(self._next_due() - time.time(), 1.0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                self._wakeup.clear()
+                continue
+            except asyncio.TimeoutError:
+                pass
+            for key, entry in list(self._entries.items()):
+                if entry.token and self._needs_refresh_ahead(entry):
+                    try:
+                        await asyncio.wrap_future(self._refresh(key, entry, force=True))
+                    except Exception:
+                        # Ya registrado en _log_failure; se reintenta en la próxima vuelta.
+                        await asyncio.sleep(5)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._refresher(), name="bf-token-refresher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+token_cache = BotTokenCache(refresh_ahead_s=settings.BF_TOKEN_REFRESH_AHEAD_S)
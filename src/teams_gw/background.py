@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.background")
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class BackgroundWorkers:
+    """Pool acotado de workers asyncio para responder consultas fuera del request.
+
+    ``submit`` encola sin esperar y devuelve False si la cola está llena, para
+    que el llamador avise al usuario en lugar de acumular trabajo sin límite.
+    ``drain`` deja de aceptar trabajos y espera a que terminen los encolados.
+    """
+
+    def __init__(self, workers: int, queue_max: int) -> None:
+        self.workers = max(workers, 1)
+        self.queue_max = queue_max
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_settings(cls) -> "BackgroundWorkers":
+        return cls(settings.ASYNC_WORKERS, settings.ASYNC_QUEUE_MAX)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_max)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"n2sql-worker-{i}") for i in range(self.workers)
+        ]
+        self._accepting = True
+
+    def submit(self, job: Job, name: str = "job") -> bool:
+        if not self._accepting or self._queue is None:
+            self.rejected += 1
+            return False
+        try:
+            # El contexto (traza actual) viaja con el trabajo hasta el worker.
+            self._queue.put_nowait((name, job, contextvars.copy_context(), time.monotonic()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            log.warning("Cola de trabajos llena (%s); se rechaza %s", self.queue_max, name)
+            return False
+        return True
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            name, job, context, queued_at = await self._queue.get()
+            self.running += 1
+            started = time.monotonic()
+            try:
+                await asyncio.create_task(job(), context=context)
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                log.exception("Trabajo en segundo plano falló: %s", name)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+                log.info(
+                    "Trabajo %s: espera=%.0fms duración=%.0fms",
+                    name,
+                    (started - queued_at) * 1000,
+                    (time.monotonic() - started) * 1000,
+                )
+
+    async def drain(self, timeout_s: float) -> None:
+        """Deja de aceptar trabajos, espera los pendientes hasta ``timeout_s`` y cierra."""
+        self._accepting = False
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout_s)
+            except asyncio.TimeoutError:
+                log.warning(
+                    "Apagado: %s trabajos sin terminar tras %.0fs",
+                    self._queue.qsize() + self.running,
+                    timeout_s,
+                )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.ASYNC_REPLIES,
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max": self.queue_max,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+background = BackgroundWorkers.from_settings()
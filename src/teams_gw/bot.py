@@ -1,103 +1,113 @@
 from __future__ import annotations
 
+import asyncio
+import copy
 import logging
-from typing import Any
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Awaitable, Callable
 
 from botbuilder.core import ActivityHandler, ConversationState, MessageFactory, TurnContext
 from botbuilder.schema import ActionTypes, Activity, Attachment, CardAction, HeroCard, InvokeResponse
 from .settings import settings
 from .n2sql_client import client
-from .formatters import format_n2sql_payload
-
-TRIGGER_BASES = [p.lower().rstrip(":").strip() for p in settings.triggers]
-FAQ_GROUPS = [
-    {
-        "title": "Facturación",
-        "items": [
-            {
-                "title": "Facturas pendientes",
-                "desc": "Lista facturas pendientes de pago.",
-                "query": "facturas pendientes de pago (cliente,fecha,monto,total)",
-            },
-            {
-                "title": "Total de facturas pendientes",
-                "desc": "Total adeudado por facturas pendientes.",
-                "query": "total de facturas pendientes de pago",
-            },
-        ],
-    },
-    {
-        "title": "Clientes",
-        "items": [
-            {
-                "title": "Datos de clientes",
-                "desc": "Información básica de clientes.",
-                "query": "datos de clientes (cliente,correo,telefono)",
-            }
-        ],
-    },
-]
+from .formatters import ResultSet, format_n2sql_payload
+from .admission import AdmissionRejected, admission
+from .background import background
+from .commands import command_parser
+from .deadlines import DeadlineExceeded, dataset_timeouts, remaining, turn_deadline
+from .faq import faq_catalog
+from .fanout import fan_out, render_fanout
+from .metrics import ERRORS, FAQ_CLICKS, MORE_ROWS, TRIGGERS
+from .tracing import tracer
 
 log = logging.getLogger("teams_gw.bot")
 
+BUSY_MESSAGE = "Estoy atendiendo muchas consultas en este momento. Inténtalo de nuevo en unos segundos."
+SLOW_DATASET_MESSAGE = "Esta consulta suele tardar. Te envío el resultado en cuanto esté listo."
+LATE_RESULT_MESSAGE = "La consulta está tardando más de lo habitual. Te envío el resultado en cuanto esté listo."
+
+# True mientras el trabajo corre dentro del turno HTTP (no en un worker).
+_inline_turn: ContextVar[bool] = ContextVar("teams_gw_inline_turn", default=False)
+
+Work = Callable[[TurnContext], Awaitable[Any]]
+
+
+class _TurnHandoff(Exception):
+    """La llamada a N2SQL no cupo en el turno en línea y sigue en vuelo.
+
+    ``resume`` termina el trabajo en un worker esperando ``fetch`` (la misma
+    llamada) en lugar de repetir la consulta.
+    """
+
+    def __init__(self, fetch: "asyncio.Future[Any]", resume: Work) -> None:
+        super().__init__("handoff")
+        self.fetch = fetch
+        self.resume = resume
+
+
+async def _within_turn(fetch: Awaitable[Any], resume: Callable[["asyncio.Future[Any]"], Work]) -> Any:
+    """Espera ``fetch`` sin pasarse del presupuesto del turno en línea.
+
+    En línea la llamada corre con ``ASYNC_DEADLINE_S`` (N2SQL no la cancela al
+    vencer el turno) y solo la espera se acota al turno: si vence, se lanza
+    ``_TurnHandoff`` con la llamada aún en curso. Fuera de un turno en línea
+    simplemente se espera.
+    """
+    left = remaining()
+    if not _inline_turn.get() or left is None:
+        return await fetch
+    with turn_deadline(settings.ASYNC_DEADLINE_S):
+        task = asyncio.ensure_future(fetch)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), max(left, 0))
+    except asyncio.TimeoutError:
+        if task.done():
+            raise
+        raise _TurnHandoff(task, resume(task)) from None
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+@lru_cache(maxsize=1)
+def _more_card_template() -> dict[str, Any]:
+    card = HeroCard(
+        text="Hay más filas disponibles:",
+        buttons=[
+            CardAction(
+                type=ActionTypes.message_back,
+                title="Ver más filas",
+                text="ver_mas_filas",
+                display_text="Ver más filas",
+                value={"action": "n2sql_more", "query": None},
+            )
+        ],
+    )
+    return card.serialize()
 
-class TeamsGatewayBot(ActivityHandler):
-    def __init__(self, conversation_state: ConversationState):
-        self.conversation_state = conversation_state
-        self._last_query_accessor = conversation_state.create_property("last_n2sql_query")
 
-    def _matches_trigger(self, text: str | None) -> bool:
-        if not text:
-            return False
-        t = text.strip()
-        low = t.lower()
+def more_card_content(query: str | None) -> dict[str, Any]:
+    """Tarjeta "Ver más" serializada una sola vez; solo cambia la consulta."""
+    content = copy.deepcopy(_more_card_template())
+    content["buttons"][0]["value"]["query"] = query
+    return content
 
-        # 1) Triggers directos (ej. "dt:", "n2sql:", "consulta ")
-        if any(low.startswith(p.lower()) for p in settings.triggers):
-            return True
 
-        # 2) Forma con dataset: "<trigger>[...]:" (ej. "dt[odoo]: ...")
-        colon = low.find(":")
-        if colon != -1:
-            header = low[:colon]               # "dt[odoo]" | "dt"
-            base = header.split("[", 1)[0]     # "dt"
-            if base in TRIGGER_BASES:
-                return True
+def _admission_key(activity: Activity) -> tuple[str, str]:
+    user = (activity.from_property and activity.from_property.id) or ""
+    conversation = (activity.conversation and activity.conversation.id) or ""
+    return user, conversation
 
-        return False
 
-    def _extract_query_and_dataset(self, text: str) -> tuple[str, str | None]:
-        """Devuelve (query, dataset_override) a partir de:
-        - "dt: consulta ..."
-        - "dt[odoo]: consulta ..."
-        - "consulta ...", "n2sql: ..." (prefijos simples definidos en N2SQL_TRIGGERS)
-        """
-        t = text.strip()
-        low = t.lower()
-
-        # Caso con encabezado y ":", preferido para dataset
-        colon = t.find(":")
-        if colon != -1:
-            header = t[:colon].strip()     # "dt[odoo]" o "dt"
-            query = t[colon + 1:].strip()
-            base = header.split("[", 1)[0].lower()
-
-            if base in TRIGGER_BASES:
-                # dataset opcional entre corchetes
-                ds = None
-                lb = header.find("[")
-                rb = header.find("]")
-                if lb != -1 and rb != -1 and rb > lb + 1:
-                    ds = header[lb + 1:rb].strip()
-                return query, ds
-
-        # Fallback: prefijo simple de settings.triggers (p.ej. "consulta ")
-        for prefix in settings.triggers:
-            if low.startswith(prefix.lower()):
-                return t[len(prefix):].strip(), None
-
-        # Último recurso: todo el texto como consulta
-        return t, None
+def _slow_dataset(dataset: str | None) -> bool:
+    return dataset_timeouts.is_slow(client.dataset_for(dataset))
+
+
+class TeamsGatewayBot(ActivityHandler):
+    def __init__(self, conversation_state: ConversationState):
+        self.conversation_state = conversation_state
+        self._last_query_accessor = conversation_state.create_property("last_n2sql_query")
 
     async def _handle_card_action(self, turn_context: TurnContext) -> bool:
         value = turn_context.activity.value or {}
@@ -106,12 +116,17 @@ class TeamsGatewayBot(ActivityHandler):
 
         action = value.get("action")
         if action == "n2sql_more":
-            await self._send_more_rows(turn_context)
+            # El turno proactivo del worker no trae ``value``: la consulta se captura aquí.
+            query = value.get("query")
+            await self._dispatch(turn_context, "n2sql_more", lambda turn: self._send_more_rows(turn, query))
             return True
         if action == "n2sql_faq":
             query = (value.get("query") or "").strip()
             if query:
-                await self._run_query(turn_context, query, None, announce=False)
+                FAQ_CLICKS.inc()
+                await self._dispatch(
+                    turn_context, "n2sql_faq", lambda turn: self._run_query(turn, query, None), slow=_slow_dataset(None)
+                )
             else:
                 await turn_context.send_activity("No pude recuperar esa consulta rápida.")
             return True
@@ -128,9 +143,20 @@ class TeamsGatewayBot(ActivityHandler):
 
         text = (turn_context.activity.text or "").strip()
 
-        if self._matches_trigger(text):
-            query, ds = self._extract_query_and_dataset(text)
-            await self._run_query(turn_context, query, ds)
+        command = command_parser.parse(text)
+        if command is not None and command.datasets:
+            TRIGGERS.inc(command.trigger)
+            await self._start_fanout(turn_context, command.query, command.datasets, command.fresh)
+            return
+        if command is not None:
+            TRIGGERS.inc(command.trigger)
+            await self._dispatch(
+                turn_context,
+                "n2sql_query",
+                lambda turn: self._run_query(turn, command.query, command.dataset, fresh=command.fresh),
+                ack="Entendido. Consultando…",
+                slow=_slow_dataset(command.dataset),
+            )
             return
 
         normalized = text.lower()
@@ -143,34 +169,195 @@ class TeamsGatewayBot(ActivityHandler):
         )
         await self._send_faq_card(turn_context)
 
+    async def _dispatch(
+        self,
+        turn_context: TurnContext,
+        name: str,
+        work: Work,
+        ack: str | None = None,
+        slow: bool = False,
+    ):
+        """Ejecuta ``work`` en este turno o, con ``ASYNC_REPLIES``, en un worker.
+
+        En modo asíncrono el turno entrante solo envía ``ack`` y termina (Teams
+        recibe el 200 enseguida); el worker retoma la conversación con
+        ``continue_conversation`` y responde de forma proactiva. Con ``slow``
+        (dataset que se sabe lento) va al worker aunque ``ASYNC_REPLIES`` esté
+        apagado: la consulta no cabe en el presupuesto del turno. Si una
+        consulta en línea agota ``TURN_DEADLINE_S`` (``_TurnHandoff``), el
+        worker espera la misma llamada a N2SQL, que sigue en vuelo, y responde.
+        """
+        pending: asyncio.Future[Any] | None = None
+        if ack:
+            await turn_context.send_activity(ack)
+        if not settings.ASYNC_REPLIES and not slow:
+            token = _inline_turn.set(True)
+            try:
+                await work(turn_context)
+                return
+            except _TurnHandoff as handoff:
+                log.info("%s agotó el presupuesto del turno; se responde en segundo plano", name)
+                await turn_context.send_activity(LATE_RESULT_MESSAGE)
+                work, pending = handoff.resume, handoff.fetch
+            finally:
+                _inline_turn.reset(token)
+        elif slow and not settings.ASYNC_REPLIES:
+            log.info("Dataset lento: %s se responde en segundo plano", name)
+            if not ack:
+                await turn_context.send_activity(SLOW_DATASET_MESSAGE)
+
+        reference = TurnContext.get_conversation_reference(turn_context.activity)
+        adapter = turn_context.adapter
+
+        async def job():
+            # Presupuesto propio: el del request HTTP ya no aplica.
+            with turn_deadline(settings.ASYNC_DEADLINE_S), tracer.span(f"background.{name}"):
+                await adapter.continue_conversation(reference, work, bot_id=settings.MICROSOFT_APP_ID)
+
+        if not background.submit(job, name=name):
+            if pending is not None:
+                pending.cancel()
+            ERRORS.inc("queue_full")
+            await turn_context.send_activity(BUSY_MESSAGE)
+
+    async def _start_fanout(
+        self, turn_context: TurnContext, query: str, datasets: tuple[str, ...], fresh: bool
+    ):
+        if len(datasets) > settings.N2SQL_FANOUT_MAX:
+            await turn_context.send_activity(
+                f"Puedes consultar hasta {settings.N2SQL_FANOUT_MAX} datasets a la vez."
+            )
+            return
+        await self._dispatch(
+            turn_context,
+            "n2sql_fanout",
+            lambda turn: self._run_fanout(turn, query, datasets, fresh),
+            ack=f"Entendido. Consultando {', '.join(datasets)}…",
+            slow=any(_slow_dataset(d) for d in datasets),
+        )
+
+    async def _run_fanout(self, turn_context: TurnContext, query: str, datasets: tuple[str, ...], fresh: bool):
+        """La misma consulta en varios datasets a la vez, con un vencimiento común.
+
+        Se responde con lo que haya llegado a tiempo; los datasets que fallan o
+        no alcanzan se nombran al final. No ofrece "Ver más". Todas las
+        consultas comparten un cupo de admisión: con el límite por usuario por
+        debajo de ``N2SQL_FANOUT_MAX`` no se esperarían entre ellas.
+        """
+        rows = settings.N2SQL_MAX_ROWS
+        if settings.N2SQL_PAGINATION:
+            options: dict[str, Any] = {"limit": rows + 1, "offset": 0}
+        else:
+            options = {"keep_rows": rows}
+
+        shared = admission.shared_slot(*_admission_key(turn_context.activity))
+
+        async def ask(dataset: str) -> dict[str, Any]:
+            return await self._ask(turn_context, query, admit=shared, dataset=dataset, fresh=fresh, **options)
+
+        result = await fan_out(ask, datasets, settings.N2SQL_FANOUT_DEADLINE_S)
+        chunks = render_fanout(result, settings.N2SQL_FANOUT_LAYOUT.lower(), rows)
+        await self._last_query_accessor.set(
+            turn_context, {"query": query, "datasets": list(datasets), "stage": "done"}
+        )
+        await self._send_markdown(turn_context, chunks)
+        await self._save_state(turn_context)
+
+    async def _ask(
+        self, turn_context: TurnContext, query: str, admit: Any = None, **kwargs: Any
+    ) -> dict[str, Any]:
+        """``client.ask`` con control de admisión (cupos global, por usuario y conversación).
+
+        El cupo se toma solo para la llamada a N2SQL: lo que sale de la caché
+        no espera cupo ni puede rechazarse por falta de él. ``admit`` reemplaza
+        el cupo propio (p. ej. el compartido de un fan-out).
+        """
+        if admit is None:
+            user, conversation = _admission_key(turn_context.activity)
+            admit = lambda: admission.slot(user, conversation)  # noqa: E731
+        return await client.ask(query, admit=admit, **kwargs)
+
     async def _run_query(
         self,
         turn_context: TurnContext,
         query: str,
         dataset: str | None,
-        announce: bool = True,
+        fresh: bool = False,
+        pending: Awaitable[dict[str, Any]] | None = None,
     ):
-        if announce:
-            await turn_context.send_activity("Entendido. Consultando…")
+        """Consulta y responde. ``pending`` es la llamada heredada de un turno en línea vencido."""
+        paged = settings.N2SQL_PAGINATION
+        if pending is None:
+            if paged:
+                # Pedimos una fila extra para saber si hay más aunque N2SQL no devuelva rowcount.
+                options: dict[str, Any] = {"limit": settings.N2SQL_MAX_ROWS + 1, "offset": 0}
+            else:
+                options = {"keep_rows": settings.N2SQL_MAX_ROWS}
+            pending = self._ask(turn_context, query, dataset=dataset, fresh=fresh, **options)
         try:
-            payload = await client.ask(query, dataset=dataset)
+            payload = await _within_turn(
+                pending, lambda fetch: lambda turn: self._run_query(turn, query, dataset, fresh, pending=fetch)
+            )
+        except _TurnHandoff:
+            raise
+        except AdmissionRejected:
+            ERRORS.inc("admission_rejected")
+            await turn_context.send_activity(BUSY_MESSAGE)
+            return
+        except DeadlineExceeded:
+            await turn_context.send_activity(
+                "No pude resolver la consulta ahora. Inténtalo de nuevo más tarde."
+            )
+            return
         except Exception:
             await turn_context.send_activity(
                 "No pude resolver la consulta ahora. Inténtalo de nuevo más tarde."
             )
             return
 
-        await self._last_query_accessor.set(
-            turn_context,
-            {"payload": payload, "query": query, "dataset": dataset, "stage": "initial"},
-        )
-        md = format_n2sql_payload(payload)
-        await turn_context.send_activity(Activity(text=md, text_format="markdown"))
-        await self.conversation_state.save_changes(turn_context)
+        if paged:
+            # Solo guardamos el cursor: las páginas siguientes se piden a N2SQL.
+            last = {
+                "query": query,
+                "dataset": dataset,
+                "stage": "initial",
+                "paged": True,
+                "shown": settings.N2SQL_MAX_ROWS,
+                "total": payload.get("rowcount"),
+            }
+            has_more = self._has_more_rows(payload)
+            page = ResultSet.from_payload(payload)
+            if page is None:
+                chunks = [format_n2sql_payload(payload)]
+            else:
+                chunks = page.render_chunks(
+                    0, settings.N2SQL_MAX_ROWS, total=payload.get("rowcount"), more=has_more, explicit_limit=False
+                )
+        else:
+            result = ResultSet.from_payload(payload)
+            if result is None:
+                last = {"query": query, "dataset": dataset, "stage": "done"}
+                has_more = False
+                chunks = [format_n2sql_payload(payload)]
+            else:
+                # Normalizamos una sola vez; "Ver más" reutiliza las columnas guardadas.
+                shown = min(settings.N2SQL_MAX_ROWS, result.total)
+                last = {
+                    "result": result.to_state(),
+                    "query": query,
+                    "dataset": dataset,
+                    "stage": "initial",
+                    "shown": shown,
+                }
+                has_more = result.total > settings.N2SQL_MAX_ROWS
+                chunks = result.render_chunks(0, shown, total=result.total, explicit_limit=False)
+        await self._last_query_accessor.set(turn_context, last)
+        await self._send_markdown(turn_context, chunks)
+        await self._save_state(turn_context)
 
-        if self._has_more_rows(payload):
+        if has_more:
             try:
-                await self._send_more_button(turn_context)
+                await self._send_more_button(turn_context, query)
             except Exception as exc:
                 log.warning("No se pudo enviar el botón 'Ver más filas': %s", exc)
 
@@ -186,183 +373,191 @@ class TeamsGatewayBot(ActivityHandler):
                 total = len(rows)
         return int(total or 0)
 
-    async def _send_more_rows(self, turn_context: TurnContext):
+    async def _send_more_rows(self, turn_context: TurnContext, query: str | None = None):
         last = await self._last_query_accessor.get(turn_context, None)
+        MORE_ROWS.inc(last.get("stage", "initial") if last else "expired")
         if not last:
-            await turn_context.send_activity("No hay ninguna consulta previa para ampliar.")
+            if query:
+                # El estado de la conversación se expulsó (memoria/TTL): pedimos re-ejecutar.
+                await turn_context.send_activity(
+                    f"Los resultados de `{query}` expiraron. Vuelve a ejecutar la consulta para ver más filas."
+                )
+            else:
+                await turn_context.send_activity("No hay ninguna consulta previa para ampliar.")
+            return
+        if last.get("paged"):
+            await self._send_more_pages(turn_context, last)
             return
-        payload = last.get("payload")
-        if not payload:
+        result = self._stored_result(last)
+        if result is None:
             await turn_context.send_activity("No pude recuperar los resultados anteriores.")
             return
-        total = self._total_rows(payload)
+        total = result.total
         if not total:
             await turn_context.send_activity("No tengo más filas para mostrar.")
             return
 
         stage = last.get("stage", "initial")
+        default_shown = settings.N2SQL_MAX_ROWS if stage == "initial" else settings.N2SQL_MAX_ROWS_EXPANDED
+        shown = min(int(last.get("shown") or default_shown), total)
         show_more = False
         if stage == "initial":
             target_rows = min(settings.N2SQL_MAX_ROWS_EXPANDED, total)
             next_stage = "expanded"
             show_more = total > target_rows
-        elif stage == "expanded":
+        elif stage == "expanded" and total > shown:
             target_rows = total
             next_stage = "done"
         else:
             await turn_context.send_activity("Ya estás viendo todas las filas disponibles.")
             return
 
-        md = format_n2sql_payload(payload, max_rows=target_rows)
-        await turn_context.send_activity(Activity(text=md, text_format="markdown"))
+        if result.truncated and result.materialized < target_rows:
+            # Streaming sin spill: solo se contaron las filas; las pedimos de nuevo.
+            try:
+                payload = await self._ask(
+                    turn_context, last["query"], dataset=last.get("dataset"), keep_rows=target_rows
+                )
+            except AdmissionRejected:
+                ERRORS.inc("admission_rejected")
+                await turn_context.send_activity(BUSY_MESSAGE)
+                return
+            except Exception:
+                await turn_context.send_activity(
+                    "No pude recuperar más filas ahora. Inténtalo de nuevo más tarde."
+                )
+                return
+            refreshed = ResultSet.from_payload(payload)
+            if refreshed is not None:
+                result = refreshed
+                last["result"] = result.to_state()
+
+        # Solo se renderiza el tramo nuevo [shown, target_rows).
+        await self._send_markdown(turn_context, result.render_chunks(shown, target_rows, total=total))
         last["stage"] = next_stage
+        last["shown"] = target_rows
         await self._last_query_accessor.set(turn_context, last)
-        await self.conversation_state.save_changes(turn_context)
+        await self._save_state(turn_context)
 
         if show_more:
-            await self._send_more_button(turn_context)
+            await self._send_more_button(turn_context, last.get("query"))
 
-    async def _send_more_button(self, turn_context: TurnContext):
-        # Enviar tarjeta con botón "Ver más" para que el usuario amplíe resultados.
-        card = HeroCard(
-            text="Hay más filas disponibles:",
-            buttons=[
-                CardAction(
-                    type=ActionTypes.message_back,
-                    title="Ver más filas",
-                    text="ver_mas_filas",
-                    display_text="Ver más filas",
-                    value={"action": "n2sql_more"},
-                )
-            ],
+    async def _save_state(self, turn_context: TurnContext, attempts: int = 3):
+        """Guarda el estado; si otro turno de la conversación guardó antes, reaplica el nuestro.
+
+        Con ``STATE_BACKEND=sqlite`` el estado lleva etag y dos turnos a la vez
+        (un doble "Ver más", una consulta y un clic) chocan con ``Etag
+        conflict``. Gana el último en guardar, como con el estado en memoria,
+        pero sin un 500 que haga a Teams reenviar la actividad.
+        """
+        for attempt in range(attempts):
+            try:
+                await self.conversation_state.save_changes(turn_context)
+                return
+            except KeyError as exc:
+                if "Etag conflict" not in str(exc) or attempt == attempts - 1:
+                    raise
+                log.info("Conflicto de etag al guardar el estado; se recarga y reintenta")
+                last = await self._last_query_accessor.get(turn_context, None)
+                await self.conversation_state.load(turn_context, force=True)
+                await self._last_query_accessor.set(turn_context, last)
+
+    async def _send_markdown(self, turn_context: TurnContext, chunks: list[str]):
+        # Cada parte ya cabe en N2SQL_MESSAGE_MAX_BYTES; se envían en orden.
+        for md in chunks:
+            await turn_context.send_activity(Activity(text=md, text_format="markdown"))
+
+    @staticmethod
+    def _stored_result(last: dict[str, Any]) -> ResultSet | None:
+        if last.get("result"):
+            return ResultSet.from_state(last["result"])
+        if last.get("payload"):
+            # Estado guardado antes de la forma columnar.
+            return ResultSet.from_payload(last["payload"])
+        return None
+
+    async def _send_more_pages(self, turn_context: TurnContext, last: dict[str, Any]):
+        """Pide a N2SQL solo el tramo de filas que revela la siguiente etapa."""
+        shown = int(last.get("shown") or settings.N2SQL_MAX_ROWS)
+        total = last.get("total")
+        stage = last.get("stage", "initial")
+        if stage == "initial":
+            target_rows = settings.N2SQL_MAX_ROWS_EXPANDED
+            if total is not None:
+                target_rows = min(target_rows, total)
+            next_stage = "expanded"
+        elif stage == "expanded" and (total is None or total > shown):
+            target_rows = total
+            next_stage = "done"
+        else:
+            await turn_context.send_activity("Ya estás viendo todas las filas disponibles.")
+            return
+
+        limit = None if target_rows is None else target_rows - shown
+        if limit is not None and limit <= 0:
+            await turn_context.send_activity("No tengo más filas para mostrar.")
+            return
+        try:
+            page = await self._ask(
+                turn_context,
+                last["query"],
+                dataset=last.get("dataset"),
+                limit=None if limit is None else limit + 1,
+                offset=shown,
+            )
+        except AdmissionRejected:
+            ERRORS.inc("admission_rejected")
+            await turn_context.send_activity(BUSY_MESSAGE)
+            return
+        except Exception:
+            await turn_context.send_activity(
+                "No pude recuperar más filas ahora. Inténtalo de nuevo más tarde."
+            )
+            return
+
+        fetched = self._page_rows(page)
+        if not fetched:
+            await turn_context.send_activity("No tengo más filas para mostrar.")
+            return
+        if total is None and page.get("rowcount") is not None:
+            total = int(page["rowcount"])
+        if total is None and (limit is None or fetched <= limit):
+            # Sin fila extra: llegamos al final del resultado.
+            total = shown + fetched
+        if limit is None:
+            limit = fetched
+        show_more = next_stage == "expanded" and (
+            total > shown + limit if total is not None else fetched > limit
         )
+        result = ResultSet.from_payload(page)
+        if result is None:
+            chunks = [format_n2sql_payload(page)]
+        else:
+            chunks = result.render_chunks(0, limit, offset=shown, total=total, more=show_more)
+        await self._send_markdown(turn_context, chunks)
+        last.update(stage=next_stage, shown=shown + min(limit, fetched), total=total)
+        await self._last_query_accessor.set(turn_context, last)
+        await self._save_state(turn_context)
+
+        if show_more:
+            await self._send_more_button(turn_context, last.get("query"))
+
+    @staticmethod
+    def _page_rows(payload: dict[str, Any]) -> int:
+        rows = payload.get("rows") or payload.get("data")
+        return len(rows) if isinstance(rows, list) else 0
+
+    async def _send_more_button(self, turn_context: TurnContext, query: str | None = None):
+        # Enviar tarjeta con botón "Ver más" para que el usuario amplíe resultados.
         attachment = Attachment(
             content_type="application/vnd.microsoft.card.hero",
-            content=card.serialize(),
+            content=more_card_content(query),
         )
         message = MessageFactory.attachment(attachment)
         await turn_context.send_activity(message)
 
     async def _send_faq_card(self, turn_context: TurnContext):
-        if not FAQ_GROUPS:
+        attachment = faq_catalog.attachment()
+        if attachment is None:
             return
-
-        def _chunk(seq: list[Any], size: int) -> list[list[Any]]:
-            return [seq[i : i + size] for i in range(0, len(seq), size)]
-
-        body: list[dict[str, Any]] = [
-            {
-                "type": "TextBlock",
-                "text": "Preguntas frecuentes",
-                "weight": "Bolder",
-                "size": "Medium",
-            },
-            {
-                "type": "TextBlock",
-                "text": "Selecciona una consulta rápida:",
-                "isSubtle": True,
-                "wrap": True,
-                "spacing": "Small",
-            },
-        ]
-
-        enumerated_groups = list(enumerate(FAQ_GROUPS))
-        for row in _chunk(enumerated_groups, 2):
-            columns: list[dict[str, Any]] = []
-            row_containers: list[dict[str, Any]] = []
-            for idx, group in row:
-                section_id = f"faq_section_{idx}"
-                column = {
-                    "type": "Column",
-                    "width": "auto",
-                    "items": [
-                        {
-                            "type": "ActionSet",
-                            "spacing": "None",
-                            "actions": [
-                                {
-                                    "type": "Action.ToggleVisibility",
-                                    "title": group["title"],
-                                    "style": "positive",
-                                    "targetElements": [section_id],
-                                }
-                            ],
-                        }
-                    ],
-                }
-                columns.append(column)
-
-                group_items = []
-                for item in group["items"]:
-                    group_items.append(
-                        {
-                            "type": "Container",
-                            "separator": True,
-                            "spacing": "Medium",
-                            "items": [
-                                {
-                                    "type": "TextBlock",
-                                    "text": f"**{item['title']}**",
-                                    "wrap": True,
-                                },
-                                {
-                                    "type": "TextBlock",
-                                    "text": item.get("desc", ""),
-                                    "isSubtle": True,
-                                    "spacing": "None",
-                                    "wrap": True,
-                                },
-                                {
-                                    "type": "ActionSet",
-                                    "spacing": "Small",
-                                    "actions": [
-                                        {
-                                            "type": "Action.Submit",
-                                            "title": "Ejecutar",
-                                            "data": {
-                                                "action": "n2sql_faq",
-                                                "query": item.get("query"),
-                                            },
-                                        }
-                                    ],
-                                },
-                            ],
-                        }
-                    )
-
-                row_containers.append(
-                    {
-                        "type": "Container",
-                        "id": section_id,
-                        "isVisible": False,
-                        "style": "emphasis",
-                        "bleed": True,
-                        "spacing": "Small",
-                        "items": group_items,
-                    }
-                )
-
-            # If we had only one column in the last row, add an empty column for spacing
-            if len(columns) == 1:
-                columns.append({"type": "Column", "width": "stretch", "items": []})
-
-            body.append(
-                {
-                    "type": "ColumnSet",
-                    "horizontalAlignment": "Left",
-                    "spacing": "Small",
-                    "columns": columns,
-                }
-            )
-            body.extend(row_containers)
-
-        card = {
-            "type": "AdaptiveCard",
-            "version": "1.5",
-            "body": body,
-        }
-        attachment = Attachment(
-            content_type="application/vnd.microsoft.card.adaptive",
-            content=card,
-        )
         await turn_context.send_activity(MessageFactory.attachment(attachment))
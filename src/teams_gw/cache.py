@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .metrics import CACHE_LOOKUPS
+from .settings import settings
+
+log = logging.getLogger("teams_gw.cache")
+
+
+def normalize_intent(text: str) -> str:
+    """Pliega mayúsculas, acentos y espacios: "Facturas  Pendientes" == "facturas pendientes"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+
+def _estimate_size(payload: Any) -> int:
+    try:
+        return len(json.dumps(payload, default=str, separators=(",", ":"), ensure_ascii=False))
+    except (TypeError, ValueError):
+        return len(repr(payload))
+
+
+class _Inflight:
+    """Llamada upstream en curso y cuántos turnos esperan su resultado."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self) -> None:
+        self.task: "asyncio.Future[Dict[str, Any]]"
+        self.waiters = 0
+
+
+class ResultCache:
+    """Caché TTL/LRU de respuestas N2SQL con coalescencia de peticiones en vuelo.
+
+    Las entradas se indexan por (dataset, intención normalizada, extra) y se
+    expulsan por antigüedad de uso cuando se supera ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        default_ttl_s: float,
+        ttls: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.default_ttl_s = default_ttl_s
+        self.ttls = dict(ttls or {})
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Inflight] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls) -> "ResultCache":
+        return cls(
+            max_bytes=settings.N2SQL_CACHE_MAX_BYTES,
+            default_ttl_s=settings.N2SQL_CACHE_TTL_S,
+            ttls=settings.cache_ttls,
+        )
+
+    def ttl_for(self, dataset: str) -> float:
+        return self.ttls.get(dataset.lower(), self.default_ttl_s)
+
+    @staticmethod
+    def key(dataset: str, question: str, extra: Hashable = ()) -> Tuple[Hashable, ...]:
+        return (dataset.lower(), normalize_intent(question), extra)
+
+    def _get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, payload = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _put(self, key: Hashable, payload: Dict[str, Any], ttl_s: float) -> None:
+        size = _estimate_size(payload)
+        if size > self.max_bytes:
+            log.debug("Resultado de %s bytes excede el presupuesto de caché; no se guarda.", size)
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl_s, size, payload)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, _ = next(iter(self._entries.items()))
+            self._drop(old_key)
+            self.evictions += 1
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        ttl_s: float,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        fresh: bool = False,
+    ) -> Dict[str, Any]:
+        if ttl_s > 0 and not fresh:
+            cached = self._get(key)
+            if cached is not None:
+                self.hits += 1
+                CACHE_LOOKUPS.inc("hit")
+                return cached
+
+        flight = self._inflight.get(key)
+        if flight is not None:
+            # Misma consulta en curso: compartimos la llamada upstream.
+            self.coalesced += 1
+            CACHE_LOOKUPS.inc("coalesced")
+        else:
+            self.misses += 1
+            CACHE_LOOKUPS.inc("miss")
+            flight = self._inflight[key] = _Inflight()
+            flight.task = asyncio.ensure_future(self._fetch(key, flight, ttl_s, fetch))
+        return await self._wait(key, flight)
+
+    async def _fetch(
+        self,
+        key: Hashable,
+        flight: "_Inflight",
+        ttl_s: float,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        try:
+            payload = await fetch()
+        finally:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        if ttl_s > 0:
+            self._put(key, payload, ttl_s)
+        return payload
+
+    async def _wait(self, key: Hashable, flight: "_Inflight") -> Dict[str, Any]:
+        """Espera la llamada compartida sin atarla a la tarea de quien la inició.
+
+        Cancelar a un interesado (cliente desconectado, fan-out vencido) no
+        cancela a los demás; si era el último, se cancela la llamada upstream.
+        """
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+        }
+
+
+result_cache = ResultCache.from_settings()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import re
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+from .settings import settings
+
+
+def _alternation(words: Set[str]) -> str:
+    # Las alternativas más largas primero: "dtx" no debe perder ante "dt".
+    words = sorted((w for w in words if w), key=len, reverse=True)
+    return "|".join(re.escape(w) for w in words) or "(?!)"
+
+
+def _dataset_names(raw: str) -> List[str]:
+    """``"odoo, crm,ODOO"`` → ``["odoo", "crm"]`` (sin vacíos ni repetidos)."""
+    names: List[str] = []
+    seen: Set[str] = set()
+    for name in raw.split(","):
+        name = name.strip()
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return names
+
+
+class ParsedCommand(NamedTuple):
+    trigger: str  # base del trigger en minúsculas ("dt", "n2sql", "consulta")
+    query: str
+    dataset: Optional[str] = None
+    fresh: bool = False  # "dt!:" / "dt[odoo]!:" ignora la caché
+    datasets: Tuple[str, ...] = ()  # fan-out "dt[odoo,crm]:" (dos o más; ``dataset`` queda en None)
+
+
+class CommandParser:
+    """Reconoce los triggers de N2SQL en una sola pasada.
+
+    Se compila una vez a partir de ``N2SQL_TRIGGERS`` y acepta:
+    - "dt: consulta ..."
+    - "dt[odoo]: consulta ..."
+    - "dt!: consulta ..." / "dt[odoo]!: ..."
+    - "dt[odoo,crm]: consulta ..." (la misma consulta en varios datasets)
+    - "consulta ...", "n2sql: ..." (prefijos simples)
+    """
+
+    def __init__(self, triggers: List[str]) -> None:
+        bases = {t.lower().rstrip(":").strip() for t in triggers}
+        prefixes = {t.lower() for t in triggers}
+        self._header = re.compile(
+            rf"(?P<trigger>{_alternation(bases)})"
+            r"(?:\[(?P<dataset>[^\]:]*)(?P<close>\])?[^:!]*)?"
+            r"\s*(?P<fresh>!)?\s*:(?P<query>.*)",
+            re.IGNORECASE | re.DOTALL,
+        )
+        self._prefix = re.compile(rf"(?P<prefix>{_alternation(prefixes)})(?P<query>.*)", re.IGNORECASE | re.DOTALL)
+
+    def parse(self, text: Optional[str]) -> Optional[ParsedCommand]:
+        """Devuelve el comando o None si el texto no empieza con un trigger."""
+        if not text:
+            return None
+        t = text.strip()
+        m = self._header.match(t)
+        if m is not None:
+            names = _dataset_names(m.group("dataset") or "") if m.group("close") else []
+            return ParsedCommand(
+                trigger=m.group("trigger").lower(),
+                query=m.group("query").strip(),
+                dataset=names[0] if len(names) == 1 else None,
+                fresh=m.group("fresh") is not None,
+                datasets=tuple(names) if len(names) > 1 else (),
+            )
+        m = self._prefix.match(t)
+        if m is not None:
+            return ParsedCommand(
+                trigger=m.group("prefix").lower().rstrip(":").strip(),
+                query=m.group("query").strip(),
+            )
+        return None
+
+
+command_parser = CommandParser(settings.triggers)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AbstractSet, Any, Deque, Dict, Iterator, Optional
+
+from .metrics import dataset_label
+from .settings import settings
+
+log = logging.getLogger("teams_gw.deadlines")
+
+# Presupuesto restante del turno en milisegundos, para que N2SQL cancele la consulta al vencer.
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+_deadline: ContextVar[Optional[float]] = ContextVar("teams_gw_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Se agotó el presupuesto del turno antes (o durante) la llamada a N2SQL."""
+
+
+@contextmanager
+def turn_deadline(budget_s: float) -> Iterator[float]:
+    """Fija el vencimiento del turno actual (reloj monotónico) mientras dure el bloque.
+
+    Un trabajo en segundo plano hereda el contexto del turno: abre su propio
+    bloque para no cargar con el vencimiento del request HTTP.
+    """
+    deadline = time.monotonic() + budget_s
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Segundos que le quedan al turno (None fuera de un turno con presupuesto)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _percentile(ordered: list, pct: float) -> float:
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class AdaptiveTimeouts:
+    """Timeout de N2SQL por dataset a partir de las latencias observadas.
+
+    Con al menos ``min_samples`` muestras, el timeout es el percentil
+    ``percentile`` multiplicado por ``multiplier``, acotado entre ``min_s`` y el
+    timeout estático (``N2SQL_TIMEOUT_S``). Un dataset cuya mediana supera
+    ``slow_s`` se considera lento: sus consultas van a segundo plano. También
+    lo es si sus últimas ``slow_streak`` consultas tardaron ``slow_s`` o más,
+    para no esperar ``min_samples`` fallas de un dataset que no cabe en el
+    turno. Con ``datasets``, los desconocidos comparten las muestras de ``other``.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        static_s: float,
+        percentile: float,
+        multiplier: float,
+        min_s: float,
+        min_samples: int,
+        window: int,
+        slow_s: float,
+        slow_streak: int = 0,
+        datasets: Optional[AbstractSet[str]] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.static_s = static_s
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_s = min_s
+        self.min_samples = max(min_samples, 1)
+        self.window = window
+        self.slow_s = slow_s
+        self.slow_streak = slow_streak
+        self.datasets = datasets
+        self._samples: Dict[str, Deque[float]] = {}
+        self._streaks: Dict[str, int] = {}
+
+    @classmethod
+    def from_settings(cls) -> "AdaptiveTimeouts":
+        return cls(
+            enabled=settings.N2SQL_ADAPTIVE_TIMEOUTS,
+            static_s=float(settings.N2SQL_TIMEOUT_S),
+            percentile=settings.N2SQL_TIMEOUT_PERCENTILE,
+            multiplier=settings.N2SQL_TIMEOUT_MULTIPLIER,
+            min_s=settings.N2SQL_TIMEOUT_MIN_S,
+            min_samples=settings.N2SQL_LATENCY_MIN_SAMPLES,
+            window=settings.N2SQL_LATENCY_WINDOW,
+            slow_s=settings.N2SQL_SLOW_DATASET_S,
+            slow_streak=settings.N2SQL_SLOW_DATASET_STREAK,
+            datasets=settings.known_datasets,
+        )
+
+    def observe(self, dataset: str, seconds: float) -> None:
+        """Registra una latencia; un timeout se registra como su cota inferior."""
+        dataset = dataset_label(dataset, self.datasets)
+        samples = self._samples.get(dataset)
+        if samples is None:
+            samples = self._samples[dataset] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._streaks[dataset] = self._streaks.get(dataset, 0) + 1 if seconds >= self.slow_s else 0
+
+    def _ordered(self, dataset: str) -> Optional[list]:
+        samples = self._samples.get(dataset_label(dataset, self.datasets))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return sorted(samples)
+
+    def timeout_for(self, dataset: str) -> float:
+        ordered = self._ordered(dataset) if self.enabled else None
+        if ordered is None:
+            return self.static_s
+        return min(max(_percentile(ordered, self.percentile) * self.multiplier, self.min_s), self.static_s)
+
+    def is_slow(self, dataset: str) -> bool:
+        if not self.enabled:
+            return False
+        streak = self._streaks.get(dataset_label(dataset, self.datasets), 0)
+        if self.slow_streak and streak >= self.slow_streak:
+            return True
+        ordered = self._ordered(dataset)
+        return ordered is not None and _percentile(ordered, 50) >= self.slow_s
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for dataset in sorted(self._samples):
+            samples = sorted(self._samples[dataset])
+            out[dataset] = {
+                "samples": len(samples),
+                "p50_s": round(_percentile(samples, 50), 3),
+                "p99_s": round(_percentile(samples, 99), 3),
+                "timeout_s": round(self.timeout_for(dataset), 3),
+                "slow": self.is_slow(dataset),
+            }
+        return out
+
+
+dataset_timeouts = AdaptiveTimeouts.from_settings()
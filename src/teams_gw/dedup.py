@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.dedup")
+
+
+def activity_key(activity: Any) -> Optional[str]:
+    """Clave de deduplicación: id de conversación + id de actividad (None si falta).
+
+    Acepta un ``Activity`` o un ``InboundActivity`` (``conversation_id`` plano).
+    """
+    activity_id = getattr(activity, "id", None)
+    conversation_id = getattr(activity, "conversation_id", None)
+    if conversation_id is None:
+        conversation_id = getattr(getattr(activity, "conversation", None), "id", None)
+    if not activity_id or not conversation_id:
+        return None
+    return f"{conversation_id}|{activity_id}"
+
+
+class ActivityDeduplicator:
+    """Índice acotado (LRU + TTL) de actividades ya recibidas.
+
+    Bot Framework reintenta el POST si tardamos en responder. El reintento
+    de una actividad conocida no vuelve a ejecutar el bot: si la original
+    sigue en curso espera su resultado, y si ya terminó recibe la misma
+    respuesta. Si la original falla se olvida la clave para que el próximo
+    reintento sí se procese.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._seen: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+        self.processed = 0
+        self.duplicates = 0
+
+    def _expire(self, now: float) -> None:
+        # El orden de inserción es el de vencimiento. Una entrada vencida pero
+        # aún en curso se salta (su reintento debe esperarla) sin frenar la purga.
+        expired = []
+        for key, (expires_at, future) in self._seen.items():
+            if expires_at > now:
+                break
+            if future.done():
+                expired.append(key)
+        for key in expired:
+            del self._seen[key]
+
+    async def run(self, key: Optional[str], handler: Callable[[], Awaitable[Any]]) -> Any:
+        if key is None:
+            return await handler()
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._seen.get(key)
+        if entry is not None and (entry[0] > now or not entry[1].done()):
+            self.duplicates += 1
+            log.info("Actividad repetida %s: se reutiliza la respuesta original", key)
+            return await asyncio.shield(entry[1])
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._seen[key] = (now + self.ttl_s, future)
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        self.processed += 1
+        try:
+            result = await handler()
+        except asyncio.CancelledError:
+            self.forget(key)
+            future.cancel()
+            raise
+        except Exception as exc:
+            self.forget(key)
+            future.set_exception(exc)
+            # Si nadie más esperaba, evita el aviso "exception was never retrieved".
+            future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+    def forget(self, key: Optional[str]) -> None:
+        if key is not None:
+            self._seen.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "processed": self.processed,
+            "duplicates": self.duplicates,
+        }
+
+
+activity_dedup = ActivityDeduplicator(
+    max_entries=settings.DEDUP_MAX_ENTRIES,
+    ttl_s=settings.DEDUP_TTL_S,
+)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Sequence
+
+import httpx
+
+from .admission import AdmissionRejected
+from .deadlines import DeadlineExceeded, remaining, turn_deadline
+from .formatters import ResultSet, format_n2sql_payload, merge_results
+from .resilience import BreakerOpen
+from .tracing import tracer
+
+log = logging.getLogger("teams_gw.fanout")
+
+Ask = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+class FanOutResult(NamedTuple):
+    payloads: Dict[str, Dict[str, Any]]  # en el orden pedido, solo los que respondieron
+    errors: Dict[str, str]  # dataset → motivo legible
+
+
+def _reason(exc: BaseException) -> str:
+    if isinstance(exc, (DeadlineExceeded, httpx.TimeoutException, asyncio.TimeoutError, asyncio.CancelledError)):
+        return "no respondió a tiempo"
+    if isinstance(exc, BreakerOpen):
+        return "el servicio no está disponible"
+    if isinstance(exc, AdmissionRejected):
+        return "hay demasiadas consultas en curso"
+    return "falló la consulta"
+
+
+async def fan_out(ask: Ask, datasets: Sequence[str], budget_s: float) -> FanOutResult:
+    """Ejecuta ``ask(dataset)`` en paralelo con un vencimiento común.
+
+    El vencimiento es el menor entre ``budget_s`` y lo que le queda al turno;
+    cada consulta lo ve (timeouts y cabecera de deadline de N2SQL) y las que
+    no terminan a tiempo se cancelan. Lo que sí respondió se devuelve igual.
+    """
+    left = remaining()
+    budget = budget_s if left is None else max(min(budget_s, left), 0.0)
+    with turn_deadline(budget), tracer.span("n2sql.fanout", datasets=",".join(datasets)):
+        tasks = {dataset: asyncio.ensure_future(ask(dataset)) for dataset in datasets}
+        _, pending = await asyncio.wait(tasks.values(), timeout=budget)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    payloads: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    for dataset, task in tasks.items():
+        exc = task.exception() if not task.cancelled() else asyncio.CancelledError()
+        if exc is None:
+            payloads[dataset] = task.result()
+        else:
+            errors[dataset] = _reason(exc)
+            log.warning("Fan-out: %s sin resultado (%r)", dataset, exc)
+    return FanOutResult(payloads, errors)
+
+
+def render_fanout(result: FanOutResult, layout: str, max_rows: int) -> List[str]:
+    """Mensajes Markdown del fan-out: tabla unida (``merged``) o una sección por dataset."""
+    tables: Dict[str, ResultSet] = {}
+    other: Dict[str, Dict[str, Any]] = {}
+    for dataset, payload in result.payloads.items():
+        parsed = ResultSet.from_payload(payload)
+        if parsed is not None and parsed.headers:
+            tables[dataset] = parsed
+        else:
+            other[dataset] = payload
+
+    chunks: List[str] = []
+    if layout == "merged" and tables:
+        merged = merge_results(tables, max_rows)
+        chunks.extend(merged.render_chunks(0, merged.materialized, total=merged.total, explicit_limit=False))
+    else:
+        for dataset, table in tables.items():
+            shown = min(max_rows, table.total)
+            parts = table.render_chunks(0, shown, total=table.total, explicit_limit=False)
+            chunks.append(f"**{dataset}**\n\n{parts[0]}")
+            chunks.extend(parts[1:])
+    for dataset, payload in other.items():
+        chunks.append(f"**{dataset}**\n\n{format_n2sql_payload(payload, max_rows=max_rows)}")
+
+    if result.errors:
+        missing = "; ".join(f"{dataset}: {reason}" for dataset, reason in result.errors.items())
+        note = f"_Resultados parciales. Sin respuesta de {missing}._"
+        if chunks:
+            chunks[-1] = f"{chunks[-1]}\n\n{note}"
+        else:
+            chunks.append(f"_No pude obtener resultados ({missing})._")
+    return chunks
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+from botbuilder.schema import Attachment
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.faq")
+
+DEFAULT_CATALOG_PATH = Path(__file__).with_name("faq.json")
+_MISSING = -2  # tamaño centinela: el último stat del catálogo falló
+
+
+def load_catalog(path: Path) -> list[dict[str, Any]]:
+    """Lee el catálogo FAQ (JSON, o YAML si PyYAML está instalado)."""
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() in {".yml", ".yaml"}:
+        try:
+            import yaml
+        except ImportError as exc:  # pragma: no cover - depende del entorno
+            raise RuntimeError("Para catálogos YAML instala PyYAML") from exc
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    groups = data.get("groups") if isinstance(data, dict) else data
+    if not isinstance(groups, list):
+        raise ValueError(f"{path}: se esperaba una lista de grupos o {{\"groups\": [...]}}")
+    for group in groups:
+        if not isinstance(group, dict) or "title" not in group or not isinstance(group.get("items"), list):
+            raise ValueError(f"{path}: grupo inválido {group!r}")
+    return groups
+
+
+def build_faq_card(groups: list[dict[str, Any]]) -> dict[str, Any]:
+    """AdaptiveCard con un botón por grupo y sus consultas rápidas desplegables."""
+
+    def _chunk(seq: list[Any], size: int) -> list[list[Any]]:
+        return [seq[i : i + size] for i in range(0, len(seq), size)]
+
+    body: list[dict[str, Any]] = [
+        {
+            "type": "TextBlock",
+            "text": "Preguntas frecuentes",
+            "weight": "Bolder",
+            "size": "Medium",
+        },
+        {
+            "type": "TextBlock",
+            "text": "Selecciona una consulta rápida:",
+            "isSubtle": True,
+            "wrap": True,
+            "spacing": "Small",
+        },
+    ]
+
+    enumerated_groups = list(enumerate(groups))
+    for row in _chunk(enumerated_groups, 2):
+        columns: list[dict[str, Any]] = []
+        row_containers: list[dict[str, Any]] = []
+        for idx, group in row:
+            section_id = f"faq_section_{idx}"
+            column = {
+                "type": "Column",
+                "width": "auto",
+                "items": [
+                    {
+                        "type": "ActionSet",
+                        "spacing": "None",
+                        "actions": [
+                            {
+                                "type": "Action.ToggleVisibility",
+                                "title": group["title"],
+                                "style": "positive",
+                                "targetElements": [section_id],
+                            }
+                        ],
+                    }
+                ],
+            }
+            columns.append(column)
+
+            group_items = []
+            for item in group["items"]:
+                group_items.append(
+                    {
+                        "type": "Container",
+                        "separator": True,
+                        "spacing": "Medium",
+                        "items": [
+                            {
+                                "type": "TextBlock",
+                                "text": f"**{item['title']}**",
+                                "wrap": True,
+                            },
+                            {
+                                "type": "TextBlock",
+                                "text": item.get("desc", ""),
+                                "isSubtle": True,
+                                "spacing": "None",
+                                "wrap": True,
+                            },
+                            {
+                                "type": "ActionSet",
+                                "spacing": "Small",
+                                "actions": [
+                                    {
+                                        "type": "Action.Submit",
+                                        "title": "Ejecutar",
+                                        "data": {
+                                            "action": "n2sql_faq",
+                                            "query": item.get("query"),
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    }
+                )
+
+            row_containers.append(
+                {
+                    "type": "Container",
+                    "id": section_id,
+                    "isVisible": False,
+                    "style": "emphasis",
+                    "bleed": True,
+                    "spacing": "Small",
+                    "items": group_items,
+                }
+            )
+
+        # If we had only one column in the last row, add an empty column for spacing
+        if len(columns) == 1:
+            columns.append({"type": "Column", "width": "stretch", "items": []})
+
+        body.append(
+            {
+                "type": "ColumnSet",
+                "horizontalAlignment": "Left",
+                "spacing": "Small",
+                "columns": columns,
+            }
+        )
+        body.extend(row_containers)
+
+    return {
+        "type": "AdaptiveCard",
+        "version": "1.5",
+        "body": body,
+    }
+
+
+class CompiledFaq(NamedTuple):
+    groups: list[dict[str, Any]]
+    attachment: Optional[Attachment]
+    mtime_ns: int
+    size: int
+
+
+class FaqCatalog:
+    """Catálogo FAQ compilado una vez a un adjunto listo para enviar.
+
+    Un watcher revisa el archivo cada ``reload_interval_s``; si cambia, se
+    compila en aparte y se reemplaza la referencia de una sola vez. Si el
+    archivo nuevo es inválido se conserva la tarjeta anterior.
+    """
+
+    def __init__(self, path: Path, reload_interval_s: float = 0) -> None:
+        self.path = path
+        self.reload_interval_s = reload_interval_s
+        self._compiled = CompiledFaq([], None, -1, -1)
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+
+    @classmethod
+    def from_settings(cls) -> "FaqCatalog":
+        path = Path(settings.FAQ_CATALOG_PATH) if settings.FAQ_CATALOG_PATH else DEFAULT_CATALOG_PATH
+        return cls(path, reload_interval_s=settings.FAQ_RELOAD_INTERVAL_S)
+
+    @property
+    def groups(self) -> list[dict[str, Any]]:
+        return self._compiled.groups
+
+    def attachment(self) -> Optional[Attachment]:
+        if self._compiled.mtime_ns < 0:
+            self.reload()
+        return self._compiled.attachment
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompila si el archivo cambió. Devuelve True si se cambió la tarjeta."""
+        try:
+            stat = os.stat(self.path)
+        except OSError as exc:
+            # Se recuerda el fallo (mtime 0) para no repetir stat y aviso en cada
+            # mensaje; el watcher lo reintenta y recompila cuando aparezca.
+            if self._compiled.size != _MISSING:
+                log.warning("No se encontró el catálogo FAQ %s: %s", self.path, exc)
+                self._compiled = self._compiled._replace(mtime_ns=0, size=_MISSING)
+            return False
+        current = self._compiled
+        if not force and (stat.st_mtime_ns, stat.st_size) == (current.mtime_ns, current.size):
+            return False
+        try:
+            groups = load_catalog(self.path)
+            attachment = None
+            if groups:
+                attachment = Attachment(
+                    content_type="application/vnd.microsoft.card.adaptive",
+                    content=build_faq_card(groups),
+                )
+        except Exception as exc:
+            log.warning("Catálogo FAQ inválido en %s; se mantiene la versión anterior: %s", self.path, exc)
+            self._compiled = current._replace(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            return False
+        self._compiled = CompiledFaq(groups, attachment, stat.st_mtime_ns, stat.st_size)
+        self.reloads += 1
+        log.info("Catálogo FAQ compilado: %s grupos desde %s", len(groups), self.path)
+        return True
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval_s)
+            self.reload()
+
+    def start(self) -> None:
+        self.reload()
+        if self.reload_interval_s > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch(), name="faq-catalog-watcher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+faq_catalog = FaqCatalog.from_settings()
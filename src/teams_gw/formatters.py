@@ -1,63 +1,384 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+import logging
+from itertools import zip_longest
+from typing import Any, Dict, List, Optional, Sequence
+from .metrics import STAGE_SECONDS
 from .settings import settings
+from .streaming import read_spill
+from .tracing import tracer
 
-def format_n2sql_payload(payload: Dict[str, Any], max_rows: Optional[int] = None) -> str:
-    """Convierte payload a tabla Markdown. Acepta:
-    - {"columns": [...], "rows": [[...]]}
-    - {"data": [{...}, ...]}
-    Si no reconoce el formato, devuelve JSON como bloque.
+log = logging.getLogger("teams_gw.formatters")
+
+
+class ResultSet:
+    """Resultado N2SQL normalizado a columnas, construido una sola vez por consulta.
+
+    Guarda una lista por columna y convierte las celdas a texto solo la
+    primera vez que se renderizan, de modo que "Ver más" añade el tramo
+    nuevo sin recorrer de nuevo las filas ya mostradas.
     """
-    headers: List[str] = []
-    rows: List[List[Any]] = []
-
-    if isinstance(payload, dict) and "columns" in payload and "rows" in payload:
-        headers = [str(c) for c in payload.get("columns", []) if c is not None]
-        rows_data = payload.get("rows", []) or []
-        if rows_data and isinstance(rows_data[0], dict):
-            if not headers:
-                headers = list(rows_data[0].keys())
-            rows = [[row.get(h) for h in headers] for row in rows_data]
-        else:
-            rows = rows_data
-    elif isinstance(payload, dict) and isinstance(payload.get("rows"), list) and payload["rows"]:
-        first = payload["rows"][0]
-        if isinstance(first, dict):
-            headers = list(first.keys())
-            rows = [[item.get(h) for h in headers] for item in payload["rows"]]
-        elif isinstance(first, (list, tuple)):
+
+    __slots__ = ("headers", "columns", "rowcount", "sql", "dict_rows", "spill", "_cells")
+
+    def __init__(
+        self,
+        headers: List[str],
+        columns: List[List[Any]],
+        rowcount: Optional[int] = None,
+        sql: Optional[str] = None,
+        dict_rows: bool = False,
+        spill: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.headers = headers
+        self.columns = columns
+        self.rowcount = rowcount
+        self.sql = sql
+        self.dict_rows = dict_rows
+        self.spill = spill
+        self._cells: List[List[str]] = [[] for _ in headers]
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> Optional["ResultSet"]:
+        """Detecta la forma del payload. Devuelve None si no la reconoce."""
+        if not isinstance(payload, dict):
+            return None
+        headers: List[str] = []
+        rows: Sequence[Any] = []
+        dict_rows = False
+
+        if "columns" in payload and "rows" in payload:
+            headers = [str(c) for c in payload.get("columns", []) if c is not None]
+            rows = payload.get("rows", []) or []
+            if rows and isinstance(rows[0], dict):
+                dict_rows = True
+                if not headers:
+                    headers = list(rows[0].keys())
+        elif isinstance(payload.get("rows"), list) and payload["rows"]:
             rows = payload["rows"]
-    elif isinstance(payload, dict) and isinstance(payload.get("data"), list) and payload["data"]:
-        first = payload["data"][0]
-        if isinstance(first, dict):
-            headers = list(first.keys())
-            rows = [[item.get(h) for h in headers] for item in payload["data"]]
-    else:
-        return f"````json\n{payload}\n````"
+            first = rows[0]
+            if isinstance(first, dict):
+                dict_rows = True
+                headers = list(first.keys())
+            elif not isinstance(first, (list, tuple)):
+                rows = []
+        elif isinstance(payload.get("data"), list) and payload["data"]:
+            rows = payload["data"]
+            if isinstance(rows[0], dict):
+                dict_rows = True
+                headers = list(rows[0].keys())
+            else:
+                rows = []
+        else:
+            return None
 
-    total = len(rows)
-    limit = max_rows or settings.N2SQL_MAX_ROWS
-    rows = rows[: limit]
+        rowcount = payload.get("rowcount")
+        return cls(
+            headers,
+            cls._to_columns(headers, rows, dict_rows),
+            rowcount=int(rowcount) if rowcount is not None else None,
+            sql=payload.get("sql") or payload.get("generated_sql") or payload.get("sql_text"),
+            dict_rows=dict_rows,
+            spill=payload.get("spill") or None,
+        )
+
+    @staticmethod
+    def _to_columns(headers: List[str], rows: Sequence[Any], dict_rows: bool) -> List[List[Any]]:
+        if not headers:
+            return []
+        if dict_rows:
+            return [[row.get(h) for row in rows] for h in headers]
+        width = len(headers)
+        columns = [list(col) for col in zip_longest(*rows)][:width] if rows else []
+        while len(columns) < width:
+            columns.append([None] * len(rows))
+        return columns
+
+    def to_state(self) -> Dict[str, Any]:
+        """Forma JSON compacta para guardar en el estado de la conversación."""
+        return {
+            "headers": self.headers,
+            "columns": self.columns,
+            "rowcount": self.rowcount,
+            "sql": self.sql,
+            "dict_rows": self.dict_rows,
+            "spill": self.spill,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "ResultSet":
+        return cls(
+            state.get("headers") or [],
+            state.get("columns") or [],
+            rowcount=state.get("rowcount"),
+            sql=state.get("sql"),
+            dict_rows=bool(state.get("dict_rows")),
+            spill=state.get("spill"),
+        )
+
+    @property
+    def materialized(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    @property
+    def total(self) -> int:
+        return self.rowcount if self.rowcount is not None else self.materialized
 
-    if not headers:
-        return "_Sin columnas_"
+    @property
+    def truncated(self) -> bool:
+        """Hay filas contadas que no están materializadas ni en el spill."""
+        return not self.spill and self.materialized < self.total
 
-    header_line = " | ".join(headers)
-    sep_line = " | ".join(["---"] * len(headers))
-    body_lines = [" | ".join("" if v is None else str(v) for v in r) for r in rows]
-    table = "\n".join([header_line, sep_line, *body_lines])
+    def ensure_rows(self, upto: int) -> None:
+        """Materializa filas del spill hasta ``upto`` (sin mutar listas compartidas)."""
+        if not self.spill or self.materialized >= upto:
+            return
+        taken = int(self.spill.get("taken", 0))
+        rows = read_spill(self.spill, taken, upto - self.materialized)
+        extra = self._to_columns(self.headers, rows, self.dict_rows)
+        if extra:
+            self.columns = [col + ext for col, ext in zip(self.columns, extra)]
+        taken += len(rows)
+        self.spill = dict(self.spill, taken=taken) if taken < int(self.spill["count"]) else None
 
-    extra = ""
-    if total > len(rows):
-        if max_rows:
-            extra = f"\n\n_Se muestran {len(rows)}/{total} filas._"
+    def _cells_upto(self, stop: int) -> List[List[str]]:
+        cap = settings.N2SQL_CELL_MAX_CHARS
+        for idx, column in enumerate(self.columns):
+            cells = self._cells[idx]
+            if len(cells) < stop:
+                cells.extend(_cell_text(v, cap) for v in column[len(cells):stop])
+        return self._cells
+
+    def _header_lines(self) -> List[str]:
+        return [" | ".join(self.headers), " | ".join(["---"] * len(self.headers))]
+
+    def table(self, start: int, stop: int) -> str:
+        stop = min(stop, self.materialized)
+        cells = self._cells_upto(stop)
+        body_lines = [" | ".join(row) for row in zip(*(c[start:stop] for c in cells))]
+        return "\n".join([*self._header_lines(), *body_lines])
+
+    def _footer(
+        self,
+        start: int,
+        shown: int,
+        offset: int,
+        total: Optional[int],
+        more: bool,
+        explicit_limit: bool,
+        max_bytes: Optional[int] = None,
+    ) -> str:
+        """Pie con el conteo de filas y el SQL; ``max_bytes`` recorta el SQL para que quepa."""
+        extra = ""
+        first = offset + start
+        if first:
+            of_total = f" de {total}" if total is not None else ""
+            extra = f"\n\n_Filas {first + 1}–{first + shown}{of_total}._"
+        elif total is None and more:
+            extra = f"\n\n_Se muestran {shown} filas; hay más disponibles._"
         else:
-            extra = f"\n\n_Se muestran {len(rows)}/{total} filas. Configura `N2SQL_MAX_ROWS` para ver más._"
+            grand = self.materialized if total is None else total
+            if grand > shown:
+                if explicit_limit:
+                    extra = f"\n\n_Se muestran {shown}/{grand} filas._"
+                else:
+                    extra = f"\n\n_Se muestran {shown}/{grand} filas. Configura `N2SQL_MAX_ROWS` para ver más._"
+
+        sql_md = ""
+        if settings.N2SQL_SHOW_SQL and self.sql:
+            sql = self.sql
+            if max_bytes is not None:
+                room = max_bytes - len(extra.encode("utf-8")) - len("\n\n> SQL: ``".encode("utf-8"))
+                if len(sql.encode("utf-8")) > room:
+                    sql = _truncate_bytes(sql, room)
+            sql_md = f"\n\n> SQL: `{sql}`" if sql else ""
+        return f"{extra}{sql_md}"
+
+    def render(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        offset: int = 0,
+        total: Optional[int] = None,
+        more: bool = False,
+        explicit_limit: bool = True,
+    ) -> str:
+        """Tabla Markdown de las filas ``[start, stop)`` con su pie y el SQL.
+
+        ``offset`` desplaza la numeración cuando el ResultSet es una página.
+        """
+        if not self.headers:
+            return "_Sin columnas_"
+        stop = self.materialized if stop is None else stop
+        self.ensure_rows(stop)
+        stop = min(stop, self.materialized)
+        shown = max(stop - start, 0)
+        return self.table(start, stop) + self._footer(start, shown, offset, total, more, explicit_limit)
 
-    sql_md = ""
-    if settings.N2SQL_SHOW_SQL:
-        sql = payload.get("sql") or payload.get("generated_sql") or payload.get("sql_text")
-        if sql:
-            sql_md = f"\n\n> SQL: `{sql}`"
+    def render_chunks(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        offset: int = 0,
+        total: Optional[int] = None,
+        more: bool = False,
+        explicit_limit: bool = True,
+    ) -> List[str]:
+        """Como ``render`` pero partido en mensajes de a lo sumo ``max_bytes`` (UTF-8).
 
-    return f"{table}{extra}{sql_md}"
+        Cada parte repite el encabezado de la tabla; el pie y el SQL van en la
+        última. Si una fila sola no cabe, sus celdas se recortan.
+        """
+        with STAGE_SECONDS.time("render"), tracer.span("render"):
+            return self._render_chunks(start, stop, max_bytes, offset, total, more, explicit_limit)
+
+    def _render_chunks(
+        self,
+        start: int,
+        stop: Optional[int],
+        max_bytes: Optional[int],
+        offset: int,
+        total: Optional[int],
+        more: bool,
+        explicit_limit: bool,
+    ) -> List[str]:
+        if not self.headers:
+            return ["_Sin columnas_"]
+        budget = max_bytes or settings.N2SQL_MESSAGE_MAX_BYTES
+        stop = self.materialized if stop is None else stop
+        self.ensure_rows(stop)
+        stop = min(stop, self.materialized)
+        shown = max(stop - start, 0)
+
+        header = "\n".join(self._header_lines())
+        header_bytes = len(header.encode("utf-8"))
+        row_budget = budget - header_bytes
+        # El pie y el SQL van en la última parte: se reserva su espacio antes de repartir
+        # filas. Un SQL enorme se recorta a media parte para que aún quepan filas.
+        footer = self._footer(start, shown, offset, total, more, explicit_limit, max_bytes=row_budget // 2)
+        footer_bytes = len(footer.encode("utf-8"))
+        cells = self._cells_upto(stop)
+
+        lines: List[str] = []
+        trimmed = 0
+        for row in zip(*(c[start:stop] for c in cells)):
+            line = " | ".join(row)
+            if len(line.encode("utf-8")) + 1 > row_budget:
+                line = _fit_row(row, row_budget - 1)
+                trimmed += 1
+            lines.append(line)
+        sizes = [len(line.encode("utf-8")) + 1 for line in lines]
+
+        # Última parte: las filas finales que caben junto al pie.
+        tail = len(lines)
+        used = header_bytes + footer_bytes
+        while tail > 0 and used + sizes[tail - 1] <= budget:
+            tail -= 1
+            used += sizes[tail]
+
+        chunks: List[str] = []
+        part: List[str] = [header]
+        used = header_bytes
+        for line, size in zip(lines[:tail], sizes[:tail]):
+            if used + size > budget and len(part) > 1:
+                chunks.append("\n".join(part))
+                part, used = [header], header_bytes
+            part.append(line)
+            used += size
+        if len(part) > 1:
+            chunks.append("\n".join(part))
+        chunks.append("\n".join([header, *lines[tail:]]) + footer)
+
+        log.debug(
+            "Markdown renderizado: filas=%s partes=%s bytes=%s presupuesto=%s filas_recortadas=%s",
+            shown,
+            len(chunks),
+            [len(c.encode("utf-8")) for c in chunks],
+            budget,
+            trimmed,
+        )
+        return chunks
+
+
+def merge_results(results: Dict[str, ResultSet], per_dataset: int, label: str = "dataset") -> ResultSet:
+    """Une los resultados de un fan-out en una tabla con una columna ``label``.
+
+    Toma hasta ``per_dataset`` filas de cada uno; las columnas son la unión
+    en orden de aparición y quedan vacías donde un dataset no las tiene.
+    ``rowcount`` es la suma de los totales, para que el pie indique cuántas
+    filas quedaron fuera. Si un resultado ya trae una columna ``label``, la
+    columna agregada se renombra (``_dataset``) en lugar de ocultarla.
+    """
+    headers: List[str] = []
+    for result in results.values():
+        headers.extend(h for h in result.headers if h not in headers)
+    while label in headers:
+        label = f"_{label}"
+    columns: List[List[Any]] = [[] for _ in range(len(headers) + 1)]
+    total = 0
+    for name, result in results.items():
+        result.ensure_rows(per_dataset)
+        taken = min(per_dataset, result.materialized)
+        total += result.total
+        columns[0].extend([name] * taken)
+        by_header = dict(zip(result.headers, result.columns))
+        for idx, header in enumerate(headers, start=1):
+            column = by_header.get(header)
+            columns[idx].extend(column[:taken] if column is not None else [None] * taken)
+    return ResultSet([label, *headers], columns, rowcount=total)
+
+
+def _cell_text(value: Any, cap: int) -> str:
+    if value is None:
+        return ""
+    text = str(value)
+    if cap and len(text) > cap:
+        return text[: max(cap - 1, 0)] + "…"
+    return text
+
+
+def _fit_row(row: Sequence[str], max_bytes: int) -> str:
+    """Recorta las celdas más largas de una fila hasta que quepa en ``max_bytes``."""
+    cells = list(row)
+    sep = len(" | ".encode("utf-8")) * (len(cells) - 1)
+    per_cell = max((max_bytes - sep) // max(len(cells), 1), 1)
+    while True:
+        cells = [c if len(c.encode("utf-8")) <= per_cell else _truncate_bytes(c, per_cell) for c in cells]
+        line = " | ".join(cells)
+        if len(line.encode("utf-8")) <= max_bytes or per_cell <= 1:
+            return line
+        per_cell -= 1
+
+
+def _truncate_bytes(text: str, max_bytes: int) -> str:
+    ellipsis = "…"
+    room = max_bytes - len(ellipsis.encode("utf-8"))
+    if room <= 0:
+        return ellipsis if max_bytes >= len(ellipsis.encode("utf-8")) else ""
+    return text.encode("utf-8")[:room].decode("utf-8", "ignore") + ellipsis
+
+
+def format_n2sql_payload(
+    payload: Dict[str, Any],
+    max_rows: Optional[int] = None,
+    first_row: int = 0,
+    total: Optional[int] = None,
+    more: bool = False,
+) -> str:
+    """Convierte payload a tabla Markdown. Acepta:
+    - {"columns": [...], "rows": [[...]]}
+    - {"data": [{...}, ...]}
+    Si no reconoce el formato, devuelve JSON como bloque.
+
+    Para páginas pedidas a N2SQL, ``first_row`` es la posición de la primera
+    fila en el resultado completo, ``total`` el rowcount (si se conoce) y
+    ``more`` indica que hay filas posteriores aunque no se sepa cuántas.
+    """
+    result = ResultSet.from_payload(payload)
+    if result is None:
+        return f"````json\n{payload}\n````"
+    limit = max_rows or settings.N2SQL_MAX_ROWS
+    with STAGE_SECONDS.time("render"), tracer.span("render"):
+        return result.render(
+            0, limit, offset=first_row, total=total, more=more, explicit_limit=bool(max_rows)
+        )
@@ -1,17 +1,63 @@
 from __future__ import annotations
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from .settings import settings
-import msal, os
+from .admission import admission
+from .background import background
+from .dedup import activity_dedup
+from .metrics import registry
+from .tracing import ring_buffer
+from .n2sql_client import client
+from .cache import result_cache
+from .deadlines import dataset_timeouts
+from .resilience import OPEN, n2sql_resilience
+from .trust import service_url_trust
+from .inbound import FastJSONResponse
+from .warmup import warmup
+import os
 
 router = APIRouter()
 
 @router.get("/__ready")
 async def ready():
-    return {"status": "ok"}
+    # 503 hasta terminar el calentamiento: el primer mensaje no paga el arranque en frío.
+    if not warmup.ready:
+        return FastJSONResponse(status_code=503, content={"status": "warming", "warmup": warmup.stats()})
+    return {"status": "ok", "warmup": warmup.stats()}
 
 @router.get("/health")
 async def health():
-    return {"status": "ok"}
+    # El proceso sigue sano aunque N2SQL no lo esté: solo se informa, no se falla.
+    breakers = n2sql_resilience.stats()
+    open_datasets = sorted(name for name, b in breakers.items() if b["state"] == OPEN)
+    return {"status": "ok", "n2sql": "degraded" if open_datasets else "ok", "n2sql_open_circuits": open_datasets}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/__traces")
+async def traces(limit: int = 20):
+    return {"traces": ring_buffer.slowest(limit)}
+
+@router.get("/__n2sql")
+async def n2sql_stats():
+    return {
+        "pool": client.pool_stats(),
+        "cache": result_cache.stats(),
+        "workers": background.stats(),
+        "admission": admission.stats(),
+        "breakers": n2sql_resilience.stats(),
+        "timeouts": dataset_timeouts.stats(),
+    }
+
+@router.get("/__dedup")
+async def dedup_stats():
+    return activity_dedup.stats()
+
+@router.get("/__trust")
+async def trust_stats():
+    return service_url_trust.stats()
 
 @router.get("/__env")
 async def env_echo():
@@ -33,6 +79,8 @@ async def auth_probe():
     Intenta obtener un token de app para https://api.botframework.com/.default
     Útil para confirmar AppId/Secret (y tenant si aplica).
     """
+    import msal  # solo diagnóstico: no se carga al importar el router
+
     tenant = settings.MICROSOFT_APP_TENANT_ID or "organizations"
     authority = f"https://login.microsoftonline.com/{tenant}"
     app = msal.ConfidentialClientApplication(
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Optional
+
+from botbuilder.schema import Activity
+from fastapi.responses import JSONResponse
+from msrest.serialization import Deserializer, rest_key_extractor
+
+try:  # orjson es opcional: si no está instalado se usa json de la stdlib.
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+# ``Activity().deserialize`` recorre el módulo de modelos por reflexión en cada
+# llamada para armar su Deserializer. Los modelos no cambian: se arma una vez.
+# El cuerpo siempre es JSON, así que sobra el extractor de claves XML.
+_activity_deserializer = Deserializer(Activity._infer_class_models())
+_activity_deserializer.key_extractors = [rest_key_extractor]
+
+
+def loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """``JSONResponse`` que serializa con orjson cuando está disponible."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def deserialize_activity(body: Dict[str, Any]) -> Activity:
+    """Equivale a ``Activity().deserialize(body)`` reutilizando el Deserializer."""
+    return _activity_deserializer("Activity", body)
+
+
+def _id_of(body: Dict[str, Any], field: str) -> Optional[str]:
+    value = body.get(field)
+    return value.get("id") if isinstance(value, dict) else None
+
+
+class InboundActivity:
+    """Vista liviana del JSON entrante con los campos que lee el gateway.
+
+    El log de entrada, la confianza del ``serviceUrl``, la traza y la
+    deduplicación solo necesitan estos campos. El ``Activity`` completo de
+    msrest se construye recién cuando el adapter lo pide (``.activity``), así
+    que los reintentos deduplicados nunca lo construyen.
+    """
+
+    __slots__ = (
+        "body",
+        "id",
+        "type",
+        "channel_id",
+        "service_url",
+        "conversation_id",
+        "from_id",
+        "recipient_id",
+        "_activity",
+    )
+
+    def __init__(self, body: Dict[str, Any]) -> None:
+        self.body = body
+        self.id: Optional[str] = body.get("id")
+        self.type: Optional[str] = body.get("type")
+        self.channel_id: Optional[str] = body.get("channelId")
+        self.service_url: Optional[str] = body.get("serviceUrl")
+        self.conversation_id = _id_of(body, "conversation")
+        self.from_id = _id_of(body, "from")
+        self.recipient_id = _id_of(body, "recipient")
+        self._activity: Optional[Activity] = None
+
+    @classmethod
+    def parse(cls, raw: bytes) -> "InboundActivity":
+        body = loads(raw)
+        if not isinstance(body, dict):
+            raise ValueError("La actividad debe ser un objeto JSON")
+        return cls(body)
+
+    @property
+    def activity(self) -> Activity:
+        if self._activity is None:
+            self._activity = deserialize_activity(self.body)
+        return self._activity
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .settings import settings
+from .tracing import tracer
+
+# Atributos propios de LogRecord: todo lo demás se considera ``extra`` del llamador.
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_CONTEXT_FIELDS = ("trace_id", "conversation_id")
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """``"teams_gw.app=0.1,uvicorn=0.5"`` → ``{"teams_gw.app": 0.1, "uvicorn": 0.5}``."""
+    rates: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip():
+            try:
+                rates[name.strip()] = min(max(float(value), 0.0), 1.0)
+            except ValueError:
+                continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar una fracción de los eventos INFO/DEBUG por logger (prefijo más largo).
+
+    WARNING y superiores nunca se muestrean.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        # Prefijos más largos primero: "teams_gw.app" gana a "teams_gw".
+        self._rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._cache: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        try:
+            return self._cache[name]
+        except KeyError:
+            rate = next(
+                (r for prefix, r in self._rates if name == prefix or name.startswith(prefix + ".")),
+                None,
+            )
+            self._cache[name] = rate
+            return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class ContextQueueHandler(QueueHandler):
+    """Encola el registro sin formatearlo; solo le añade la traza del turno actual.
+
+    El mensaje, la excepción y el JSON se construyen en el hilo del
+    ``QueueListener``. Por eso los argumentos del log deben ser valores que no
+    cambien después de registrar el evento.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        root = tracer.root()
+        if root is not None:
+            record.trace_id = root.trace_id
+            record.conversation_id = root.attrs.get("conversation_id")
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in _CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in _CONTEXT_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging() -> None:
+    """Reemplaza ``basicConfig``: el hilo del listener formatea y escribe en stderr."""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stderr)
+    if settings.LOG_FORMAT.lower() == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = ContextQueueHandler(log_queue)
+    rates = parse_sampling(settings.LOG_SAMPLING)
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Vacía la cola y detiene el hilo del listener.
+
+    Lo que se loguee después (cierre del servidor) se escribe directo en stderr
+    en lugar de quedar en una cola que ya nadie lee.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().handlers = list(_listener.handlers)
+        _listener = None
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import AbstractSet, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Pensadas para latencias de un turno: de 1 ms (parseo) a 30 s (timeout de N2SQL).
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+# Los nombres de dataset vienen de lo que escribe el usuario en ``dt[...]``:
+# los que no están configurados comparten esta etiqueta para acotar la cardinalidad.
+OTHER_DATASET = "other"
+
+
+def dataset_label(dataset: str, known: Optional[AbstractSet[str]]) -> str:
+    """``dataset`` si es conocido (o si no hay lista), si no ``OTHER_DATASET``."""
+    if known is None:
+        return dataset
+    name = dataset.lower()
+    return name if name in known else OTHER_DATASET
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Contador monotónico con etiquetas. ``inc`` es un simple ``dict`` update."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value:g}"
+
+
+class Gauge:
+    """Valor instantáneo con etiquetas (p. ej. el estado de un circuit breaker)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value:g}"
+
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus.
+
+    Cada serie guarda los conteos por bucket sin acumular; la suma acumulada
+    se calcula solo al exportar, para que ``observe`` sea un ``bisect`` y dos
+    sumas.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}  # [bucket..., +Inf, sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> Iterator[str]:
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                le = 'le="%g"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative:g}"
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative:g}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]:.6f}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative:g}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Formato de texto de Prometheus (versión 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(
+    Histogram(
+        "teams_gw_stage_seconds",
+        "Latencia por etapa del turno (parse, deserialize, auth, render, send).",
+        ("stage",),
+    )
+)
+N2SQL_ASK_SECONDS = registry.register(
+    Histogram(
+        "teams_gw_n2sql_ask_seconds",
+        "Latencia de N2SQLClient.ask por dataset y resultado (cache_hit: sin llamada propia a N2SQL).",
+        ("dataset", "status"),
+    )
+)
+TRIGGERS = registry.register(
+    Counter("teams_gw_triggers_total", "Comandos N2SQL recibidos por trigger.", ("trigger",))
+)
+FAQ_CLICKS = registry.register(Counter("teams_gw_faq_clicks_total", "Consultas lanzadas desde la tarjeta FAQ."))
+MORE_ROWS = registry.register(
+    Counter("teams_gw_more_rows_total", "Pulsaciones de \"Ver más filas\" por etapa.", ("stage",))
+)
+CACHE_LOOKUPS = registry.register(
+    Counter("teams_gw_n2sql_cache_lookups_total", "Consultas a la caché de resultados por resultado.", ("result",))
+)
+ERRORS = registry.register(Counter("teams_gw_errors_total", "Errores por tipo.", ("kind",)))
+N2SQL_RETRIES = registry.register(
+    Counter("teams_gw_n2sql_retries_total", "Reintentos a N2SQL por dataset y causa.", ("dataset", "reason"))
+)
+N2SQL_BREAKER_STATE = registry.register(
+    Gauge(
+        "teams_gw_n2sql_breaker_state",
+        "Estado del circuit breaker de N2SQL por dataset (0 cerrado, 1 semiabierto, 2 abierto).",
+        ("dataset",),
+    )
+)
+N2SQL_BREAKER_TRANSITIONS = registry.register(
+    Counter(
+        "teams_gw_n2sql_breaker_transitions_total",
+        "Cambios de estado del circuit breaker de N2SQL por dataset y estado nuevo.",
+        ("dataset", "state"),
+    )
+)
@@ -1,7 +1,20 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional
+import asyncio
+import logging
+import time
+from typing import Any, AsyncContextManager, Callable, Dict, Optional, Set
 import httpx
+from .admission import AdmissionRejected
+from .cache import result_cache
+from .deadlines import DEADLINE_HEADER, DeadlineExceeded, dataset_timeouts, remaining
+from .metrics import ERRORS, N2SQL_ASK_SECONDS, dataset_label
+from .resilience import BreakerOpen, n2sql_resilience
 from .settings import settings
+from .streaming import StreamingPayloadParser
+from .tracing import tracer
+
+log = logging.getLogger("teams_gw.n2sql")
+
 
 class N2SQLClient:
     def __init__(self) -> None:
@@ -11,20 +24,294 @@ class N2SQLClient:
         if settings.N2SQL_API_KEY:
             self.headers["Authorization"] = f"Bearer {settings.N2SQL_API_KEY}"
         self.timeout = settings.N2SQL_TIMEOUT_S
+        self._http: Optional[httpx.AsyncClient] = None
+        self._requests = 0
+        self._connections_opened = 0
+        self.datasets = settings.known_datasets
+        self._unpaged: Set[str] = set()  # datasets cuyo N2SQL no aplica limit/offset
+
+    def _http2_enabled(self) -> bool:
+        if not settings.N2SQL_HTTP2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            log.warning("N2SQL_HTTP2=true pero falta el paquete 'h2'; se usa HTTP/1.1.")
+            return False
+        return True
+
+    async def start(self) -> None:
+        """Abre el cliente HTTP compartido (keep-alive) si aún no existe."""
+        if self._http is not None and not self._http.is_closed:
+            return
+        limits = httpx.Limits(
+            max_connections=settings.N2SQL_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.N2SQL_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.N2SQL_KEEPALIVE_EXPIRY_S,
+        )
+        self._http = httpx.AsyncClient(
+            base_url=self.base,
+            headers=self.headers,
+            timeout=self.timeout,
+            limits=limits,
+            http2=self._http2_enabled(),
+        )
+        log.info(
+            "N2SQL pool abierto → base=%s max_connections=%s keepalive=%s expiry=%ss",
+            self.base,
+            limits.max_connections,
+            limits.max_keepalive_connections,
+            limits.keepalive_expiry,
+        )
+
+    async def warm(self) -> None:
+        """Abre (y deja en el pool) la primera conexión: DNS, TCP y TLS.
+
+        Cualquier respuesta HTTP sirve, incluso un 404; solo importa el socket.
+        """
+        await self.start()
+        assert self._http is not None
+        await self._http.get(settings.N2SQL_WARMUP_PATH, timeout=min(self.timeout, 10))
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _on_trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        # httpcore emite "connection.connect_tcp.complete" solo cuando abre un socket nuevo.
+        if event_name == "connection.connect_tcp.complete":
+            self._connections_opened += 1
 
-    def build_payload(self, question: str, dataset: Optional[str] = None) -> Dict[str, Any]:
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            "open": self._http is not None and not self._http.is_closed,
+            "requests": self._requests,
+            "connections_opened": self._connections_opened,
+            "connections_reused": max(self._requests - self._connections_opened, 0),
+        }
+
+    @staticmethod
+    def dataset_for(dataset: Optional[str]) -> str:
+        return dataset or getattr(settings, "N2SQL_DATASET", "odoo")
+
+    def build_payload(
+        self,
+        question: str,
+        dataset: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> Dict[str, Any]:
         # Contrato de colquisiri_n2sql_service: dataset/intent/params
+        params: Dict[str, Any] = {}
+        if limit is not None:
+            params["limit"] = limit
+        if offset is not None:
+            params["offset"] = offset
+            # En la primera página pedimos también el total (rowcount).
+            params["count"] = offset == 0
         return {
-            "dataset": dataset or getattr(settings, "N2SQL_DATASET", "odoo"),
+            "dataset": self.dataset_for(dataset),
             "intent": question,
-            "params": {},
+            "params": params,
         }
 
-    async def ask(self, question: str, dataset: Optional[str] = None) -> Dict[str, Any]:
-        url = f"{self.base}{self.path}"
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            resp = await client.post(url, json=self.build_payload(question, dataset), headers=self.headers)
-            resp.raise_for_status()
-            return resp.json()
+    async def ask(
+        self,
+        question: str,
+        dataset: Optional[str] = None,
+        fresh: bool = False,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        keep_rows: Optional[int] = None,
+        admit: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Consulta N2SQL pasando por la caché de resultados.
+
+        ``fresh=True`` ignora la entrada cacheada (sintaxis ``dt!:``) y la reemplaza.
+        ``limit``/``offset`` piden una página (requiere ``N2SQL_PAGINATION``).
+        ``keep_rows`` activa el parseo en streaming (``N2SQL_STREAMING``): solo se
+        materializan esas filas y el resto se cuenta (o se comprime en ``spill``).
+        Las fallas transitorias se reintentan y, si el dataset acumula fallas,
+        su circuit breaker responde ``BreakerOpen`` sin esperar a N2SQL. Los
+        aciertos de caché no pasan por el breaker. ``admit`` (p. ej. un cupo de
+        admisión) envuelve solo cada llamada upstream: los aciertos de caché y
+        las consultas coalescidas no lo consumen.
+        """
+        body = self.build_payload(question, dataset, limit=limit, offset=offset)
+        if not settings.N2SQL_STREAMING:
+            keep_rows = None
+        key = result_cache.key(body["dataset"], question, (limit, offset, keep_rows))
+        dataset_name = body["dataset"] or ""
+        upstream = False
+
+        async def post() -> Dict[str, Any]:
+            nonlocal upstream
+            upstream = True
+            if admit is None:
+                return await self._post(body, keep_rows)
+            async with admit():
+                return await self._post(body, keep_rows)
+
+        with tracer.span("n2sql.ask", dataset=dataset_name) as span:
+            started = time.perf_counter()
+            status = "error"
+            try:
+                payload = await result_cache.get_or_fetch(
+                    key,
+                    result_cache.ttl_for(body["dataset"]),
+                    lambda: n2sql_resilience.call(dataset_name, post),
+                    fresh=fresh,
+                )
+                # Aciertos de caché y consultas coalescidas no miden la latencia de N2SQL.
+                status = "ok" if upstream else "cache_hit"
+                return payload
+            except AdmissionRejected:
+                status = "rejected"
+                raise
+            except BreakerOpen:
+                status = "circuit_open"
+                raise
+            except DeadlineExceeded:
+                status = "deadline"
+                raise
+            except httpx.TimeoutException:
+                status = "timeout"
+                raise
+            except httpx.HTTPStatusError as exc:
+                status = f"http_{exc.response.status_code}"
+                raise
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            finally:
+                N2SQL_ASK_SECONDS.observe(
+                    time.perf_counter() - started, dataset_label(dataset_name, self.datasets), status
+                )
+                if span is not None:
+                    span.set(status=status)
+                if status not in ("ok", "cache_hit", "rejected"):
+                    ERRORS.inc("n2sql")
+
+    async def _post(self, body: Dict[str, Any], keep_rows: Optional[int] = None) -> Dict[str, Any]:
+        if self._http is None or self._http.is_closed:
+            await self.start()
+        dataset = body["dataset"] or ""
+        # Timeout adaptativo del dataset, recortado a lo que le queda al turno.
+        timeout = dataset_timeouts.timeout_for(dataset)
+        left = remaining()
+        clipped = left is not None and left < timeout
+        if clipped:
+            if left <= 0:
+                raise DeadlineExceeded(f"Sin presupuesto para consultar {dataset!r}")
+            timeout = left
+        headers = {**_trace_headers(), DEADLINE_HEADER: str(int(timeout * 1000))}
+        self._requests += 1
+        started = time.perf_counter()
+        if keep_rows is not None:
+            request = self._post_streaming(body, keep_rows, headers, timeout)
+        else:
+            request = self._post_plain(body, headers, timeout)
+        try:
+            # El timeout de httpx acota cada operación (conectar, cada lectura), no
+            # la petición entera: con el turno recortado hace falta un tope total.
+            payload = await (asyncio.wait_for(request, timeout) if clipped else request)
+        except (httpx.TimeoutException, asyncio.TimeoutError) as exc:
+            # La latencia real fue al menos el timeout: cuenta para que el percentil suba
+            # y, si el recorte fue por el turno, para que el dataset pase a segundo plano.
+            dataset_timeouts.observe(dataset, max(timeout, time.perf_counter() - started))
+            if clipped:
+                raise DeadlineExceeded(f"Se agotó el presupuesto del turno consultando {dataset!r}") from exc
+            raise
+        dataset_timeouts.observe(dataset, time.perf_counter() - started)
+        offset = body["params"].get("offset")
+        if offset is not None:
+            payload = self._page(payload, dataset, offset, body["params"].get("limit"))
+        return payload
+
+    def _page(self, payload: Dict[str, Any], dataset: str, offset: int, limit: Optional[int]) -> Dict[str, Any]:
+        """Recorta aquí la página si N2SQL ignoró limit/offset y devolvió todo.
+
+        Cuando la respuesta no lo deja ver (p. ej. una página corta sin
+        ``rowcount``), se usa lo último observado para ese dataset.
+        """
+        key = _rows_key(payload)
+        if key is None:
+            return payload
+        dataset = dataset_label(dataset, self.datasets)
+        honored = _page_honored(payload, payload[key], offset, limit)
+        if honored is None:
+            honored = dataset not in self._unpaged
+        elif honored:
+            self._unpaged.discard(dataset)
+        elif dataset not in self._unpaged:
+            log.info("N2SQL ignoró limit/offset para %s; se pagina en el gateway.", dataset)
+            self._unpaged.add(dataset)
+        return payload if honored else _slice_page(payload, key, offset, limit)
+
+    async def _post_plain(self, body: Dict[str, Any], headers: Dict[str, str], timeout: float) -> Dict[str, Any]:
+        resp = await self._http.post(
+            self.path, json=body, headers=headers, timeout=timeout, extensions={"trace": self._on_trace}
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _post_streaming(
+        self, body: Dict[str, Any], keep_rows: int, headers: Dict[str, str], timeout: float
+    ) -> Dict[str, Any]:
+        parser = StreamingPayloadParser(keep_rows, spill=settings.N2SQL_STREAM_SPILL)
+        async with self._http.stream(
+            "POST", self.path, json=body, headers=headers, timeout=timeout, extensions={"trace": self._on_trace}
+        ) as resp:
+            if resp.is_error:
+                await resp.aread()
+                resp.raise_for_status()
+            async for chunk in resp.aiter_text():
+                parser.feed(chunk)
+        return parser.close()
+
+
+def _trace_headers() -> Dict[str, str]:
+    """Propaga la traza del turno (derivada de ``activity.id``) a N2SQL."""
+    traceparent = tracer.traceparent()
+    return {"traceparent": traceparent} if traceparent else {}
+
+
+def _rows_key(payload: Any) -> Optional[str]:
+    if isinstance(payload, dict):
+        for key in ("rows", "data"):
+            if isinstance(payload.get(key), list):
+                return key
+    return None
+
+
+def _page_honored(payload: Dict[str, Any], rows: list, offset: int, limit: Optional[int]) -> Optional[bool]:
+    """¿N2SQL aplicó limit/offset? None si la respuesta no permite saberlo.
+
+    Más filas que ``limit``, un ``offset`` devuelto distinto del pedido o, en
+    una página posterior, tantas filas como ``rowcount`` (el resultado
+    entero) indican que ignoró la paginación.
+    """
+    if limit is not None and len(rows) > limit:
+        return False
+    params = payload.get("params")
+    echoed = payload.get("offset", params.get("offset") if isinstance(params, dict) else None)
+    if echoed is not None:
+        try:
+            return int(echoed) == offset
+        except (TypeError, ValueError):
+            pass
+    rowcount = payload.get("rowcount")
+    if offset > 0 and isinstance(rowcount, int) and rowcount > 0:
+        return len(rows) < rowcount
+    return None
+
+
+def _slice_page(payload: Dict[str, Any], key: str, offset: int, limit: Optional[int]) -> Dict[str, Any]:
+    rows = payload[key]
+    trimmed = dict(payload)
+    trimmed[key] = rows[offset:] if limit is None else rows[offset: offset + limit]
+    trimmed.setdefault("rowcount", len(rows))
+    return trimmed
 
 client = N2SQLClient()
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import AbstractSet, Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from .deadlines import remaining
+from .metrics import N2SQL_BREAKER_STATE, N2SQL_BREAKER_TRANSITIONS, N2SQL_RETRIES, dataset_label
+from .settings import settings
+
+log = logging.getLogger("teams_gw.resilience")
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+RETRYABLE_STATUS = frozenset({502, 503, 504})
+
+
+class BreakerOpen(Exception):
+    """El circuito de este dataset está abierto: se falla sin llamar a N2SQL."""
+
+    def __init__(self, dataset: str, retry_in_s: float) -> None:
+        super().__init__(f"N2SQL no disponible para {dataset!r}; reintento en {retry_in_s:.0f}s")
+        self.dataset = dataset
+        self.retry_in_s = retry_in_s
+
+
+def retry_reason(exc: BaseException) -> Optional[str]:
+    """Causa reintentable de ``exc`` o None.
+
+    Solo fallas transitorias donde repetir la consulta (de lectura) es seguro:
+    no se pudo conectar, o un proxy respondió 502/503/504. Un timeout de
+    lectura no se reintenta: la consulta pudo estar corriendo y repetirla
+    duplicaría el costo.
+    """
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return "connect"
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in RETRYABLE_STATUS:
+        return f"http_{exc.response.status_code}"
+    return None
+
+
+def counts_as_failure(exc: BaseException) -> bool:
+    """Las fallas del servicio abren el circuito; los 4xx son culpa de la consulta."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def backoff_delay(attempt: int, base_s: float, max_s: float) -> float:
+    """Backoff exponencial con jitter completo: ``uniform(0, min(max, base * 2**n))``."""
+    return random.uniform(0, min(max_s, base_s * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Circuit breaker por dataset.
+
+    Tras ``failure_threshold`` fallas seguidas se abre y las llamadas fallan
+    al instante con ``BreakerOpen``. Pasados ``reset_timeout_s`` pasa a
+    semiabierto y deja pasar una sola llamada de prueba: si sale bien se
+    cierra y si falla vuelve a abrirse.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_s: float) -> None:
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout_s = reset_timeout_s
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        N2SQL_BREAKER_STATE.set(0, name)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        log.warning("Circuit breaker N2SQL %s: %s → %s", self.name, self.state, state)
+        self.state = state
+        N2SQL_BREAKER_STATE.set(_STATE_VALUE[state], self.name)
+        N2SQL_BREAKER_TRANSITIONS.inc(self.name, state)
+
+    def before_call(self) -> bool:
+        """Lanza ``BreakerOpen`` si no se debe llamar; True si la llamada es la prueba."""
+        if self.state == CLOSED:
+            return False
+        retry_in = self.opened_at + self.reset_timeout_s - time.monotonic()
+        if self.state == OPEN and retry_in <= 0:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        raise BreakerOpen(self.name, max(retry_in, 0.0))
+
+    def record_success(self, probe: bool = False) -> None:
+        if probe:
+            self._probing = False
+        self.failures = 0
+        self._transition(CLOSED)
+
+    def record_failure(self, exc: BaseException, probe: bool = False) -> None:
+        if probe:
+            self._probing = False
+        self.last_error = repr(exc)
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(OPEN)
+
+    def release(self, probe: bool) -> None:
+        """La llamada terminó sin veredicto (p. ej. cancelada o error 4xx)."""
+        if probe:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+
+class ResilientCaller:
+    """Reintentos con backoff y un circuit breaker por dataset para las llamadas a N2SQL.
+
+    Con ``datasets``, los nombres que no están en la lista comparten un único
+    breaker ``other``: no se crea uno por cada texto escrito en ``dt[...]``.
+    """
+
+    def __init__(
+        self,
+        retry_attempts: int,
+        retry_base_s: float,
+        retry_max_s: float,
+        failure_threshold: int,
+        reset_timeout_s: float,
+        datasets: Optional[AbstractSet[str]] = None,
+    ) -> None:
+        self.retry_attempts = max(retry_attempts, 0)
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.datasets = datasets
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_settings(cls) -> "ResilientCaller":
+        return cls(
+            retry_attempts=settings.N2SQL_RETRY_ATTEMPTS,
+            retry_base_s=settings.N2SQL_RETRY_BASE_S,
+            retry_max_s=settings.N2SQL_RETRY_MAX_S,
+            failure_threshold=settings.N2SQL_BREAKER_THRESHOLD,
+            reset_timeout_s=settings.N2SQL_BREAKER_RESET_S,
+            datasets=settings.known_datasets,
+        )
+
+    def breaker(self, dataset: str) -> CircuitBreaker:
+        name = dataset_label(dataset, self.datasets)
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(
+                name, self.failure_threshold, self.reset_timeout_s
+            )
+        return breaker
+
+    async def call(self, dataset: str, fn: Callable[[], Awaitable[T]]) -> T:
+        breaker = self.breaker(dataset)
+        probe = breaker.before_call()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = await fn()
+                except Exception as exc:
+                    reason = retry_reason(exc)
+                    # Una llamada de prueba no se reintenta: decide el estado del circuito.
+                    if reason is None or probe or attempt >= self.retry_attempts:
+                        raise
+                    delay = backoff_delay(attempt, self.retry_base_s, self.retry_max_s)
+                    left = remaining()
+                    if left is not None and left <= delay:
+                        raise  # no alcanza el presupuesto del turno para otro intento
+                    N2SQL_RETRIES.inc(breaker.name, reason)
+                    attempt += 1
+                    log.info("Reintento %s a N2SQL (%s, %s) en %.2fs", attempt, dataset, reason, delay)
+                    await asyncio.sleep(delay)
+                    continue
+                breaker.record_success(probe)
+                return result
+        except Exception as exc:
+            if counts_as_failure(exc):
+                breaker.record_failure(exc, probe)
+            else:
+                breaker.release(probe)
+            raise
+        except BaseException:
+            breaker.release(probe)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: breaker.stats() for name, breaker in sorted(self._breakers.items())}
+
+
+n2sql_resilience = ResilientCaller.from_settings()
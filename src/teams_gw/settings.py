@@ -1,6 +1,6 @@
 from __future__ import annotations
 import os
-from typing import List, Optional
+from typing import Dict, FrozenSet, List, Optional
 from pydantic import Field, AliasChoices
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -25,16 +25,76 @@ class Settings(BaseSettings):
             "MicrosoftAppScope",
         ),
     )
+    BF_TOKEN_REFRESH_AHEAD_S: int = 600
+    SERVICE_URL_TRUST_MAX: int = 64
+    SERVICE_URL_TRUST_TTL_S: int = 24 * 3600
     N2SQL_URL: str
     N2SQL_QUERY_PATH: str = "/v1/query"
     N2SQL_API_KEY: Optional[str] = None
     N2SQL_TIMEOUT_S: int = 30
     N2SQL_SHOW_SQL: bool = False
+    N2SQL_HTTP2: bool = False
+    N2SQL_POOL_MAX_CONNECTIONS: int = 20
+    N2SQL_POOL_MAX_KEEPALIVE: int = 10
+    N2SQL_KEEPALIVE_EXPIRY_S: float = 60.0
+    N2SQL_CACHE_TTL_S: float = 120.0
+    N2SQL_CACHE_TTLS: str = ""
+    N2SQL_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    N2SQL_DATASETS: str = ""
 
     APP_TZ: str = "America/Lima"
     N2SQL_TRIGGERS: str = "dt:,consulta ,n2sql:"
     N2SQL_MAX_ROWS: int = 20
     N2SQL_MAX_ROWS_EXPANDED: int = 60
+    N2SQL_MESSAGE_MAX_BYTES: int = 24000
+    N2SQL_CELL_MAX_CHARS: int = 200
+    N2SQL_PAGINATION: bool = False
+    N2SQL_STREAMING: bool = False
+    N2SQL_STREAM_SPILL: bool = True
+    STATE_BACKEND: str = "memory"
+    STATE_SQLITE_PATH: str = "teams_gw_state.sqlite3"
+    STATE_MAX_BYTES: int = 64 * 1024 * 1024
+    STATE_ENTRY_MAX_BYTES: int = 4 * 1024 * 1024
+    STATE_IDLE_TTL_S: int = 3600
+    N2SQL_MAX_CONCURRENT: int = 8
+    N2SQL_MAX_CONCURRENT_PER_USER: int = 2
+    N2SQL_MAX_CONCURRENT_PER_CONVERSATION: int = 3
+    N2SQL_ADMISSION_MAX_WAIT_S: float = 5.0
+    N2SQL_RETRY_ATTEMPTS: int = 2
+    N2SQL_RETRY_BASE_S: float = 0.2
+    N2SQL_RETRY_MAX_S: float = 2.0
+    N2SQL_BREAKER_THRESHOLD: int = 5
+    N2SQL_BREAKER_RESET_S: float = 30.0
+    TURN_DEADLINE_S: float = 14.0
+    ASYNC_DEADLINE_S: float = 120.0
+    N2SQL_ADAPTIVE_TIMEOUTS: bool = True
+    N2SQL_TIMEOUT_PERCENTILE: float = 99.0
+    N2SQL_TIMEOUT_MULTIPLIER: float = 2.0
+    N2SQL_TIMEOUT_MIN_S: float = 2.0
+    N2SQL_LATENCY_WINDOW: int = 200
+    N2SQL_LATENCY_MIN_SAMPLES: int = 20
+    N2SQL_SLOW_DATASET_S: float = 6.0
+    N2SQL_SLOW_DATASET_STREAK: int = 3
+    N2SQL_FANOUT_MAX: int = 4
+    N2SQL_FANOUT_DEADLINE_S: float = 12.0
+    N2SQL_FANOUT_LAYOUT: str = "merged"
+    DEDUP_MAX_ENTRIES: int = 10000
+    DEDUP_TTL_S: float = 600.0
+    TRACING_ENABLED: bool = True
+    TRACE_BUFFER_SIZE: int = 200
+    AUTH_DISABLED: bool = False
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_SAMPLING: str = ""
+    ASYNC_REPLIES: bool = False
+    ASYNC_WORKERS: int = 4
+    ASYNC_QUEUE_MAX: int = 100
+    ASYNC_DRAIN_TIMEOUT_S: float = 30.0
+    FAQ_CATALOG_PATH: Optional[str] = None
+    FAQ_RELOAD_INTERVAL_S: float = 5.0
+    WARMUP_ENABLED: bool = True
+    WARMUP_TIMEOUT_S: float = 20.0
+    N2SQL_WARMUP_PATH: str = "/"
     PORT: int = int(os.getenv("PORT", "8000"))
     ENV: str = os.getenv("ENV", "prod")
 
@@ -42,4 +102,23 @@ class Settings(BaseSettings):
     def triggers(self) -> List[str]:
         return [t.strip() for t in self.N2SQL_TRIGGERS.split(",") if t.strip()]
 
+    @property
+    def cache_ttls(self) -> Dict[str, float]:
+        """TTL por dataset desde ``N2SQL_CACHE_TTLS`` (ej. ``odoo=300,crm=30``)."""
+        ttls: Dict[str, float] = {}
+        for item in self.N2SQL_CACHE_TTLS.split(","):
+            name, sep, value = item.partition("=")
+            if sep and name.strip() and value.strip():
+                ttls[name.strip().lower()] = float(value)
+        return ttls
+
+    @property
+    def known_datasets(self) -> FrozenSet[str]:
+        """Datasets con métricas, breaker y latencias propias: ``N2SQL_DATASETS``,
+        el dataset por defecto y los que tienen TTL en ``N2SQL_CACHE_TTLS``."""
+        names = {d.strip().lower() for d in self.N2SQL_DATASETS.split(",") if d.strip()}
+        names.add(getattr(self, "N2SQL_DATASET", "odoo").lower())
+        names.update(self.cache_ttls)
+        return frozenset(names)
+
 settings = Settings()
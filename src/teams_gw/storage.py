@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from botbuilder.core import MemoryStorage, Storage, StoreItem
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.storage")
+
+
+def _estimate_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str, separators=(",", ":"), ensure_ascii=False))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class BoundedMemoryStorage(MemoryStorage):
+    """``MemoryStorage`` con presupuesto de bytes, tope por entrada, TTL de inactividad y LRU.
+
+    Cuando una conversación se expulsa, ``ConversationState`` la ve vacía y el
+    bot responde que los resultados expiraron.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, idle_ttl_s: float) -> None:
+        super().__init__(OrderedDict())
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.idle_ttl_s = idle_ttl_s
+        self._sizes: Dict[str, int] = {}
+        self._touched: Dict[str, float] = {}
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+
+    @classmethod
+    def from_settings(cls) -> "BoundedMemoryStorage":
+        return cls(
+            max_bytes=settings.STATE_MAX_BYTES,
+            max_entry_bytes=settings.STATE_ENTRY_MAX_BYTES,
+            idle_ttl_s=settings.STATE_IDLE_TTL_S,
+        )
+
+    def _forget(self, key: str) -> None:
+        self.memory.pop(key, None)
+        self._touched.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def _expire_idle(self) -> None:
+        # Las entradas están en orden LRU: basta con mirar el principio.
+        deadline = time.monotonic() - self.idle_ttl_s
+        while self.memory:
+            key = next(iter(self.memory))
+            if self._touched.get(key, 0) > deadline:
+                break
+            self._forget(key)
+            self.expirations += 1
+
+    def _touch(self, key: str) -> None:
+        self.memory.move_to_end(key)
+        self._touched[key] = time.monotonic()
+
+    async def read(self, keys: List[str]):
+        self._expire_idle()
+        data = await super().read(keys)
+        for key in data:
+            self._touch(key)
+        return data
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        await super().write(changes)
+        for key in changes or {}:
+            if key not in self.memory:
+                continue
+            size = _estimate_size(self.memory[key])
+            if size > self.max_entry_bytes:
+                log.warning(
+                    "Estado de %s descartado: %s bytes > STATE_ENTRY_MAX_BYTES=%s",
+                    key, size, self.max_entry_bytes,
+                )
+                self._forget(key)
+                self.rejections += 1
+                continue
+            self._bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._touch(key)
+        while self._bytes > self.max_bytes and self.memory:
+            self._forget(next(iter(self.memory)))
+            self.evictions += 1
+
+    async def delete(self, keys: List[str]):
+        for key in keys:
+            self._forget(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "entries": len(self.memory),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejections": self.rejections,
+        }
+
+
+class SqliteStorage(Storage):
+    """``Storage`` de botbuilder sobre un archivo SQLite local en modo WAL.
+
+    Permite compartir el estado ("Ver más filas") entre varios workers de
+    uvicorn en la misma máquina. Las escrituras concurrentes se agrupan en
+    una sola transacción (group commit) que corre en un hilo dedicado.
+    """
+
+    _COMPRESS_MIN = 512
+    _TOUCH_INTERVAL_S = 60.0  # como mucho una escritura de touched_at por minuto y clave
+
+    def __init__(self, path: str, idle_ttl_s: float = 0) -> None:
+        super().__init__()
+        self.path = path
+        self.idle_ttl_s = idle_ttl_s
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-state")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[Dict[str, Any], "asyncio.Future[None]"]] = []
+        self._flush_task: Optional["asyncio.Task[None]"] = None
+        self._last_purge = 0.0
+        self.batches = 0
+        self.batched_writes = 0
+
+    @classmethod
+    def from_settings(cls) -> "SqliteStorage":
+        return cls(settings.STATE_SQLITE_PATH, idle_ttl_s=settings.STATE_IDLE_TTL_S)
+
+    # -- serialización compacta -------------------------------------------------
+    @classmethod
+    def _dumps(cls, value: Any) -> bytes:
+        raw = json.dumps(value, default=str, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if len(raw) >= cls._COMPRESS_MIN:
+            return b"z" + zlib.compress(raw, 1)
+        return b"j" + raw
+
+    @staticmethod
+    def _loads(blob: bytes) -> Any:
+        body = blob[1:]
+        if blob[:1] == b"z":
+            body = zlib.decompress(body)
+        return json.loads(body)
+
+    @staticmethod
+    def _etag(value: Any) -> Optional[str]:
+        if isinstance(value, dict):
+            return value.get("e_tag")
+        return getattr(value, "e_tag", None)
+
+    # -- hilo SQLite -------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bot_state ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, e_tag INTEGER, touched_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS bot_state_touched ON bot_state(touched_at)")
+            self._conn = conn
+        return self._conn
+
+    def _read_sync(self, keys: List[str]) -> Dict[str, Any]:
+        conn = self._connect()
+        marks = ",".join("?" * len(keys))
+        rows = conn.execute(
+            f"SELECT key, value, e_tag, touched_at FROM bot_state WHERE key IN ({marks})", keys
+        ).fetchall()
+        now = time.time()
+        deadline = now - self.idle_ttl_s if self.idle_ttl_s else 0
+        data: Dict[str, Any] = {}
+        touched: List[Tuple[float, str]] = []
+        for key, blob, e_tag, touched_at in rows:
+            if touched_at < deadline:
+                continue
+            value = self._loads(blob)
+            if e_tag is not None and isinstance(value, dict):
+                value["e_tag"] = str(e_tag)
+            data[key] = value
+            if self.idle_ttl_s and now - touched_at > self._TOUCH_INTERVAL_S:
+                touched.append((now, key))
+        if touched:
+            # Leer también es actividad: una conversación que solo lee no debe vencer por TTL.
+            conn.executemany("UPDATE bot_state SET touched_at = ? WHERE key = ?", touched)
+        return data
+
+    def _write_changes(self, conn: sqlite3.Connection, changes: Dict[str, Any], now: float) -> None:
+        keys = list(changes)
+        marks = ",".join("?" * len(keys))
+        current = dict(conn.execute(f"SELECT key, e_tag FROM bot_state WHERE key IN ({marks})", keys).fetchall())
+        rows = []
+        for key, value in changes.items():
+            new_etag = self._etag(value)
+            old_etag = current.get(key)
+            if new_etag == "":
+                raise Exception("sqlite_storage.write(): etag missing")
+            if old_etag is not None and new_etag not in (None, "*") and str(new_etag) != str(old_etag):
+                raise KeyError(f"Etag conflict.\nOriginal: {new_etag}\r\nCurrent: {old_etag}")
+            if isinstance(value, dict):
+                value = {k: v for k, v in value.items() if k != "e_tag"}
+            # Toda fila escrita recibe un etag entero, aunque el valor no traiga uno.
+            rows.append((key, self._dumps(value), (old_etag or 0) + 1, now))
+        conn.executemany(
+            "INSERT INTO bot_state(key, value, e_tag, touched_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value=excluded.value, e_tag=excluded.e_tag,"
+            " touched_at=excluded.touched_at",
+            rows,
+        )
+
+    def _write_batch_sync(self, batch: List[Dict[str, Any]]) -> List[Optional[Exception]]:
+        conn = self._connect()
+        now = time.time()
+        results: List[Optional[Exception]] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for changes in batch:
+                # Cada llamador en su SAVEPOINT: un conflicto o error solo deshace lo suyo.
+                conn.execute("SAVEPOINT item")
+                try:
+                    self._write_changes(conn, changes, now)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO item")
+                    results.append(exc)
+                else:
+                    results.append(None)
+                conn.execute("RELEASE item")
+            if self.idle_ttl_s and now - self._last_purge > 60:
+                conn.execute("DELETE FROM bot_state WHERE touched_at < ?", (now - self.idle_ttl_s,))
+                self._last_purge = now
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def _delete_sync(self, keys: List[str]) -> None:
+        conn = self._connect()
+        conn.executemany("DELETE FROM bot_state WHERE key = ?", [(k,) for k in keys])
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # -- interfaz Storage --------------------------------------------------------
+    async def read(self, keys: List[str]) -> Dict[str, Any]:
+        if not keys:
+            return {}
+        return await self._run(self._read_sync, list(keys))
+
+    async def write(self, changes: Dict[str, StoreItem]):
+        if changes is None:
+            raise Exception("Changes are required when writing")
+        if not changes:
+            return
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[None]" = loop.create_future()
+        self._pending.append((dict(changes), future))
+        if self._flush_task is None or self._flush_task.done():
+            # La tarea arranca en la próxima vuelta del loop: las escrituras
+            # de otros turnos que lleguen antes viajan en la misma transacción.
+            self._flush_task = loop.create_task(self._flush())
+        await future
+
+    async def _flush(self) -> None:
+        # Mientras SQLite escribe un lote, los siguientes se acumulan y se
+        # confirman juntos en la próxima vuelta.
+        while self._pending:
+            pending, self._pending = self._pending, []
+            try:
+                results = await self._run(self._write_batch_sync, [changes for changes, _ in pending])
+            except Exception as exc:
+                results = [exc] * len(pending)
+            self.batches += 1
+            self.batched_writes += len(pending)
+            for (_, future), error in zip(pending, results):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def delete(self, keys: List[str]):
+        if keys:
+            await self._run(self._delete_sync, list(keys))
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._pending:
+            await self._flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "batches": self.batches,
+            "batched_writes": self.batched_writes,
+        }
+
+
+def build_storage() -> Storage:
+    """Elige el backend del estado de conversaciones según ``STATE_BACKEND``."""
+    backend = settings.STATE_BACKEND.lower()
+    if backend == "sqlite":
+        return SqliteStorage.from_settings()
+    if backend != "memory":
+        log.warning("STATE_BACKEND=%s desconocido; se usa memoria.", settings.STATE_BACKEND)
+    return BoundedMemoryStorage.from_settings()
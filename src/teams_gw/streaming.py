@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import base64
+import json
+import re
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+STREAMED_KEYS = ("rows", "data")
+SPILL_KEY = "spill"
+
+_WS = " \t\r\n"
+_decoder = json.JSONDecoder()
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_IN_STRING = re.compile(r'["\\]')
+_PRIMITIVE_END = re.compile(r"[,\]}\s]")
+
+
+class RowSpill:
+    """Buffer compacto (JSON por línea + zlib) para las filas que no se muestran aún.
+
+    Cada fila se vuelve a serializar en JSON compacto: el texto original puede
+    venir indentado y romper el formato de una fila por línea.
+    """
+
+    __slots__ = ("_compressor", "_chunks", "count")
+
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(1)
+        self._chunks: List[bytes] = []
+        self.count = 0
+
+    def append(self, row: Any) -> None:
+        line = json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._chunks.append(self._compressor.compress(line + b"\n"))
+        self.count += 1
+
+    def finish(self) -> str:
+        self._chunks.append(self._compressor.flush())
+        return base64.b64encode(b"".join(self._chunks)).decode("ascii")
+
+
+class StreamingPayloadParser:
+    """Parser incremental del JSON de N2SQL.
+
+    Decodifica ``columns``, ``sql`` y demás claves normalmente, pero recorre
+    ``rows``/``data`` elemento a elemento: materializa solo las primeras
+    ``keep_rows`` filas, cuenta el resto y, si ``spill`` está activo, las
+    guarda comprimidas en ``payload["spill"]`` para las etapas de "Ver más".
+    """
+
+    _START, _KEY, _COLON, _VALUE, _ARRAY, _DONE, _RAW = range(7)
+
+    def __init__(self, keep_rows: int, spill: bool = False) -> None:
+        self.keep_rows = keep_rows
+        self.spill_enabled = spill
+        self.payload: Dict[str, Any] = {}
+        self._buf = ""
+        self._pos = 0
+        self._state = self._START
+        self._key: Optional[str] = None
+        self._rows: List[Any] = []
+        self._row_count = 0
+        self._spill: Optional[RowSpill] = None
+        self._streamed_key: Optional[str] = None
+        self._closed = False
+        # Valor incompleto en ``_pos``: hasta dónde se escaneó (relativo) y en qué estado.
+        self._partial = False
+        self._scan = 0
+        self._depth = 0
+        self._in_str = False
+
+    # -- helpers -----------------------------------------------------------------
+    def _skip_ws(self) -> bool:
+        buf, pos, n = self._buf, self._pos, len(self._buf)
+        while pos < n and buf[pos] in _WS:
+            pos += 1
+        self._pos = pos
+        return pos < n
+
+    def _value_end(self) -> Optional[int]:
+        """Fin (exclusivo) del valor que empieza en ``_pos``, o None si aún no llegó entero.
+
+        Retoma el escaneo donde quedó en el chunk anterior, así que una fila o
+        celda enorme que llega en muchos chunks se recorre una sola vez.
+        """
+        buf, start, n = self._buf, self._pos, len(self._buf)
+        i = start + self._scan
+        if buf[start] not in '[{"':
+            match = _PRIMITIVE_END.search(buf, i)
+            if match is not None:
+                return match.start()
+            if self._closed:
+                return n
+            self._scan = n - start
+            return None
+        depth, in_str = self._depth, self._in_str
+        while True:
+            if in_str:
+                match = _IN_STRING.search(buf, i)
+                if match is None:
+                    break
+                i = match.end()
+                if match.group() == "\\":
+                    i += 1  # el carácter escapado (puede llegar en el próximo chunk)
+                    continue
+                in_str = False
+                if depth == 0:
+                    return i
+            else:
+                match = _STRUCTURAL.search(buf, i)
+                if match is None:
+                    break
+                ch, i = match.group(), match.end()
+                if ch == '"':
+                    in_str = True
+                elif ch in "[{":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return i
+        self._scan, self._depth, self._in_str = max(i, n) - start, depth, in_str
+        return None
+
+    def _decode(self) -> tuple[bool, Any]:
+        """Intenta decodificar un valor completo en la posición actual.
+
+        Si el valor está incompleto, no se vuelve a intentar ``raw_decode``
+        hasta que el escaneo incremental encuentra su cierre.
+        """
+        if self._partial and self._value_end() is None:
+            return False, None
+        try:
+            value, end = _decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._closed or self._partial:
+                raise
+            return self._start_partial()
+        # Un número al final del buffer podría continuar en el siguiente chunk.
+        if end >= len(self._buf) and not self._closed and self._buf[self._pos] not in '[{"':
+            return self._start_partial()
+        self._pos = end
+        self._partial = False
+        return True, value
+
+    def _start_partial(self) -> tuple[bool, Any]:
+        self._partial = True
+        self._scan, self._depth, self._in_str = 0, 0, False
+        self._value_end()
+        return False, None
+
+    def _compact(self) -> None:
+        if self._pos > 65536:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+    # -- API -------------------------------------------------------------------
+    def feed(self, text: str) -> None:
+        self._buf += text
+        self._run()
+        self._compact()
+
+    def _run(self) -> None:
+        while True:
+            state = self._state
+            if state in (self._DONE, self._RAW):
+                return
+            if not self._skip_ws():
+                return
+            ch = self._buf[self._pos]
+
+            if state == self._START:
+                if ch != "{":
+                    self._state = self._RAW
+                    return
+                self._pos += 1
+                self._state = self._KEY
+            elif state == self._KEY:
+                if ch == "}":
+                    self._pos += 1
+                    self._state = self._DONE
+                elif ch == ",":
+                    self._pos += 1
+                else:
+                    ok, key = self._decode()
+                    if not ok:
+                        return
+                    self._key = key
+                    self._state = self._COLON
+            elif state == self._COLON:
+                if ch != ":":
+                    raise ValueError(f"JSON inválido: se esperaba ':' en {self._pos}")
+                self._pos += 1
+                self._state = self._VALUE
+            elif state == self._VALUE:
+                if ch == "[" and self._key in STREAMED_KEYS and self._streamed_key is None:
+                    self._pos += 1
+                    self._streamed_key = self._key
+                    self._state = self._ARRAY
+                else:
+                    ok, value = self._decode()
+                    if not ok:
+                        return
+                    self.payload[self._key] = value
+                    self._state = self._KEY
+            elif state == self._ARRAY:
+                if ch == "]":
+                    self._pos += 1
+                    self.payload[self._streamed_key] = self._rows
+                    self._state = self._KEY
+                elif ch == ",":
+                    self._pos += 1
+                else:
+                    ok, value = self._decode()
+                    if not ok:
+                        return
+                    self._row_count += 1
+                    if len(self._rows) < self.keep_rows:
+                        self._rows.append(value)
+                    elif self.spill_enabled:
+                        if self._spill is None:
+                            self._spill = RowSpill()
+                        self._spill.append(value)
+                    self._compact()
+
+    def close(self) -> Any:
+        self._closed = True
+        if self._state == self._RAW:
+            return json.loads(self._buf[self._pos:])
+        self._run()
+        if self._state != self._DONE:
+            raise ValueError("Respuesta JSON de N2SQL incompleta")
+        if self._streamed_key is not None:
+            self.payload.setdefault("rowcount", self._row_count)
+            if self._spill is not None:
+                self.payload[SPILL_KEY] = {
+                    "key": self._streamed_key,
+                    "count": self._spill.count,
+                    "blob": self._spill.finish(),
+                }
+        return self.payload
+
+
+@lru_cache(maxsize=4)
+def _spill_lines(blob: str) -> List[bytes]:
+    # Cada "Ver más" lee un tramo del mismo spill: se descomprime una sola vez.
+    return zlib.decompress(base64.b64decode(blob)).splitlines()
+
+
+def read_spill(spill: Dict[str, Any], start: int, count: int) -> List[Any]:
+    """Decodifica ``count`` filas del spill a partir de la posición ``start``."""
+    if count <= 0:
+        return []
+    lines = _spill_lines(spill["blob"])
+    return [json.loads(line) for line in lines[start: start + count]]
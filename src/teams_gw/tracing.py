@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Protocol
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.tracing")
+
+
+def trace_id_for(activity_id: Optional[str]) -> str:
+    """Trace ID W3C (32 hex) estable para un ``activity.id``; aleatorio si no hay id.
+
+    Los reintentos de Bot Framework traen el mismo id y caen en la misma traza.
+    """
+    if activity_id:
+        return hashlib.sha256(str(activity_id).encode("utf-8")).hexdigest()[:32]
+    return os.urandom(16).hex()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attrs", "status", "timings")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attrs = attrs
+        self.status = "ok"
+        self.timings: Dict[str, float] = {}  # solo en la raíz: ms acumulados por etapa
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class SpanExporter(Protocol):
+    def export(self, span: Span) -> None: ...
+
+
+class RingBufferExporter:
+    """Guarda en memoria las últimas ``max_traces`` trazas para ``/__traces``."""
+
+    def __init__(self, max_traces: int) -> None:
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+
+    def export(self, span: Span) -> None:
+        spans = self._traces.get(span.trace_id)
+        if spans is None:
+            spans = self._traces[span.trace_id] = []
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        spans.append(span)
+
+    def slowest(self, limit: int = 20) -> List[Dict[str, Any]]:
+        traces = []
+        for trace_id, spans in self._traces.items():
+            start = min(s.start for s in spans)
+            end = max(s.end or s.start for s in spans)
+            root = next((s for s in spans if s.parent_id is None), spans[0])
+            traces.append(
+                {
+                    "trace_id": trace_id,
+                    "root": root.name,
+                    "start": start,
+                    "duration_ms": round((end - start) * 1000, 3),
+                    "attrs": root.attrs,
+                    "spans": [s.to_dict() for s in sorted(spans, key=lambda s: s.start)],
+                }
+            )
+        traces.sort(key=lambda t: t["duration_ms"], reverse=True)
+        return traces[:limit]
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("teams_gw_span", default=None)
+_root: ContextVar[Optional[Span]] = ContextVar("teams_gw_root_span", default=None)
+
+
+class Tracer:
+    """Trazas y spans ligeros que viajan con el contexto de asyncio."""
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.exporters: List[SpanExporter] = []
+
+    def add_exporter(self, exporter: SpanExporter) -> None:
+        self.exporters.append(exporter)
+
+    @contextmanager
+    def trace(self, name: str, activity_id: Optional[str] = None, **attrs: Any) -> Iterator[Optional[Span]]:
+        """Abre el span raíz de una traza nueva derivada de ``activity_id``."""
+        if not self.enabled:
+            yield None
+            return
+        span = Span(name, trace_id_for(activity_id), None, attrs)
+        token = _root.set(span)
+        try:
+            with self._span(span):
+                yield span
+        finally:
+            _root.reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+        """Span hijo del actual; no hace nada fuera de una traza."""
+        parent = _current.get()
+        if parent is None:
+            yield None
+            return
+        with self._span(Span(name, parent.trace_id, parent.span_id, attrs)) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, span: Span) -> Iterator[Span]:
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.status = type(exc).__name__
+            raise
+        finally:
+            span.end = time.time()
+            _current.reset(token)
+            root = _root.get()
+            if root is not None and root is not span:
+                root.timings[span.name] = root.timings.get(span.name, 0.0) + span.duration_ms
+            for exporter in self.exporters:
+                try:
+                    exporter.export(span)
+                except Exception:
+                    log.exception("Exporter de trazas falló")
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current.get()
+
+    @staticmethod
+    def root() -> Optional[Span]:
+        return _root.get()
+
+    @staticmethod
+    def current_trace_id() -> Optional[str]:
+        span = _current.get()
+        return span.trace_id if span is not None else None
+
+    @staticmethod
+    def traceparent() -> Optional[str]:
+        """Cabecera W3C ``traceparent`` del span actual (None fuera de una traza)."""
+        span = _current.get()
+        if span is None:
+            return None
+        return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+tracer = Tracer(enabled=settings.TRACING_ENABLED)
+ring_buffer = RingBufferExporter(max_traces=settings.TRACE_BUFFER_SIZE)
+tracer.add_exporter(ring_buffer)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Set
+from urllib.parse import urlparse
+
+from botframework.connector.auth import MicrosoftAppCredentials
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.trust")
+
+
+def service_url_variants(service_url: str) -> Set[str]:
+    """URL completa, host raíz y base regional (p.ej. ".../amer/"), con y sin "/" final."""
+    p = urlparse(service_url)
+    host_root = f"{p.scheme}://{p.netloc}/"
+    path_parts = [seg for seg in p.path.split("/") if seg]
+    region_base = f"{p.scheme}://{p.netloc}/{path_parts[0]}/" if path_parts else host_root
+    variants = {service_url, host_root, region_base}
+    variants |= {u.rstrip("/") for u in variants if u.endswith("/")}
+    return {u for u in variants if u}
+
+
+class ServiceUrlTrustCache:
+    """Memoiza ``trust_service_url`` por serviceUrl distinto.
+
+    Teams usa unas pocas URLs regionales, así que el trabajo (y el log) se hace
+    una vez por URL y se repite solo cuando vence la confianza.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._trusted: "OrderedDict[str, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def ensure_trusted(self, service_url: str) -> bool:
+        """Confía ``service_url`` si hace falta. Devuelve True si se confió ahora."""
+        now = time.monotonic()
+        expires_at = self._trusted.get(service_url)
+        if expires_at is not None and expires_at > now:
+            self.hits += 1
+            self._trusted.move_to_end(service_url)
+            return False
+
+        self.misses += 1
+        variants = service_url_variants(service_url)
+        # El SDK debe seguir confiando un poco más que nuestra caché, para
+        # renovar antes de que la URL deje de ser de confianza.
+        expiration = datetime.now() + timedelta(seconds=self.ttl_s + 300)
+        for u in variants:
+            MicrosoftAppCredentials.trust_service_url(u, expiration)
+        self._trusted[service_url] = now + self.ttl_s
+        self._trusted.move_to_end(service_url)
+        while len(self._trusted) > self.max_entries:
+            self._trusted.popitem(last=False)
+        log.info("Trusted service URLs: %s", sorted(variants))
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._trusted),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+service_url_trust = ServiceUrlTrustCache(
+    max_entries=settings.SERVICE_URL_TRUST_MAX,
+    ttl_s=settings.SERVICE_URL_TRUST_TTL_S,
+)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from .settings import settings
+
+log = logging.getLogger("teams_gw.warmup")
+
+Step = Callable[[], Union[Awaitable[Any], Any]]
+
+
+class Warmup:
+    """Calentamiento de arranque: paga el costo del primer mensaje antes de recibirlo.
+
+    Corre los pasos registrados en una tarea de fondo al iniciar la app; hasta
+    que termina, ``/__ready`` responde 503 y Render no enruta tráfico. Un paso
+    que falla solo se registra: lo que no se calentó se hará en la primera
+    petición, como antes. ``timeout_s`` acota el calentamiento completo.
+    """
+
+    def __init__(self, enabled: bool, timeout_s: float) -> None:
+        self.enabled = enabled
+        self.timeout_s = timeout_s
+        self._steps: List[Tuple[str, Step]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.ready = not enabled
+        self.state = "disabled" if not enabled else "pending"
+        self.duration_ms: Optional[float] = None
+        self.import_ms: Optional[float] = None  # tiempo de importar app.py (lo fija app.py)
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def step(self, name: str, fn: Step) -> None:
+        self._steps.append((name, fn))
+
+    async def _run_step(self, name: str, fn: Step) -> None:
+        started = time.perf_counter()
+        try:
+            result = fn()
+            if inspect.isawaitable(result):
+                await result
+            self.steps[name] = {"status": "ok"}
+        except Exception as exc:
+            self.steps[name] = {"status": "failed", "error": repr(exc)}
+            log.warning("Calentamiento %s falló: %r", name, exc)
+        finally:
+            self.steps.setdefault(name, {"status": "cancelled"})
+            self.steps[name]["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    async def run(self) -> None:
+        self.state = "running"
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(self._run_step(name, fn) for name, fn in self._steps)),
+                timeout=self.timeout_s,
+            )
+            self.state = "ready"
+        except asyncio.TimeoutError:
+            self.state = "timeout"
+            log.warning("El calentamiento superó %ss; se continúa sin terminarlo", self.timeout_s)
+        finally:
+            self.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.ready = True
+        log.info("Calentamiento %s en %.0fms", self.state, self.duration_ms, extra={"steps": self.steps})
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self.run(), name="warmup")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "import_ms": self.import_ms,
+            "duration_ms": self.duration_ms,
+            "steps": self.steps,
+        }
+
+
+warmup = Warmup(enabled=settings.WARMUP_ENABLED, timeout_s=settings.WARMUP_TIMEOUT_S)
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from src.teams_gw.admission import AdmissionController, AdmissionRejected
+
+
+def test_round_robin_between_users_and_max_wait():
+    async def scenario():
+        ctl = AdmissionController(max_concurrent=1, per_user=0, per_conversation=0, max_wait_s=1)
+        order = []
+        gate = asyncio.Event()
+
+        async def call(user, tag):
+            async with ctl.slot(user, f"conv-{user}"):
+                order.append(tag)
+                await gate.wait()
+
+        tasks = [asyncio.create_task(call("a", "a1"))]
+        await asyncio.sleep(0)
+        for user, tag in [("a", "a2"), ("a", "a3"), ("b", "b1")]:
+            tasks.append(asyncio.create_task(call(user, tag)))
+            await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    # "b" no espera detrás de todas las consultas de "a".
+    assert asyncio.run(scenario()) == ["a1", "a2", "b1", "a3"]
+
+
+def test_per_user_cap_rejects_after_wait():
+    async def scenario():
+        ctl = AdmissionController(max_concurrent=0, per_user=1, per_conversation=0, max_wait_s=0.05)
+        async with ctl.slot("u", "c1"):
+            async with ctl.slot("other", "c1"):
+                pass
+            with pytest.raises(AdmissionRejected):
+                async with ctl.slot("u", "c2"):
+                    pass
+        return ctl.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 1 and stats["active"] == 0 and stats["waiting"] == 0
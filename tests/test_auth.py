@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+
+from src.teams_gw import auth
+from src.teams_gw.auth import BotTokenCache
+
+
+class FakeMsalApp:
+    calls = []
+    delay = 0.0
+    lock = threading.Lock()
+
+    def __init__(self, client_id, client_credential, authority):
+        self.client_id = client_id
+        self.authority = authority
+
+    def remove_tokens_for_client(self):
+        pass
+
+    def acquire_token_for_client(self, scopes):
+        time.sleep(self.delay)
+        with self.lock:
+            FakeMsalApp.calls.append((self.client_id, self.authority, scopes[0]))
+            n = len(FakeMsalApp.calls)
+        return {"access_token": f"{self.client_id}-{scopes[0]}-{n}", "expires_in": 3600}
+
+
+def _cache(monkeypatch, delay=0.0):
+    FakeMsalApp.calls = []
+    FakeMsalApp.delay = delay
+    monkeypatch.setattr(auth, "ConfidentialClientApplication", FakeMsalApp)
+    return BotTokenCache(margin_s=300, refresh_ahead_s=600)
+
+
+def test_concurrent_cold_start_acquires_once(monkeypatch):
+    cache = _cache(monkeypatch, delay=0.05)
+
+    async def run():
+        return await asyncio.gather(*[cache.get_token_async("app", "pw", "auth", "scope") for _ in range(5)])
+
+    tokens = asyncio.run(run())
+    assert len(FakeMsalApp.calls) == 1 and len(set(tokens)) == 1
+
+
+def test_tokens_are_keyed_by_app_authority_and_scope(monkeypatch):
+    cache = _cache(monkeypatch)
+    a = cache.get_token("app", "pw", "auth", "scope-a")
+    b = cache.get_token("app", "pw", "auth", "scope-b")
+    c = cache.get_token("other", "pw", "auth", "scope-a")
+    assert len({a, b, c}) == 3
+    assert cache.get_token("app", "pw", "auth", "scope-a") == a
+    assert len(FakeMsalApp.calls) == 3
+
+
+def test_refresh_ahead_serves_current_token_and_renews_in_background(monkeypatch):
+    cache = _cache(monkeypatch)
+    first = cache.get_token("app", "pw", "auth", "scope")
+    entry = cache._entries[("app", "auth", "scope")]
+    entry.expires_at = time.time() + 400  # dentro de la ventana de refresh-ahead
+    FakeMsalApp.delay = 0.2
+
+    started = time.perf_counter()
+    assert cache.get_token("app", "pw", "auth", "scope") == first
+    assert time.perf_counter() - started < 0.1
+    entry.refreshing.result()
+    assert cache.get_token("app", "pw", "auth", "scope") != first
+
+
+def test_sync_path_serves_stale_token_instead_of_blocking(monkeypatch):
+    cache = _cache(monkeypatch)
+    first = cache.get_token("app", "pw", "auth", "scope")
+    entry = cache._entries[("app", "auth", "scope")]
+    entry.expires_at = time.time() + 60  # ya dentro del margen, pero aún no expiró
+    FakeMsalApp.delay = 0.2
+
+    for force in (False, True):
+        started = time.perf_counter()
+        assert cache.get_token("app", "pw", "auth", "scope", force_refresh=force) == first
+        assert time.perf_counter() - started < 0.1
+    entry.refreshing.result()
+    assert len(FakeMsalApp.calls) == 2
@@ -0,0 +1,27 @@
+import asyncio
+
+from src.teams_gw.background import BackgroundWorkers
+
+
+def test_bounded_queue_and_drain():
+    async def scenario():
+        workers = BackgroundWorkers(workers=1, queue_max=1)
+        done = []
+
+        async def job(n):
+            await asyncio.sleep(0.01)
+            done.append(n)
+
+        assert not workers.submit(lambda: job(0))  # aún no arrancó
+        workers.start()
+        assert workers.submit(lambda: job(1))
+        await asyncio.sleep(0)  # el worker toma el primero
+        assert workers.submit(lambda: job(2))
+        assert not workers.submit(lambda: job(3))  # cola llena
+        await workers.drain(timeout_s=1)
+        assert not workers.submit(lambda: job(4))
+        return done, workers.stats()
+
+    done, stats = asyncio.run(scenario())
+    assert done == [1, 2]
+    assert stats["completed"] == 2 and stats["rejected"] == 3
@@ -0,0 +1,115 @@
+import asyncio
+
+from src.teams_gw.cache import ResultCache, normalize_intent
+
+def test_normalize_intent_folds_case_accents_spaces():
+    assert normalize_intent("  Facturas   PENDIENTES de págo ") == "facturas pendientes de pago"
+
+def test_concurrent_identical_questions_share_one_call():
+    cache = ResultCache(max_bytes=10_000, default_ttl_s=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"rows": [[1]]}
+
+    async def run():
+        key = cache.key("odoo", "Facturas pendientes")
+        results = await asyncio.gather(*[cache.get_or_fetch(key, 60, fetch) for _ in range(5)])
+        again = await cache.get_or_fetch(cache.key("ODOO", "facturas  pendientes"), 60, fetch)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(r == {"rows": [[1]]} for r in results) and again == {"rows": [[1]]}
+
+def test_fresh_bypasses_cached_entry():
+    cache = ResultCache(max_bytes=10_000, default_ttl_s=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    async def run():
+        key = cache.key("odoo", "q")
+        await cache.get_or_fetch(key, 60, fetch)
+        return await cache.get_or_fetch(key, 60, fetch, fresh=True)
+
+    assert asyncio.run(run()) == {"n": 2}
+
+def test_lru_eviction_under_budget():
+    cache = ResultCache(max_bytes=40, default_ttl_s=60)
+
+    async def run():
+        for name in ("a", "b", "c"):
+            async def fetch(name=name):
+                return {"v": name * 10}
+            await cache.get_or_fetch(cache.key("odoo", name), 60, fetch)
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert stats["bytes"] <= 40 and stats["evictions"] >= 1
+
+def test_cancelled_leader_does_not_cancel_coalesced_waiter():
+    cache = ResultCache(max_bytes=10_000, default_ttl_s=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"rows": [[1]]}
+
+    async def run():
+        key = cache.key("odoo", "q")
+        leader = asyncio.ensure_future(cache.get_or_fetch(key, 60, fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_fetch(key, 60, fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        result = await waiter
+        return leader.cancelled(), result
+
+    cancelled, result = asyncio.run(run())
+    assert cancelled and result == {"rows": [[1]]}
+    assert len(calls) == 1 and cache.stats()["entries"] == 1
+
+def test_upstream_call_cancelled_when_last_caller_leaves():
+    cache = ResultCache(max_bytes=10_000, default_ttl_s=60)
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return {}
+
+    async def run():
+        key = cache.key("odoo", "q")
+        caller = asyncio.ensure_future(cache.get_or_fetch(key, 60, fetch))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+        return cache.stats()["inflight"]
+
+    assert asyncio.run(run()) == 0
+    assert cancelled == [1]
+
+def test_failed_fetch_reaches_every_waiter():
+    cache = ResultCache(max_bytes=10_000, default_ttl_s=60)
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        key = cache.key("odoo", "q")
+        return await asyncio.gather(*[cache.get_or_fetch(key, 60, fetch) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.stats()["inflight"] == 0
@@ -0,0 +1,26 @@
+from src.teams_gw.commands import CommandParser, ParsedCommand
+
+parser = CommandParser(["dt:", "consulta ", "n2sql:"])
+
+
+def test_header_with_dataset_and_fresh_flag():
+    assert parser.parse("  DT[Odoo]!: facturas pendientes ") == ParsedCommand(
+        trigger="dt", query="facturas pendientes", dataset="Odoo", fresh=True
+    )
+    assert parser.parse("dt: ventas: por mes") == ParsedCommand("dt", "ventas: por mes")
+    assert parser.parse("n2sql[crm]: leads") == ParsedCommand("n2sql", "leads", "crm")
+
+
+def test_prefix_and_non_commands():
+    assert parser.parse("consulta de ventas") == ParsedCommand("consulta", "de ventas")
+    assert parser.parse("dt[]: x") == ParsedCommand("dt", "x")
+    assert parser.parse("dtx: hola") is None
+    assert parser.parse("faq") is None
+    assert parser.parse("") is None
+
+
+def test_fan_out_datasets():
+    assert parser.parse("dt[odoo, crm,ODOO]!: ventas") == ParsedCommand(
+        trigger="dt", query="ventas", dataset=None, fresh=True, datasets=("odoo", "crm")
+    )
+    assert parser.parse("dt[odoo,]: ventas") == ParsedCommand("dt", "ventas", "odoo")
@@ -0,0 +1,202 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.teams_gw import n2sql_client as n2sql_module
+from src.teams_gw.deadlines import DEADLINE_HEADER, AdaptiveTimeouts, DeadlineExceeded, remaining, turn_deadline
+from src.teams_gw.n2sql_client import N2SQLClient
+
+
+def _timeouts(**overrides):
+    options = dict(
+        enabled=True, static_s=30.0, percentile=99, multiplier=2.0, min_s=2.0, min_samples=3, window=50, slow_s=6.0
+    )
+    options.update(overrides)
+    return AdaptiveTimeouts(**options)
+
+
+def test_turn_deadline_is_scoped():
+    assert remaining() is None
+    with turn_deadline(10):
+        assert 9 < remaining() <= 10
+        with turn_deadline(1):
+            assert remaining() <= 1
+        assert remaining() > 9
+    assert remaining() is None
+
+
+def test_timeout_adapts_to_observed_latency_within_bounds():
+    timeouts = _timeouts()
+    assert timeouts.timeout_for("crm") == 30.0  # sin muestras: timeout estático
+    for seconds in (0.2, 0.3, 0.4):
+        timeouts.observe("crm", seconds)
+    assert timeouts.timeout_for("crm") == 2.0  # 0.4 * 2 se eleva al mínimo
+    for seconds in (4.0, 5.0, 9.0):
+        timeouts.observe("odoo", seconds)
+    assert timeouts.timeout_for("odoo") == 18.0
+    for _ in range(3):
+        timeouts.observe("dwh", 25.0)
+    assert timeouts.timeout_for("dwh") == 30.0  # nunca más que el estático
+    assert timeouts.is_slow("dwh")  # mediana 25s >= 6s
+    assert not timeouts.is_slow("odoo") and not timeouts.is_slow("crm")
+    assert not _timeouts(enabled=False).is_slow("odoo")
+
+
+def _client(handler, monkeypatch, timeouts):
+    monkeypatch.setattr(n2sql_module, "dataset_timeouts", timeouts)
+    client = N2SQLClient()
+    client._http = httpx.AsyncClient(base_url="http://n2sql", transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_remaining_budget_is_sent_and_caps_the_timeout(monkeypatch):
+    seen = {}
+
+    def handler(request):
+        seen["deadline_ms"] = int(request.headers[DEADLINE_HEADER])
+        seen["timeout"] = request.extensions["timeout"]["read"]
+        return httpx.Response(200, json={"columns": ["a"], "rows": [[1]]})
+
+    timeouts = _timeouts()
+    client = _client(handler, monkeypatch, timeouts)
+
+    async def scenario():
+        with turn_deadline(5):
+            return await client._post(client.build_payload("q", "crm"))
+
+    assert asyncio.run(scenario())["rows"] == [[1]]
+    assert 4000 < seen["deadline_ms"] <= 5000
+    assert seen["timeout"] <= 5
+    assert timeouts.stats()["crm"]["samples"] == 1
+
+
+def test_exhausted_budget_fails_without_calling_n2sql(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={})
+
+    client = _client(handler, monkeypatch, _timeouts())
+
+    async def scenario():
+        with turn_deadline(0):
+            await client._post(client.build_payload("q", "crm"))
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scenario())
+    assert calls == []
+
+
+def test_unknown_datasets_share_latency_samples():
+    timeouts = _timeouts(datasets=frozenset({"odoo"}))
+    for name in ("a", "b", "c"):
+        timeouts.observe(name, 8.0)
+    assert set(timeouts.stats()) == {"other"}
+    assert timeouts.is_slow("nunca visto") and not timeouts.is_slow("odoo")
+
+
+def test_dataset_hitting_the_turn_budget_is_routed_to_background(monkeypatch):
+    from src.teams_gw import bot as bot_module
+
+    def handler(request):
+        raise httpx.ReadTimeout("lento", request=request)
+
+    timeouts = _timeouts(min_samples=20, slow_streak=3)
+    client = _client(handler, monkeypatch, timeouts)
+    monkeypatch.setattr(bot_module, "dataset_timeouts", timeouts)
+    monkeypatch.setattr(bot_module.client, "dataset_for", lambda dataset: dataset)
+
+    async def attempt():
+        with turn_deadline(8):  # menos que el timeout estático: el turno recorta
+            await client._post(client.build_payload("q", "dwh"))
+
+    for _ in range(3):
+        assert not bot_module._slow_dataset("dwh")
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(attempt())
+    # Cada recorte cuenta como una muestra de al menos el presupuesto (~8s >= 6s).
+    assert timeouts.stats()["dwh"]["samples"] == 3
+    assert bot_module._slow_dataset("dwh")
+
+    timeouts.observe("dwh", 0.5)  # una respuesta rápida corta la racha
+    assert not bot_module._slow_dataset("dwh")
+
+
+def test_clipped_request_is_capped_as_a_whole(monkeypatch):
+    # Un N2SQL que gotea la respuesta nunca dispara el timeout de lectura de
+    # httpx; el recorte del turno tiene que cortar la petición entera.
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={"columns": ["a"], "rows": [[1]]})
+
+    timeouts = _timeouts()
+    client = _client(handler, monkeypatch, timeouts)
+
+    async def scenario(keep_rows):
+        with turn_deadline(0.2):
+            await client._post(client.build_payload("q", "crm"), keep_rows=keep_rows)
+
+    for keep_rows in (None, 10):
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(scenario(keep_rows))
+    assert timeouts.stats()["crm"]["samples"] == 2
+
+
+def test_every_timeout_kind_is_observed_and_mapped_when_clipped(monkeypatch):
+    def handler(request):
+        raise httpx.ConnectTimeout("sin conexión", request=request)
+
+    timeouts = _timeouts()
+    client = _client(handler, monkeypatch, timeouts)
+
+    async def attempt():
+        with turn_deadline(5):
+            await client._post(client.build_payload("q", "crm"))
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(attempt())
+    with pytest.raises(httpx.ConnectTimeout):  # sin recorte se propaga tal cual
+        asyncio.run(client._post(client.build_payload("q", "crm")))
+    assert timeouts.stats()["crm"]["samples"] == 2
+
+
+def test_inline_overrun_hands_the_same_n2sql_call_to_the_background(monkeypatch):
+    from botbuilder.core import ConversationState, MemoryStorage, TurnContext
+    from botbuilder.core.adapters import TestAdapter
+    from botbuilder.schema import Activity
+
+    from src.teams_gw import bot as bot_module
+
+    calls = []
+
+    async def ask(query, **kwargs):
+        calls.append(remaining())
+        await asyncio.sleep(0.3)
+        return {"columns": ["a"], "rows": [[1]]}
+
+    monkeypatch.setattr(bot_module.client, "ask", ask)
+    monkeypatch.setattr(bot_module.settings, "ASYNC_REPLIES", False)
+    monkeypatch.setattr(bot_module, "_slow_dataset", lambda dataset: False)
+
+    async def scenario():
+        bot_module.background.start()
+        bot = bot_module.TeamsGatewayBot(ConversationState(MemoryStorage()))
+        adapter = TestAdapter(bot.on_turn)
+
+        async def continue_conversation(reference, work, bot_id=None):
+            activity = TurnContext.apply_conversation_reference(Activity(type="event"), reference, True)
+            await work(TurnContext(adapter, activity))
+
+        adapter.continue_conversation = continue_conversation
+        with turn_deadline(0.1):
+            await adapter.send(Activity(type="message", text="dt: ventas"))
+        await bot_module.background.drain(2)
+        return [activity.text for activity in adapter.activity_buffer]
+
+    texts = asyncio.run(scenario())
+    assert len(calls) == 1  # el worker no repite la consulta
+    assert calls[0] > 1  # corre con el presupuesto de segundo plano, no con el del turno
+    assert bot_module.LATE_RESULT_MESSAGE in texts
+    assert any("1" in (text or "") for text in texts[texts.index(bot_module.LATE_RESULT_MESSAGE) + 1:])
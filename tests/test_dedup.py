@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.teams_gw.dedup import ActivityDeduplicator, activity_key
+
+
+def test_retry_waits_for_original_and_reuses_response():
+    async def scenario():
+        dedup = ActivityDeduplicator(max_entries=10, ttl_s=60)
+        calls = []
+
+        async def handler():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"ok": True}
+
+        activity = SimpleNamespace(id="a1", conversation=SimpleNamespace(id="c1"))
+        key = activity_key(activity)
+        first, retry = await asyncio.gather(dedup.run(key, handler), dedup.run(key, handler))
+        late = await dedup.run(key, handler)
+        return calls, [first, retry, late], dedup.stats()
+
+    calls, responses, stats = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(r == {"ok": True} for r in responses)
+    assert stats["duplicates"] == 2
+
+
+def test_failed_original_is_forgotten():
+    async def scenario():
+        dedup = ActivityDeduplicator(max_entries=10, ttl_s=60)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("boom")
+            return "ok"
+
+        try:
+            await dedup.run("c|a", flaky)
+        except RuntimeError:
+            pass
+        return await dedup.run("c|a", flaky), attempts
+
+    result, attempts = asyncio.run(scenario())
+    assert result == "ok" and len(attempts) == 2
+    assert activity_key(SimpleNamespace(id=None, conversation=None)) is None
+
+
+def test_expire_skips_in_flight_entries_and_keeps_purging():
+    async def scenario():
+        dedup = ActivityDeduplicator(max_entries=100, ttl_s=0)
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "lento"
+
+        async def fast():
+            return "rápido"
+
+        pending = asyncio.ensure_future(dedup.run("c|lento", slow))
+        await asyncio.sleep(0)
+        for i in range(5):
+            await dedup.run(f"c|{i}", fast)
+        await dedup.run("c|otro", fast)
+        entries = list(dedup._seen)
+        release.set()
+        await pending
+        return entries
+
+    entries = asyncio.run(scenario())
+    assert entries == ["c|lento", "c|otro"]
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import httpx
+
+from src.teams_gw.deadlines import remaining
+from src.teams_gw.fanout import FanOutResult, fan_out, render_fanout
+from src.teams_gw.formatters import ResultSet, merge_results
+
+
+def test_partial_results_within_shared_deadline():
+    budgets = {}
+
+    async def ask(dataset):
+        budgets[dataset] = remaining()
+        if dataset == "crm":
+            raise httpx.ConnectError("down")
+        if dataset == "dwh":
+            await asyncio.sleep(5)
+        return {"columns": ["cliente"], "rows": [[dataset]]}
+
+    started = time.perf_counter()
+    result = asyncio.run(fan_out(ask, ["odoo", "crm", "dwh"], budget_s=0.1))
+    assert time.perf_counter() - started < 1
+    assert list(result.payloads) == ["odoo"]
+    assert result.errors == {"crm": "falló la consulta", "dwh": "no respondió a tiempo"}
+    assert all(0 < b <= 0.1 for b in budgets.values())
+
+
+def test_merge_results_adds_dataset_column_and_unions_headers():
+    odoo = ResultSet.from_payload({"columns": ["cliente", "total"], "rows": [["A", 1], ["B", 2], ["C", 3]]})
+    crm = ResultSet.from_payload({"data": [{"cliente": "X", "etapa": "won"}]})
+    merged = merge_results({"odoo": odoo, "crm": crm}, per_dataset=2)
+    assert merged.headers == ["dataset", "cliente", "total", "etapa"]
+    assert merged.columns == [
+        ["odoo", "odoo", "crm"],
+        ["A", "B", "X"],
+        [1, 2, None],
+        [None, None, "won"],
+    ]
+    assert merged.total == 4
+
+
+def test_render_layouts_and_partial_note():
+    result = FanOutResult(
+        {"odoo": {"columns": ["n"], "rows": [[1]]}, "crm": {"columns": ["n"], "rows": [[2]]}},
+        {"dwh": "no respondió a tiempo"},
+    )
+    merged = "\n".join(render_fanout(result, "merged", 20))
+    assert merged.startswith("dataset | n")
+    assert "odoo | 1" in merged and "crm | 2" in merged
+    assert merged.endswith("_Resultados parciales. Sin respuesta de dwh: no respondió a tiempo._")
+
+    sections = render_fanout(result, "sections", 20)
+    assert sections[0].startswith("**odoo**\n\nn\n---\n1")
+    assert sections[1].startswith("**crm**")
+
+    assert render_fanout(FanOutResult({}, {"odoo": "falló la consulta"}), "merged", 20) == [
+        "_No pude obtener resultados (odoo: falló la consulta)._"
+    ]
+
+
+def test_merge_results_keeps_a_real_dataset_column():
+    odoo = ResultSet.from_payload({"columns": ["dataset", "n"], "rows": [["ventas", 1]]})
+    crm = ResultSet.from_payload({"columns": ["n"], "rows": [[2]]})
+    merged = merge_results({"odoo": odoo, "crm": crm}, per_dataset=5)
+    assert merged.headers == ["_dataset", "dataset", "n"]
+    assert merged.columns == [["odoo", "crm"], ["ventas", None], [1, 2]]
+
+
+def test_fan_out_siblings_share_one_admission_slot():
+    from src.teams_gw.admission import AdmissionController
+
+    admission = AdmissionController(max_concurrent=8, per_user=2, per_conversation=3, max_wait_s=0.05)
+    shared = admission.shared_slot("u1", "c1")
+    active = []
+
+    async def ask(dataset):
+        async with shared():
+            active.append(admission.stats()["active"])
+            await asyncio.sleep(0.1)  # más que la espera máxima de admisión
+        return {"columns": ["n"], "rows": [[dataset]]}
+
+    async def run():
+        async with admission.slot("u1", "c1"):  # otra consulta del mismo usuario en curso
+            return await fan_out(ask, ["a", "b", "c", "d"], budget_s=1)
+
+    result = asyncio.run(run())
+    assert list(result.payloads) == ["a", "b", "c", "d"] and result.errors == {}
+    assert active == [2, 2, 2, 2]
+    assert admission.stats()["active"] == 0 and admission.stats()["rejected"] == 0
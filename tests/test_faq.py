@@ -0,0 +1,52 @@
+import json
+import os
+
+from src.teams_gw.faq import DEFAULT_CATALOG_PATH, FaqCatalog, build_faq_card, load_catalog
+
+
+def test_default_catalog_compiles():
+    catalog = FaqCatalog(DEFAULT_CATALOG_PATH)
+    attachment = catalog.attachment()
+    assert attachment.content_type == "application/vnd.microsoft.card.adaptive"
+    assert attachment.content == build_faq_card(load_catalog(DEFAULT_CATALOG_PATH))
+    assert catalog.attachment() is attachment
+
+
+def test_reload_swaps_card_and_keeps_previous_on_error(tmp_path):
+    path = tmp_path / "faq.json"
+    group = {"title": "Ventas", "items": [{"title": "Top", "desc": "", "query": "top ventas"}]}
+    path.write_text(json.dumps({"groups": [group]}), encoding="utf-8")
+    catalog = FaqCatalog(path)
+    first = catalog.attachment()
+
+    path.write_text(json.dumps([group, dict(group, title="Compras")]), encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+    assert catalog.reload()
+    assert [g["title"] for g in catalog.groups] == ["Ventas", "Compras"]
+    second = catalog.attachment()
+    assert second is not first
+
+    path.write_text("{roto", encoding="utf-8")
+    os.utime(path, ns=(2, 2))
+    assert not catalog.reload()
+    assert catalog.attachment() is second
+
+
+def test_missing_catalog_is_not_retried_per_message(tmp_path, monkeypatch, caplog):
+    from src.teams_gw import faq
+
+    path = tmp_path / "faq.json"
+    catalog = FaqCatalog(path)
+    stats = []
+    real_stat = os.stat
+    monkeypatch.setattr(faq.os, "stat", lambda p: stats.append(p) or real_stat(p))
+    with caplog.at_level("WARNING", logger="teams_gw.faq"):
+        for _ in range(5):
+            assert catalog.attachment() is None
+    assert len(stats) == 1 and len(caplog.records) == 1
+
+    # El watcher lo recompila cuando el archivo aparece.
+    group = {"title": "Ventas", "items": [{"title": "Top", "desc": "", "query": "top ventas"}]}
+    path.write_text(json.dumps([group]), encoding="utf-8")
+    assert catalog.reload()
+    assert catalog.attachment() is not None
@@ -1,4 +1,5 @@
-from src.teams_gw.formatters import format_n2sql_payload
+from src.teams_gw.settings import settings
+from src.teams_gw.formatters import ResultSet, format_n2sql_payload
 
 def test_table_columns_rows():
     payload = {"columns": ["a", "b"], "rows": [[1, 2], [3, 4]], "sql": "select 1"}
@@ -42,3 +43,36 @@ def test_fallback_json():
     payload = {"unexpected": 1}
     md = format_n2sql_payload(payload)
     assert md.startswith("````json")
+
+def test_result_set_is_columnar_and_renders_ranges():
+    payload = {"columns": ["a", "b"], "rows": [[i, None] for i in range(5)]}
+    result = ResultSet.from_payload(payload)
+    assert result.columns == [[0, 1, 2, 3, 4], [None] * 5]
+    md = result.render(2, 4, total=5)
+    assert "0 | " not in md and "2 | " in md and "3 | " in md
+    assert "_Filas 3–4 de 5._" in md
+
+def test_result_set_state_roundtrip():
+    payload = {"data": [{"x": 10, "y": 20}, {"x": 30, "y": 40}]}
+    result = ResultSet.from_state(ResultSet.from_payload(payload).to_state())
+    assert result.headers == ["x", "y"] and result.total == 2
+    assert "30 | 40" in result.render()
+
+def test_render_chunks_respects_byte_budget_and_repeats_headers():
+    payload = {"columns": ["cliente", "total"], "rows": [[f"cliente {i}", i] for i in range(200)]}
+    chunks = ResultSet.from_payload(payload).render_chunks(0, 200, max_bytes=500, total=200)
+    assert len(chunks) > 1
+    assert all(len(c.encode("utf-8")) <= 500 for c in chunks)
+    assert all(c.startswith("cliente | total\n--- | ---") for c in chunks)
+    assert "cliente 199 | 199" in chunks[-1]
+
+def test_render_chunks_reserves_room_for_footer_and_sql(monkeypatch):
+    monkeypatch.setattr(settings, "N2SQL_SHOW_SQL", True)
+    rows = [[f"cliente {i}", i] for i in range(200)]
+    for sql in ("SELECT cliente, total FROM ventas WHERE " + "x = 1 AND " * 20, "SELECT " + "c, " * 400):
+        payload = {"columns": ["cliente", "total"], "rows": rows, "sql": sql}
+        for budget in (300, 500, 777):
+            chunks = ResultSet.from_payload(payload).render_chunks(0, 200, max_bytes=budget, total=200)
+            assert all(len(c.encode("utf-8")) <= budget for c in chunks)
+            assert "cliente 199 | 199" in chunks[-1] and "> SQL: `SELECT" in chunks[-1]
+            assert sum(c.count("\ncliente ") for c in chunks) == 200
@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+
+import pytest
+from botbuilder.schema import Activity
+
+from src.teams_gw.dedup import activity_key
+from src.teams_gw.inbound import FastJSONResponse, InboundActivity, deserialize_activity
+
+PAYLOADS = sorted((Path(__file__).parent.parent / "benchmarks" / "payloads").glob("*.json"))
+
+
+@pytest.mark.parametrize("path", PAYLOADS, ids=lambda p: p.stem)
+def test_fast_path_matches_msrest(path):
+    raw = path.read_bytes()
+    body = json.loads(raw)
+    expected = Activity().deserialize(body)
+
+    inbound = InboundActivity.parse(raw)
+    assert inbound.id == expected.id
+    assert inbound.type == expected.type
+    assert inbound.service_url == expected.service_url
+    assert inbound.conversation_id == expected.conversation.id
+    assert inbound.from_id == expected.from_property.id
+    assert inbound.recipient_id == expected.recipient.id
+    assert activity_key(inbound) == activity_key(expected)
+    assert deserialize_activity(body).serialize() == expected.serialize()
+
+
+def test_activity_is_built_lazily_once():
+    inbound = InboundActivity({"type": "message", "id": "1", "text": "hola"})
+    assert inbound._activity is None
+    activity = inbound.activity
+    assert activity.text == "hola"
+    assert inbound.activity is activity
+
+
+def test_rejects_non_object_body():
+    with pytest.raises(ValueError):
+        InboundActivity.parse(b"[1, 2]")
+
+
+def test_fast_json_response_keeps_unicode():
+    response = FastJSONResponse({"ok": True, "msg": "acción"})
+    assert json.loads(response.body) == {"ok": True, "msg": "acción"}
@@ -0,0 +1,46 @@
+import json
+import logging
+
+from src.teams_gw.logging_config import JsonFormatter, SamplingFilter, parse_sampling
+
+
+def _record(name, level, msg="hola", **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_never_drops_warnings():
+    sampler = SamplingFilter(parse_sampling("teams_gw=1,teams_gw.app=0,bad,x=y"))
+    assert not sampler.filter(_record("teams_gw.app", logging.INFO))
+    assert not sampler.filter(_record("teams_gw.app.sub", logging.DEBUG))
+    assert sampler.filter(_record("teams_gw.app", logging.WARNING))
+    assert sampler.filter(_record("teams_gw.app", logging.ERROR))
+    assert sampler.filter(_record("teams_gw.bot", logging.INFO))
+    assert sampler.filter(_record("uvicorn", logging.INFO))
+
+
+def test_json_formatter_fields():
+    line = JsonFormatter().format(
+        _record("teams_gw.app", logging.INFO, trace_id="abc", conversation_id=None, timings={"auth": 1.5})
+    )
+    entry = json.loads(line)
+    assert entry["msg"] == "hola" and entry["level"] == "INFO"
+    assert entry["trace_id"] == "abc" and "conversation_id" not in entry
+    assert entry["timings"] == {"auth": 1.5}
+
+
+def test_shutdown_flushes_queue_and_keeps_later_logs(capsys):
+    from src.teams_gw import logging_config
+
+    root = logging.getLogger()
+    saved = root.handlers, root.level
+    try:
+        logging_config.configure_logging()
+        logging.getLogger("teams_gw.test").warning("antes del cierre")
+        logging_config.shutdown_logging()
+        logging.getLogger("teams_gw.test").warning("después del cierre")
+        err = capsys.readouterr().err
+    finally:
+        root.handlers, root.level = saved
+    assert "antes del cierre" in err and "después del cierre" in err
@@ -0,0 +1,21 @@
+from src.teams_gw.metrics import Counter, Histogram, Registry
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    hist = registry.register(Histogram("t_seconds", "Latencia.", ("stage",), buckets=(0.1, 1.0)))
+    counter = registry.register(Counter("t_events_total", "Eventos.", ("kind",)))
+    hist.observe(0.05, "parse")
+    hist.observe(0.5, "parse")
+    hist.observe(5, "parse")
+    counter.inc("a")
+    counter.inc("a", amount=2)
+
+    text = registry.render()
+    assert "# TYPE t_seconds histogram" in text
+    assert 't_seconds_bucket{stage="parse",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="parse",le="1"} 2' in text
+    assert 't_seconds_bucket{stage="parse",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="parse"} 3' in text
+    assert 't_events_total{kind="a"} 3' in text
+    assert hist.count("parse") == 3
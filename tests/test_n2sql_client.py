@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+
+from src.teams_gw.n2sql_client import N2SQLClient
+
+ALL_ROWS = [[i] for i in range(30)]
+
+
+def _client(handler):
+    client = N2SQLClient()
+    client._http = httpx.AsyncClient(base_url="http://n2sql", transport=httpx.MockTransport(handler))
+    return client
+
+
+def _page(client, offset, limit, dataset="odoo"):
+    body = client.build_payload("ventas", dataset, limit=limit, offset=offset)
+    return asyncio.run(client._post(body))
+
+
+def _paging_server(request):
+    params = json.loads(request.content)["params"]
+    offset, limit = params["offset"], params.get("limit")
+    rows = ALL_ROWS[offset:] if limit is None else ALL_ROWS[offset: offset + limit]
+    return httpx.Response(200, json={"columns": ["n"], "rows": rows})
+
+
+def _ignoring_server(request):
+    return httpx.Response(200, json={"columns": ["n"], "rows": ALL_ROWS})
+
+
+def test_page_from_a_paging_server_is_kept_as_is():
+    client = _client(_paging_server)
+    assert _page(client, 0, 21)["rows"] == ALL_ROWS[:21]
+    assert _page(client, 20, 6)["rows"] == ALL_ROWS[20:26]
+    assert _page(client, 25, 50)["rows"] == ALL_ROWS[25:]  # última página corta
+
+
+def test_server_ignoring_offset_is_paged_locally():
+    client = _client(_ignoring_server)
+    first = _page(client, 0, 21)
+    assert first["rows"] == ALL_ROWS[:21] and first["rowcount"] == 30
+    # La página 2 trae menos filas que el límite: sin la marca del dataset se mostrarían las filas 0..29.
+    second = _page(client, 20, 51)
+    assert second["rows"] == ALL_ROWS[20:]
+    assert _page(client, 20, None)["rows"] == ALL_ROWS[20:]
+
+
+def test_echoed_offset_or_rowcount_decides_without_history():
+    def echoing(request):
+        return httpx.Response(200, json={"columns": ["n"], "rows": ALL_ROWS[20:], "offset": 20})
+
+    assert _page(_client(echoing), 20, 51)["rows"] == ALL_ROWS[20:]
+
+    def full_with_rowcount(request):
+        return httpx.Response(200, json={"columns": ["n"], "rows": ALL_ROWS, "rowcount": 30})
+
+    assert _page(_client(full_with_rowcount), 20, 51)["rows"] == ALL_ROWS[20:]
+
+
+def test_cache_hits_do_not_take_an_admission_slot():
+    from src.teams_gw.admission import AdmissionController, AdmissionRejected
+
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(200, json={"columns": ["n"], "rows": [[1]]})
+
+    client = _client(handler)
+    admission = AdmissionController(max_concurrent=1, per_user=0, per_conversation=0, max_wait_s=0.05)
+
+    async def run():
+        admit = lambda: admission.slot("u1", "c1")  # noqa: E731
+        first = await client.ask("cupos y caché", dataset="admission-test", admit=admit)
+        async with admission.slot("u2", "c2"):  # N2SQL ocupado: no queda cupo
+            cached = await client.ask("Cupos y  caché", dataset="admission-test", admit=admit)
+            try:
+                await client.ask("cupos y caché", dataset="admission-test", fresh=True, admit=admit)
+            except AdmissionRejected:
+                rejected = True
+            else:
+                rejected = False
+        return first, cached, rejected
+
+    first, cached, rejected = asyncio.run(run())
+    assert cached == first and rejected and len(calls) == 1
+
+
+def test_cache_hits_are_labelled_apart_from_upstream_latency():
+    from src.teams_gw.metrics import N2SQL_ASK_SECONDS
+
+    client = _client(lambda request: httpx.Response(200, json={"columns": ["n"], "rows": [[1]]}))
+
+    def counted(status):
+        for line in N2SQL_ASK_SECONDS.samples():
+            if line.startswith("teams_gw_n2sql_ask_seconds_count") and f'status="{status}"' in line and 'dataset="odoo"' in line:
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    before_ok, before_hit = counted("ok"), counted("cache_hit")
+
+    async def run():
+        await client.ask("etiquetas de latencia", dataset="odoo")
+        await client.ask("etiquetas de latencia", dataset="odoo")
+
+    asyncio.run(run())
+    assert counted("ok") == before_ok + 1 and counted("cache_hit") == before_hit + 1
@@ -0,0 +1,132 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.teams_gw.resilience import CLOSED, HALF_OPEN, OPEN, BreakerOpen, ResilientCaller, backoff_delay
+
+
+def _status_error(code):
+    request = httpx.Request("POST", "http://n2sql/v1/query")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+
+def _caller(**overrides):
+    options = dict(retry_attempts=2, retry_base_s=0.001, retry_max_s=0.002, failure_threshold=2, reset_timeout_s=0.05)
+    options.update(overrides)
+    return ResilientCaller(**options)
+
+
+def test_transient_errors_are_retried_until_success():
+    caller = _caller()
+    errors = [httpx.ConnectError("refused"), _status_error(503)]
+
+    async def fetch():
+        if errors:
+            raise errors.pop(0)
+        return {"rows": [[1]]}
+
+    assert asyncio.run(caller.call("odoo", fetch)) == {"rows": [[1]]}
+    assert caller.breaker("odoo").state == CLOSED
+
+
+def test_client_errors_and_read_timeouts_are_not_retried():
+    caller = _caller()
+    for exc in (_status_error(400), httpx.ReadTimeout("slow")):
+        calls = []
+
+        async def fetch(exc=exc):
+            calls.append(1)
+            raise exc
+
+        with pytest.raises(type(exc)):
+            asyncio.run(caller.call("odoo", fetch))
+        assert len(calls) == 1
+
+
+def test_breaker_opens_fails_fast_and_recovers_after_probe():
+    caller = _caller(retry_attempts=0)
+    calls = []
+    healthy = False
+
+    async def fetch():
+        calls.append(1)
+        if not healthy:
+            raise _status_error(502)
+        return "ok"
+
+    async def scenario():
+        nonlocal healthy
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await caller.call("crm", fetch)
+        breaker = caller.breaker("crm")
+        assert breaker.state == OPEN
+        with pytest.raises(BreakerOpen):
+            await caller.call("crm", fetch)
+        assert len(calls) == 2
+        # Otro dataset no se ve afectado.
+        assert caller.breaker("odoo").state == CLOSED
+
+        await asyncio.sleep(0.06)
+        with pytest.raises(httpx.HTTPStatusError):
+            await caller.call("crm", fetch)  # la prueba falla: vuelve a abrirse
+        assert breaker.state == OPEN
+
+        await asyncio.sleep(0.06)
+        healthy = True
+        assert breaker.state == OPEN
+        assert await caller.call("crm", fetch) == "ok"
+        assert breaker.state == CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_half_open_lets_a_single_probe_through():
+    caller = _caller(retry_attempts=0, failure_threshold=1)
+
+    async def fail():
+        raise httpx.ConnectError("down")
+
+    async def slow_ok():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(httpx.ConnectError):
+            await caller.call("odoo", fail)
+        await asyncio.sleep(0.06)
+        probe = asyncio.ensure_future(caller.call("odoo", slow_ok))
+        await asyncio.sleep(0)
+        assert caller.breaker("odoo").state == HALF_OPEN
+        with pytest.raises(BreakerOpen):
+            await caller.call("odoo", slow_ok)
+        return await probe
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+def test_backoff_is_capped():
+    assert all(0 <= backoff_delay(10, 0.2, 2.0) <= 2.0 for _ in range(100))
+
+
+def test_unknown_datasets_share_one_breaker():
+    caller = _caller(datasets=frozenset({"odoo"}))
+
+    async def fail():
+        raise _status_error(500)
+
+    async def scenario():
+        for name in ("xyz1", "otro dataset"):  # umbral 2
+            with pytest.raises(httpx.HTTPStatusError):
+                await caller.call(name, fail)
+        with pytest.raises(BreakerOpen):
+            await caller.call("cualquier cosa", fail)
+        return await caller.call("ODOO", _ok)
+
+    async def _ok():
+        return "ok"
+
+    assert asyncio.run(scenario()) == "ok"
+    assert set(caller.stats()) == {"odoo", "other"}
+    assert caller.stats()["other"]["state"] == OPEN
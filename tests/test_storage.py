@@ -0,0 +1,226 @@
+import asyncio
+
+from src.teams_gw.storage import BoundedMemoryStorage, SqliteStorage
+
+
+def _memory(max_bytes=10_000, max_entry_bytes=5_000, idle_ttl_s=60):
+    return BoundedMemoryStorage(max_bytes=max_bytes, max_entry_bytes=max_entry_bytes, idle_ttl_s=idle_ttl_s)
+
+
+def test_memory_read_write_roundtrip():
+    storage = _memory()
+
+    async def run():
+        await storage.write({"conv/a": {"rows": [1, 2]}})
+        return await storage.read(["conv/a", "conv/missing"])
+
+    data = asyncio.run(run())
+    assert list(data) == ["conv/a"] and data["conv/a"]["rows"] == [1, 2]
+    assert storage.stats()["entries"] == 1 and storage.stats()["bytes"] > 0
+
+
+def test_memory_evicts_least_recently_used_over_budget():
+    storage = _memory(max_bytes=100)
+
+    async def run():
+        await storage.write({"a": {"v": "x" * 30}})
+        await storage.write({"b": {"v": "y" * 30}})
+        await storage.read(["a"])  # "b" queda como el menos usado
+        await storage.write({"c": {"v": "z" * 30}})
+        return await storage.read(["a", "b", "c"])
+
+    data = asyncio.run(run())
+    assert set(data) == {"a", "c"}
+    assert storage.stats()["evictions"] == 1 and storage.stats()["bytes"] <= 100
+
+
+def test_memory_rejects_oversized_entry():
+    storage = _memory(max_entry_bytes=50)
+
+    async def run():
+        await storage.write({"big": {"v": "x" * 100}, "small": {"v": 1}})
+        return await storage.read(["big", "small"])
+
+    assert set(asyncio.run(run())) == {"small"}
+    assert storage.stats()["rejections"] == 1
+
+
+def test_memory_expires_idle_entries(monkeypatch):
+    storage = _memory(idle_ttl_s=10)
+    clock = [1000.0]
+    monkeypatch.setattr("src.teams_gw.storage.time.monotonic", lambda: clock[0])
+
+    async def run():
+        await storage.write({"old": {"v": 1}})
+        clock[0] += 6
+        await storage.write({"new": {"v": 2}})
+        clock[0] += 6
+        return await storage.read(["old", "new"])
+
+    assert set(asyncio.run(run())) == {"new"}
+    stats = storage.stats()
+    assert stats["expirations"] == 1 and stats["entries"] == 1
+
+
+def test_memory_delete_releases_bytes():
+    storage = _memory()
+
+    async def run():
+        await storage.write({"a": {"v": 1}})
+        await storage.delete(["a"])
+        return await storage.read(["a"])
+
+    assert asyncio.run(run()) == {}
+    assert storage.stats()["bytes"] == 0
+
+
+def _sqlite(tmp_path, idle_ttl_s=0):
+    return SqliteStorage(str(tmp_path / "state.sqlite3"), idle_ttl_s=idle_ttl_s)
+
+
+def test_sqlite_read_write_assigns_integer_etag(tmp_path):
+    storage = _sqlite(tmp_path)
+
+    async def run():
+        await storage.write({"conv/a": {"rows": [1, 2]}})
+        first = await storage.read(["conv/a", "conv/missing"])
+        await storage.write({"conv/a": {"rows": [3], "e_tag": first["conv/a"]["e_tag"]}})
+        second = await storage.read(["conv/a"])
+        await storage.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert list(first) == ["conv/a"] and first["conv/a"] == {"rows": [1, 2], "e_tag": "1"}
+    assert second["conv/a"] == {"rows": [3], "e_tag": "2"}
+
+
+def test_sqlite_etag_conflict_is_rejected(tmp_path):
+    storage = _sqlite(tmp_path)
+
+    async def run():
+        await storage.write({"k": {"v": 1}})
+        await storage.write({"k": {"v": 2, "e_tag": "1"}})
+        try:
+            await storage.write({"k": {"v": 3, "e_tag": "1"}})  # etag viejo
+        except KeyError:
+            conflict = True
+        else:
+            conflict = False
+        data = await storage.read(["k"])
+        await storage.close()
+        return conflict, data
+
+    conflict, data = asyncio.run(run())
+    assert conflict and data["k"] == {"v": 2, "e_tag": "2"}
+
+
+def test_sqlite_conflict_does_not_roll_back_other_writes_in_batch(tmp_path):
+    storage = _sqlite(tmp_path)
+
+    async def run():
+        await storage.write({"k": {"v": 1}})
+        results = await asyncio.gather(
+            storage.write({"k": {"v": 2, "e_tag": "7"}}),
+            storage.write({"other": {"v": 3}}),
+            return_exceptions=True,
+        )
+        data = await storage.read(["k", "other"])
+        batches = storage.stats()["batches"]
+        await storage.close()
+        return results, data, batches
+
+    results, data, batches = asyncio.run(run())
+    assert isinstance(results[0], KeyError) and results[1] is None
+    assert data["k"]["v"] == 1 and data["other"]["v"] == 3
+    assert batches == 2  # las dos escrituras viajaron en el mismo lote
+
+
+def test_sqlite_idle_ttl_hides_and_purges_old_rows(tmp_path, monkeypatch):
+    storage = _sqlite(tmp_path, idle_ttl_s=10)
+    clock = [1000.0]
+    monkeypatch.setattr("src.teams_gw.storage.time.time", lambda: clock[0])
+
+    async def run():
+        await storage.write({"old": {"v": 1}})
+        clock[0] += 61  # pasado el TTL y el intervalo de purga
+        await storage.write({"new": {"v": 2}})
+        data = await storage.read(["old", "new"])
+        rows = storage._conn.execute("SELECT key FROM bot_state").fetchall()
+        await storage.close()
+        return data, rows
+
+    data, rows = asyncio.run(run())
+    assert set(data) == {"new"}
+    assert rows == [("new",)]
+
+
+def test_sqlite_compresses_large_values(tmp_path):
+    storage = _sqlite(tmp_path)
+    big = {"rows": [["fila %d" % i, "x" * 20] for i in range(100)]}
+
+    async def run():
+        await storage.write({"big": big, "small": {"v": 1}})
+        data = await storage.read(["big", "small"])
+        blobs = dict(storage._conn.execute("SELECT key, value FROM bot_state").fetchall())
+        await storage.close()
+        return data, blobs
+
+    data, blobs = asyncio.run(run())
+    assert blobs["big"][:1] == b"z" and blobs["small"][:1] == b"j"
+    assert data["big"]["rows"] == big["rows"] and data["small"]["v"] == 1
+
+
+def test_sqlite_reads_keep_active_conversations_alive(tmp_path, monkeypatch):
+    storage = _sqlite(tmp_path, idle_ttl_s=100)
+    clock = [1000.0]
+    monkeypatch.setattr("src.teams_gw.storage.time.time", lambda: clock[0])
+
+    async def run():
+        await storage.write({"k": {"v": 1}})
+        seen = []
+        for _ in range(3):
+            clock[0] += 70  # cada lectura llega antes del TTL, pero 210s después de escribir
+            seen.append(bool(await storage.read(["k"])))
+        await storage.close()
+        return seen
+
+    assert asyncio.run(run()) == [True, True, True]
+
+
+def test_concurrent_turns_in_one_conversation_do_not_fail_on_etag(tmp_path):
+    from botbuilder.core import ConversationState, TurnContext
+    from botbuilder.core.adapters import TestAdapter
+    from botbuilder.schema import Activity, ChannelAccount, ConversationAccount
+
+    from src.teams_gw.bot import TeamsGatewayBot
+
+    storage = _sqlite(tmp_path)
+    bot = TeamsGatewayBot(ConversationState(storage))
+    adapter = TestAdapter()
+
+    def turn():
+        return TurnContext(
+            adapter,
+            Activity(
+                type="message",
+                channel_id="msteams",
+                conversation=ConversationAccount(id="c1"),
+                from_property=ChannelAccount(id="u1"),
+                recipient=ChannelAccount(id="bot"),
+            ),
+        )
+
+    async def run():
+        first = turn()
+        await bot._last_query_accessor.set(first, {"query": "inicial"})
+        await bot._save_state(first)
+        a, b = turn(), turn()
+        for ctx, query in ((a, "a"), (b, "b")):  # ambos leen el mismo etag
+            await bot._last_query_accessor.set(ctx, {"query": query})
+        await bot._save_state(a)
+        await bot._save_state(b)  # etag viejo: se recarga y gana el último
+        data = await bot._last_query_accessor.get(turn(), None)
+        await storage.close()
+        return data
+
+    assert asyncio.run(run()) == {"query": "b"}
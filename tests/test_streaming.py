@@ -0,0 +1,91 @@
+import json
+import random
+
+from src.teams_gw.streaming import StreamingPayloadParser, read_spill
+
+ROWS = [
+    [i, f"cliente {i}", 'comillas "dobles", ] y }', "salto\nde línea\ttab \\ barra", "ñandú €", None, 1.5e3]
+    for i in range(12)
+]
+PAYLOAD = {"columns": ["id", "nombre", "a", "b", "c", "d", "e"], "sql": "SELECT 1", "rows": ROWS}
+
+
+def _parse(text, keep_rows, sizes, spill=True):
+    parser = StreamingPayloadParser(keep_rows, spill=spill)
+    pos = 0
+    for size in sizes:
+        if pos >= len(text):
+            break
+        parser.feed(text[pos: pos + size])
+        pos += size
+    if pos < len(text):
+        parser.feed(text[pos:])
+    return parser.close()
+
+
+def _check(payload, keep_rows=4):
+    assert payload["columns"] == PAYLOAD["columns"] and payload["sql"] == "SELECT 1"
+    assert payload["rows"] == ROWS[:keep_rows]
+    assert payload["rowcount"] == len(ROWS)
+    spill = payload["spill"]
+    assert spill["count"] == len(ROWS) - keep_rows
+    assert read_spill(spill, 0, spill["count"]) == ROWS[keep_rows:]
+    assert read_spill(spill, 2, 3) == ROWS[keep_rows + 2: keep_rows + 5]
+
+
+def test_indented_response_spills_readable_rows():
+    text = json.dumps(PAYLOAD, indent=2, ensure_ascii=False)
+    _check(_parse(text, 4, [len(text)]))
+
+
+def test_every_chunk_boundary_gives_the_same_result():
+    for text in (json.dumps(PAYLOAD), json.dumps(PAYLOAD, indent=4), json.dumps(PAYLOAD, ensure_ascii=False)):
+        _check(_parse(text, 4, [1] * len(text)))
+        rng = random.Random(len(text))
+        for _ in range(20):
+            _check(_parse(text, 4, [rng.randint(1, 40) for _ in range(len(text))]))
+
+
+def test_rowcount_from_n2sql_is_kept_and_missing_rowcount_is_counted():
+    text = json.dumps({"columns": ["n"], "rowcount": 1000, "rows": [[1], [2], [3]]})
+    payload = _parse(text, 2, [7] * len(text), spill=False)
+    assert payload["rowcount"] == 1000 and payload["rows"] == [[1], [2]] and "spill" not in payload
+
+    text = json.dumps({"rows": [[1], [2], [3]], "columns": ["n"]})
+    payload = _parse(text, 1, [5] * len(text), spill=False)
+    assert payload["rowcount"] == 3 and payload["columns"] == ["n"]
+
+
+def test_non_object_payload_is_parsed_whole():
+    assert _parse(" [1, 2]", 1, [2, 2, 2]) == [1, 2]
+
+
+def test_large_value_split_in_many_chunks_is_decoded_once(monkeypatch):
+    from src.teams_gw import streaming
+
+    calls = []
+    real = streaming._decoder
+
+    class CountingDecoder:
+        def raw_decode(self, s, idx=0):
+            calls.append(idx)
+            return real.raw_decode(s, idx)
+
+    monkeypatch.setattr(streaming, "_decoder", CountingDecoder())
+    big = ["x" * 50_000, 'con \\"escape\\" ' * 2000, [[i, "]"] for i in range(2000)]]
+    text = json.dumps({"columns": ["a", "b", "c"], "rows": [big, [1, 2, 3]]})
+    payload = _parse(text, 2, [64] * len(text))
+    assert payload["rows"] == [big, [1, 2, 3]]
+    assert len(calls) < 20
+
+
+def test_spill_pages_decompress_the_blob_once(monkeypatch):
+    from src.teams_gw import streaming
+
+    text = json.dumps(PAYLOAD)
+    spill = _parse(text, 4, [len(text)])["spill"]
+    streaming._spill_lines.cache_clear()
+    for start in range(0, spill["count"], 2):
+        read_spill(spill, start, 2)
+    info = streaming._spill_lines.cache_info()
+    assert info.misses == 1 and info.hits == spill["count"] // 2 - 1
@@ -0,0 +1,27 @@
+import asyncio
+
+from src.teams_gw.tracing import RingBufferExporter, Tracer, trace_id_for
+
+
+def test_spans_share_trace_and_slowest_first():
+    tracer = Tracer()
+    buffer = RingBufferExporter(max_traces=2)
+    tracer.add_exporter(buffer)
+
+    async def turn(activity_id, delay):
+        with tracer.trace("messages", activity_id):
+            with tracer.span("n2sql.ask"):
+                header = tracer.traceparent()
+                await asyncio.sleep(delay)
+        return header
+
+    async def scenario():
+        return await asyncio.gather(turn("a", 0.03), turn("b", 0.0), turn("c", 0.01))
+
+    headers = asyncio.run(scenario())
+    assert headers[0].startswith(f"00-{trace_id_for('a')}-")
+    traces = buffer.slowest()
+    # El buffer solo guarda 2 trazas; la más lenta sale primero.
+    assert [t["trace_id"] for t in traces] == [trace_id_for("a"), trace_id_for("c")]
+    assert [s["name"] for s in traces[0]["spans"]] == ["messages", "n2sql.ask"]
+    assert tracer.traceparent() is None
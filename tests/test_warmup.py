@@ -0,0 +1,49 @@
+import asyncio
+
+from src.teams_gw.warmup import Warmup
+
+
+def test_ready_only_after_all_steps_and_failures_are_recorded():
+    async def scenario():
+        warmup = Warmup(enabled=True, timeout_s=5)
+        seen = []
+
+        async def token():
+            await asyncio.sleep(0.01)
+            seen.append(warmup.ready)
+
+        def cards():
+            raise RuntimeError("catálogo roto")
+
+        warmup.step("token", token)
+        warmup.step("cards", cards)
+        assert warmup.ready is False
+        warmup.start()
+        await warmup._task
+        return warmup, seen
+
+    warmup, seen = asyncio.run(scenario())
+    assert seen == [False]
+    assert warmup.ready is True
+    assert warmup.state == "ready"
+    assert warmup.steps["token"]["status"] == "ok"
+    assert warmup.steps["cards"]["status"] == "failed"
+
+
+def test_timeout_marks_ready_and_cancels_slow_steps():
+    async def scenario():
+        warmup = Warmup(enabled=True, timeout_s=0.05)
+        warmup.step("n2sql", lambda: asyncio.sleep(10))
+        await warmup.run()
+        return warmup
+
+    warmup = asyncio.run(scenario())
+    assert warmup.ready is True
+    assert warmup.state == "timeout"
+    assert warmup.steps["n2sql"]["status"] == "cancelled"
+
+
+def test_disabled_is_ready_immediately():
+    warmup = Warmup(enabled=False, timeout_s=1)
+    assert warmup.ready is True
+    assert warmup.stats()["state"] == "disabled"